@@ -1,5 +1,6 @@
 import os
 import json
+import multiprocessing
 
 # Path to the config file (inside the config directory)
 CONFIG_FILE_PATH = os.path.join("config", "config.json")
@@ -22,6 +23,25 @@ DEFAULT_CONFIG = {
     "EPG_COLORS_FILE": os.path.join("config", "epg", "epg_colors.json"),
     # New: how often to automatically re-parse EPG (in minutes); 0 = disabled
     "REPARSE_EPG_INTERVAL": 1440,  # 1440 = 24 hours
+    # Quiet period (ms) before queued channel edits are published to EPG.xml in one rewrite
+    "EPG_REBUILD_DEBOUNCE_MS": 1500,
+    # Worker processes used to parse several EPG files at once; 0 = one per CPU, 1 = parse serially
+    "EPG_PARSE_WORKERS": 0,
+    # Largest single read from ffmpeg's output (KiB); rounded down to whole 188-byte TS packets
+    "STREAM_READ_KB": 64,
+    # Recent output kept per streaming channel and shared by its viewers (KiB)
+    "STREAM_BUFFER_KB": 8192,
+    # What to do with a viewer that falls a whole buffer behind: "skip" ahead to live, or "disconnect"
+    "STREAM_SLOW_CLIENT_POLICY": "skip",
+    # Seconds a stream keeps running after its last viewer leaves, so a quick re-tune reattaches; 0 = stop at once
+    "STREAM_LINGER_SECONDS": 10,
+    # Recent output (KiB) sent at once to a viewer joining a stream that is already running
+    "STREAM_BURST_KB": 1024,
+    # When all TUNER_COUNT tuners are busy, which stream a new channel may take a tuner from:
+    # "none", "lingering" (only streams nobody is watching) or "idlest" (lingering first, then the fewest viewers)
+    "TUNER_PREEMPT_POLICY": "lingering",
+    # Seconds a tune-in waits for a tuner to free up before getting a busy response; 0 = answer at once
+    "TUNER_QUEUE_SECONDS": 0,
     "USE_PREGENERATED_DATA": False,
     "FFMPEG_PROFILE": "CPU",
     "FFMPEG_CUSTOM_PROFILES": {},
@@ -49,7 +69,9 @@ for key in config.keys():
     env_value = os.environ.get(key)
     if env_value is not None:
         # For numeric values like PORT, TUNER_COUNT, and REPARSE_EPG_INTERVAL, store as int.
-        if key in ["PORT", "TUNER_COUNT", "REPARSE_EPG_INTERVAL"]:
+        if key in ["PORT", "TUNER_COUNT", "REPARSE_EPG_INTERVAL", "EPG_REBUILD_DEBOUNCE_MS", "EPG_PARSE_WORKERS",
+                   "STREAM_READ_KB", "STREAM_BUFFER_KB", "STREAM_LINGER_SECONDS", "STREAM_BURST_KB",
+                   "TUNER_QUEUE_SECONDS"]:
             try:
                 config[key] = int(env_value)
             except ValueError:
@@ -89,12 +111,21 @@ if scheme not in ("http", "https"):
     scheme = "http"
 config["URL_SCHEME"] = scheme
 
-# Write the final configuration back to the config file.
-try:
-    with open(CONFIG_FILE_PATH, "w") as f:
-        json.dump(config, f, indent=4)
-except Exception as e:
-    print(f"Error writing config file: {e}")
+# Write the final configuration back to the config file (via a temp file
+# renamed over it, so a reader never sees it half-written). Child processes
+# such as the spawned EPG parse workers import this module too, but must not
+# write: one that read the file before a settings save would put its stale
+# copy back over it. (Check the process name rather than parent_process():
+# a spawned child re-imports __main__, and with it this module, before the
+# latter is set.)
+if multiprocessing.current_process().name == "MainProcess":
+    try:
+        tmp_path = f"{CONFIG_FILE_PATH}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(config, f, indent=4)
+        os.replace(tmp_path, CONFIG_FILE_PATH)
+    except Exception as e:
+        print(f"Error writing config file: {e}")
 
 # Ensure necessary directories exist.
 os.makedirs(config["LOGOS_DIR"], exist_ok=True)
@@ -113,6 +144,15 @@ TUNER_COUNT = config["TUNER_COUNT"]
 DOMAIN_NAME = config["DOMAIN_NAME"]
 EPG_COLORS_FILE = config["EPG_COLORS_FILE"]
 REPARSE_EPG_INTERVAL = config["REPARSE_EPG_INTERVAL"]  # In minutes
+EPG_REBUILD_DEBOUNCE_MS = config["EPG_REBUILD_DEBOUNCE_MS"]
+EPG_PARSE_WORKERS = config["EPG_PARSE_WORKERS"]
+STREAM_READ_KB = config["STREAM_READ_KB"]
+STREAM_BUFFER_KB = config["STREAM_BUFFER_KB"]
+STREAM_SLOW_CLIENT_POLICY = config["STREAM_SLOW_CLIENT_POLICY"]
+STREAM_LINGER_SECONDS = config["STREAM_LINGER_SECONDS"]
+STREAM_BURST_KB = config["STREAM_BURST_KB"]
+TUNER_PREEMPT_POLICY = config["TUNER_PREEMPT_POLICY"]
+TUNER_QUEUE_SECONDS = config["TUNER_QUEUE_SECONDS"]
 URL_SCHEME = config["URL_SCHEME"]
 USE_PREGENERATED_DATA = config["USE_PREGENERATED_DATA"]
 FFMPEG_PROFILE = config["FFMPEG_PROFILE"]
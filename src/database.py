@@ -1,129 +1,557 @@
+import queue
 import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
 from fastapi import HTTPException
 from .config import DB_FILE
 
+# PRAGMAs applied for the duration of a bulk load (e.g. the raw EPG ingest).
+# They give up crash-durability of the in-flight load for speed, which is safe
+# because an interrupted load is simply redone from the source files.
+BULK_LOAD_PRAGMAS = {
+    "synchronous": "OFF",
+    "cache_size": -65536,  # negative = KiB, i.e. 64 MiB of page cache
+    "temp_store": "MEMORY",
+}
+
+# Secondary indexes on the EPG tables, as (table, CREATE statement) keyed by
+# index name. They back the channel-to-guide matching in build_combined_epg /
+# update_program_data_for_channel and the current-program lookups. The
+# epg_programs ones are dropped while build_combined_epg refills that table
+# and rebuilt after; the raw_epg_* ones stay in place during an ingest, whose
+# per-file loads delete a file's old rows through them.
+EPG_INDEXES = {
+    "idx_raw_epg_channels_display_name": (
+        "raw_epg_channels",
+        "CREATE INDEX IF NOT EXISTS idx_raw_epg_channels_display_name ON raw_epg_channels(display_name)",
+    ),
+    "idx_raw_epg_channels_raw_epg_file": (
+        "raw_epg_channels",
+        "CREATE INDEX IF NOT EXISTS idx_raw_epg_channels_raw_epg_file ON raw_epg_channels(raw_epg_file)",
+    ),
+    "idx_raw_epg_programs_raw_channel_id": (
+        "raw_epg_programs",
+        "CREATE INDEX IF NOT EXISTS idx_raw_epg_programs_raw_channel_id ON raw_epg_programs(raw_channel_id)",
+    ),
+    "idx_raw_epg_programs_raw_epg_file": (
+        "raw_epg_programs",
+        "CREATE INDEX IF NOT EXISTS idx_raw_epg_programs_raw_epg_file ON raw_epg_programs(raw_epg_file)",
+    ),
+    "idx_epg_programs_channel_start_ts": (
+        "epg_programs",
+        "CREATE INDEX IF NOT EXISTS idx_epg_programs_channel_start_ts ON epg_programs(channel_tvg_name, start_ts, stop_ts)",
+    ),
+}
+
+# Indexes from earlier versions that init_db drops.
+RETIRED_EPG_INDEXES = ["idx_epg_programs_channel_start_stop"]
+
+def _xmltv_epoch_sql(column):
+    """SQL expression turning a normalized "YYYYmmddHHMMSS +0000" column into epoch seconds."""
+    return (
+        f"CAST(strftime('%s', substr({column}, 1, 4) || '-' || substr({column}, 5, 2) || '-' || substr({column}, 7, 2)"
+        f" || ' ' || substr({column}, 9, 2) || ':' || substr({column}, 11, 2) || ':' || substr({column}, 13, 2)) AS INTEGER)"
+    )
+
+def _add_epoch_columns(c, table, columns):
+    """
+    Add the integer start_ts/stop_ts columns (epoch seconds, UTC) next to the
+    text start/stop columns of `table` and backfill them for existing rows.
+    """
+    if "start_ts" in columns and "stop_ts" in columns:
+        return
+    try:
+        for column in ("start_ts", "stop_ts"):
+            if column not in columns:
+                c.execute(f"ALTER TABLE {table} ADD COLUMN {column} INTEGER")
+        c.execute(f"UPDATE {table} SET start_ts = {_xmltv_epoch_sql('start')}, stop_ts = {_xmltv_epoch_sql('stop')}")
+        print(f"[INFO] Added start_ts/stop_ts to {table} ({c.rowcount} rows backfilled).")
+    except sqlite3.OperationalError as e:
+        print(f"[WARNING] Could not add start_ts/stop_ts columns to {table}: {e}")
+
+# ====================================================
+# Connection pool
+# ====================================================
+# Connections are opened once, configured with CONNECTION_PRAGMAS and reused,
+# so a request does not pay for connect() and PRAGMA setup every time. Use
+#
+#     with get_db() as conn:
+#         ...
+#
+# Whatever a block leaves uncommitted is rolled back when the connection goes
+# back to the pool. These connections are for reading; writes go through
+# run_write() (see "Single writer" below).
+DB_POOL_SIZE = 8
+# How long get_db() waits for a free connection before opening an extra,
+# unpooled one.
+DB_POOL_TIMEOUT = 5.0
+# Prepared statements kept per connection (sqlite3's default is 128).
+DB_CACHED_STATEMENTS = 256
+CONNECTION_PRAGMAS = {
+    "busy_timeout": 5000,        # ms to wait on a locked database before failing
+    "mmap_size": 268435456,      # 256 MiB of memory-mapped I/O
+    "synchronous": "NORMAL",     # durable enough with WAL, much cheaper commits
+}
+
+def _open_connection():
+    conn = sqlite3.connect(DB_FILE, check_same_thread=False, cached_statements=DB_CACHED_STATEMENTS)
+    for name, value in CONNECTION_PRAGMAS.items():
+        conn.execute(f"PRAGMA {name} = {value}").fetchall()
+    return conn
+
+class ConnectionPool:
+    """
+    A fixed-size pool of pre-configured connections. A thread that already
+    holds a connection gets an extra one instead of waiting, so nested
+    get_db() calls cannot deadlock the pool.
+    """
+    def __init__(self, size=DB_POOL_SIZE, timeout=DB_POOL_TIMEOUT):
+        self.size = size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._wal_checked = False
+        self._stats = {
+            "checkouts": 0,
+            "waits": 0,
+            "wait_ms_total": 0.0,
+            "wait_ms_max": 0.0,
+            "overflow": 0,
+        }
+
+    def _new_connection(self):
+        conn = _open_connection()
+        if not self._wal_checked:
+            # journal_mode is stored in the database file; set it once.
+            conn.execute("PRAGMA journal_mode = WAL").fetchall()
+            self._wal_checked = True
+        return conn
+
+    def acquire(self):
+        held = getattr(self._local, "held", 0)
+        started = time.perf_counter()
+        conn = None
+        pooled = True
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                create = self._created < self.size
+                if create:
+                    self._created += 1
+            if create:
+                try:
+                    conn = self._new_connection()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            elif held:
+                pooled = False
+            else:
+                try:
+                    conn = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    pooled = False
+        if conn is None:
+            conn = _open_connection()
+        waited_ms = (time.perf_counter() - started) * 1000
+        with self._lock:
+            self._stats["checkouts"] += 1
+            if not pooled:
+                self._stats["overflow"] += 1
+            if waited_ms >= 1:
+                self._stats["waits"] += 1
+            self._stats["wait_ms_total"] += waited_ms
+            self._stats["wait_ms_max"] = max(self._stats["wait_ms_max"], waited_ms)
+        self._local.held = held + 1
+        return conn, pooled
+
+    def release(self, conn, pooled):
+        self._local.held = max(0, getattr(self._local, "held", 1) - 1)
+        healthy = True
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            healthy = False
+        if pooled and healthy:
+            self._idle.put(conn)
+            return
+        conn.close()
+        if pooled:
+            with self._lock:
+                self._created -= 1
+
+    def close_all(self):
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._created -= 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = self.size
+            stats["open"] = self._created
+        stats["idle"] = self._idle.qsize()
+        checkouts = stats["checkouts"] or 1
+        stats["wait_ms_avg"] = round(stats["wait_ms_total"] / checkouts, 3)
+        stats["wait_ms_total"] = round(stats["wait_ms_total"], 3)
+        stats["wait_ms_max"] = round(stats["wait_ms_max"], 3)
+        return stats
+
+_pool = ConnectionPool()
+
+@contextmanager
+def get_db(snapshot: bool = False):
+    """
+    Check a configured connection out of the pool for the duration of the
+    block. With snapshot=True the block runs in a read transaction, so all
+    its queries see the database as of the first one, even while the writer
+    commits.
+    """
+    conn, pooled = _pool.acquire()
+    try:
+        if snapshot:
+            conn.execute("BEGIN")
+        yield conn
+    finally:
+        _pool.release(conn, pooled)
+
+def get_db_pool_stats() -> dict:
+    return _pool.stats()
+
+# ====================================================
+# Single writer
+# ====================================================
+# All mutations run one at a time on a dedicated thread that owns the only
+# write connection, fed through a queue:
+#
+#     def rename(conn):
+#         conn.execute("UPDATE channels SET name = ? WHERE id = ?", (name, channel_id))
+#     run_write(rename)
+#
+# Writers therefore never compete for SQLite's write lock ("database is
+# locked"), and as the database is in WAL mode, readers on get_db()
+# connections carry on from their snapshot while a write job runs. A job is
+# committed when it returns and rolled back if it raises; the exception is
+# re-raised in the caller. run_write() called from inside a job runs inline,
+# as part of that job's transaction. Long work (parsing, downloads) belongs
+# outside the job, so that one slow import cannot hold up every other write.
+class DbWriter:
+    def __init__(self):
+        self._jobs = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._conn = None
+        self._stats = {
+            "jobs": 0,
+            "failed": 0,
+            "wait_ms_total": 0.0,
+            "wait_ms_max": 0.0,
+            "run_ms_total": 0.0,
+            "run_ms_max": 0.0,
+        }
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+                self._thread.start()
+
+    def on_writer_thread(self) -> bool:
+        return threading.current_thread() is self._thread
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        """Queue fn(conn, *args, **kwargs); returns a Future for its result."""
+        future = Future()
+        self._ensure_started()
+        self._jobs.put((future, time.perf_counter(), fn, args, kwargs))
+        return future
+
+    def run(self, fn, *args, **kwargs):
+        """Run fn(conn, *args, **kwargs) as a write job and return its result."""
+        if self.on_writer_thread():
+            return fn(self._conn, *args, **kwargs)
+        return self.submit(fn, *args, **kwargs).result()
+
+    def stop(self, timeout=None) -> bool:
+        """Finish the queued jobs and stop the thread; False on timeout."""
+        with self._lock:
+            thread = self._thread
+        if thread is None or not thread.is_alive():
+            return True
+        self._jobs.put(None)
+        thread.join(timeout)
+        return not thread.is_alive()
+
+    def _connection(self):
+        if self._conn is None:
+            self._conn = _open_connection()
+            self._conn.execute("PRAGMA journal_mode = WAL").fetchall()
+        return self._conn
+
+    def _run(self):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                break
+            future, queued_at, fn, args, kwargs = job
+            if not future.set_running_or_notify_cancel():
+                continue
+            started = time.perf_counter()
+            try:
+                conn = self._connection()
+                result = fn(conn, *args, **kwargs)
+                if conn.in_transaction:
+                    conn.commit()
+            except BaseException as e:
+                self._rollback()
+                future.set_exception(e)
+                failed = True
+            else:
+                future.set_result(result)
+                failed = False
+            self._record(started - queued_at, time.perf_counter() - started, failed)
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _rollback(self):
+        if self._conn is None:
+            return
+        try:
+            if self._conn.in_transaction:
+                self._conn.rollback()
+        except sqlite3.Error:
+            # Start over with a fresh connection for the next job.
+            self._conn.close()
+            self._conn = None
+
+    def _record(self, waited, ran, failed):
+        waited_ms, ran_ms = waited * 1000, ran * 1000
+        with self._lock:
+            self._stats["jobs"] += 1
+            if failed:
+                self._stats["failed"] += 1
+            self._stats["wait_ms_total"] += waited_ms
+            self._stats["wait_ms_max"] = max(self._stats["wait_ms_max"], waited_ms)
+            self._stats["run_ms_total"] += ran_ms
+            self._stats["run_ms_max"] = max(self._stats["run_ms_max"], ran_ms)
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["running"] = self._thread is not None and self._thread.is_alive()
+        stats["queued"] = self._jobs.qsize()
+        jobs = stats["jobs"] or 1
+        for key in ("wait_ms", "run_ms"):
+            stats[f"{key}_avg"] = round(stats[f"{key}_total"] / jobs, 3)
+            stats[f"{key}_total"] = round(stats[f"{key}_total"], 3)
+            stats[f"{key}_max"] = round(stats[f"{key}_max"], 3)
+        return stats
+
+_writer = DbWriter()
+
+def run_write(fn, *args, **kwargs):
+    """Run fn(conn, *args, **kwargs) on the writer thread; see DbWriter."""
+    return _writer.run(fn, *args, **kwargs)
+
+def stop_db_writer(timeout=None) -> bool:
+    return _writer.stop(timeout)
+
+def get_db_writer_stats() -> dict:
+    return _writer.stats()
+
 def init_db():
     """
     Initialize or upgrade the database schema:
       - Creates/updates the 'channels' table (with channel_number and removed_reason).
       - Creates/updates the 'epg_programs' and 'epg_channels' tables.
+      - Adds integer start_ts/stop_ts (epoch) columns to both program tables,
+        backfilled from the text start/stop.
       - Creates/updates the 'raw_epg_channels' and 'raw_epg_programs' tables,
         including the new 'raw_epg_file' column in both raw_epg_channels and raw_epg_programs.
+      - Creates the 'raw_epg_manifest' table (one row per ingested EPG file).
+      - Creates the EPG lookup indexes (EPG_INDEXES).
     """
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
+    def create_schema(conn):
+        c = conn.cursor()
 
-    # Create channels table if it does not exist.
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS channels (
-            id INTEGER PRIMARY KEY,
-            name TEXT,
-            url TEXT,
-            tvg_name TEXT,
-            original_tvg_name TEXT,
-            logo_url TEXT,
-            group_title TEXT,
-            active INTEGER DEFAULT 0
-        )
-    ''')
-
-    # Check if 'channel_number' column exists.
-    c.execute("PRAGMA table_info(channels)")
-    columns = [col_info[1] for col_info in c.fetchall()]
-    if "channel_number" not in columns:
-        try:
-            c.execute("ALTER TABLE channels ADD COLUMN channel_number INTEGER")
-        except sqlite3.OperationalError as e:
-            print("Error adding channel_number column:", e)
+        # Create channels table if it does not exist.
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS channels (
+                id INTEGER PRIMARY KEY,
+                name TEXT,
+                url TEXT,
+                tvg_name TEXT,
+                original_tvg_name TEXT,
+                logo_url TEXT,
+                group_title TEXT,
+                active INTEGER DEFAULT 0
+            )
+        ''')
 
-    # Check if 'removed_reason' column exists.
-    if "removed_reason" not in columns:
-        try:
-            c.execute("ALTER TABLE channels ADD COLUMN removed_reason TEXT")
-        except sqlite3.OperationalError as e:
-            print("Error adding removed_reason column:", e)
+        # Check if 'channel_number' column exists.
+        c.execute("PRAGMA table_info(channels)")
+        columns = [col_info[1] for col_info in c.fetchall()]
+        if "channel_number" not in columns:
+            try:
+                c.execute("ALTER TABLE channels ADD COLUMN channel_number INTEGER")
+            except sqlite3.OperationalError as e:
+                print("Error adding channel_number column:", e)
 
-    # Create a unique index on channel_number (if needed).
-    try:
-        c.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_channel_number ON channels(channel_number)")
-    except sqlite3.OperationalError as e:
-        print("Error creating unique index for channel_number:", e)
+        # Check if 'removed_reason' column exists.
+        if "removed_reason" not in columns:
+            try:
+                c.execute("ALTER TABLE channels ADD COLUMN removed_reason TEXT")
+            except sqlite3.OperationalError as e:
+                print("Error adding removed_reason column:", e)
 
-    # For existing records where channel_number is NULL, set it equal to id.
-    try:
-        c.execute("UPDATE channels SET channel_number = id WHERE channel_number IS NULL")
-    except sqlite3.OperationalError as e:
-        print("Error updating channel_number:", e)
-
-    # Create epg_programs table.
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS epg_programs (
-            id INTEGER PRIMARY KEY,
-            channel_tvg_name TEXT,
-            start DATETIME,
-            stop DATETIME,
-            title TEXT,
-            description TEXT
-        )
-    ''')
-
-    # Create epg_channels table.
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS epg_channels (
-            name TEXT PRIMARY KEY
-        )
-    ''')
-
-    # Create raw_epg_channels table with raw_epg_file column and a UNIQUE constraint.
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS raw_epg_channels (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            raw_id TEXT,
-            display_name TEXT,
-            raw_epg_file TEXT,
-            UNIQUE(raw_id, raw_epg_file)
-        )
-    ''')
-
-    # Check if raw_epg_file column exists in raw_epg_channels, and add if missing.
-    c.execute("PRAGMA table_info(raw_epg_channels)")
-    columns = [col_info[1] for col_info in c.fetchall()]
-    if "raw_epg_file" not in columns:
+        # Create a unique index on channel_number (if needed).
         try:
-            c.execute("ALTER TABLE raw_epg_channels ADD COLUMN raw_epg_file TEXT")
+            c.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_channel_number ON channels(channel_number)")
         except sqlite3.OperationalError as e:
-            print(f"[WARNING] Could not add raw_epg_file column to raw_epg_channels: {e}")
-
-    # Create raw_epg_programs table with the new raw_epg_file column.
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS raw_epg_programs (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            raw_channel_id TEXT,
-            start TEXT,
-            stop TEXT,
-            title TEXT,
-            description TEXT,
-            icon_url TEXT,
-            raw_epg_file TEXT
-        )
-    ''')
-
-    # Check if icon_url and raw_epg_file columns exist in raw_epg_programs, and add if missing.
-    c.execute("PRAGMA table_info(raw_epg_programs)")
-    columns = [col_info[1] for col_info in c.fetchall()]
-    if "icon_url" not in columns:
+            print("Error creating unique index for channel_number:", e)
+
+        # For existing records where channel_number is NULL, set it equal to id.
         try:
-            c.execute("ALTER TABLE raw_epg_programs ADD COLUMN icon_url TEXT")
+            c.execute("UPDATE channels SET channel_number = id WHERE channel_number IS NULL")
         except sqlite3.OperationalError as e:
-            print(f"[WARNING] Could not add icon_url column: {e}")
-    if "raw_epg_file" not in columns:
+            print("Error updating channel_number:", e)
+
+        # Create epg_programs table.
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS epg_programs (
+                id INTEGER PRIMARY KEY,
+                channel_tvg_name TEXT,
+                start DATETIME,
+                stop DATETIME,
+                start_ts INTEGER,
+                stop_ts INTEGER,
+                title TEXT,
+                description TEXT,
+                icon_url TEXT
+            )
+        ''')
+
+        # Check if icon_url column exists in epg_programs, and add if missing.
+        c.execute("PRAGMA table_info(epg_programs)")
+        columns = [col_info[1] for col_info in c.fetchall()]
+        if "icon_url" not in columns:
+            try:
+                c.execute("ALTER TABLE epg_programs ADD COLUMN icon_url TEXT")
+            except sqlite3.OperationalError as e:
+                print(f"[WARNING] Could not add icon_url column to epg_programs: {e}")
+        _add_epoch_columns(c, "epg_programs", columns)
+
+        # Create epg_channels table.
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS epg_channels (
+                name TEXT PRIMARY KEY
+            )
+        ''')
+
+        # Create raw_epg_channels table with raw_epg_file column and a UNIQUE constraint.
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS raw_epg_channels (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                raw_id TEXT,
+                display_name TEXT,
+                raw_epg_file TEXT,
+                UNIQUE(raw_id, raw_epg_file)
+            )
+        ''')
+
+        # Check if raw_epg_file column exists in raw_epg_channels, and add if missing.
+        c.execute("PRAGMA table_info(raw_epg_channels)")
+        columns = [col_info[1] for col_info in c.fetchall()]
+        if "raw_epg_file" not in columns:
+            try:
+                c.execute("ALTER TABLE raw_epg_channels ADD COLUMN raw_epg_file TEXT")
+            except sqlite3.OperationalError as e:
+                print(f"[WARNING] Could not add raw_epg_file column to raw_epg_channels: {e}")
+
+        # Create raw_epg_programs table with the new raw_epg_file column.
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS raw_epg_programs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                raw_channel_id TEXT,
+                start TEXT,
+                stop TEXT,
+                start_ts INTEGER,
+                stop_ts INTEGER,
+                title TEXT,
+                description TEXT,
+                icon_url TEXT,
+                raw_epg_file TEXT
+            )
+        ''')
+
+        # Check if icon_url and raw_epg_file columns exist in raw_epg_programs, and add if missing.
+        c.execute("PRAGMA table_info(raw_epg_programs)")
+        columns = [col_info[1] for col_info in c.fetchall()]
+        if "icon_url" not in columns:
+            try:
+                c.execute("ALTER TABLE raw_epg_programs ADD COLUMN icon_url TEXT")
+            except sqlite3.OperationalError as e:
+                print(f"[WARNING] Could not add icon_url column: {e}")
+        if "raw_epg_file" not in columns:
+            try:
+                c.execute("ALTER TABLE raw_epg_programs ADD COLUMN raw_epg_file TEXT")
+            except sqlite3.OperationalError as e:
+                print(f"[WARNING] Could not add raw_epg_file column: {e}")
+        _add_epoch_columns(c, "raw_epg_programs", columns)
+
+        # Create raw_epg_manifest: what each file in EPG_DIR looked like when its
+        # raw_epg_* rows were last loaded, so unchanged files can be skipped.
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS raw_epg_manifest (
+                raw_epg_file TEXT PRIMARY KEY,
+                size INTEGER,
+                mtime_ns INTEGER,
+                sha256 TEXT,
+                channels INTEGER,
+                programmes INTEGER,
+                parsed_at TEXT
+            )
+        ''')
+
+        # Create the EPG lookup indexes.
         try:
-            c.execute("ALTER TABLE raw_epg_programs ADD COLUMN raw_epg_file TEXT")
+            for name in RETIRED_EPG_INDEXES:
+                c.execute(f"DROP INDEX IF EXISTS {name}")
+            create_epg_indexes(conn)
         except sqlite3.OperationalError as e:
-            print(f"[WARNING] Could not add raw_epg_file column: {e}")
+            print(f"[WARNING] Could not create EPG indexes: {e}")
+
+    run_write(create_schema)
+
+def _epg_indexes_for(tables):
+    return [
+        (name, create_sql)
+        for name, (table, create_sql) in EPG_INDEXES.items()
+        if not tables or table in tables
+    ]
 
-    conn.commit()
-    conn.close()
+def create_epg_indexes(conn, *tables):
+    """Create the EPG_INDEXES (optionally only those on `tables`) if missing."""
+    for _, create_sql in _epg_indexes_for(tables):
+        conn.execute(create_sql)
+
+def drop_epg_indexes(conn, *tables):
+    """Drop the EPG_INDEXES (optionally only those on `tables`)."""
+    for name, _ in _epg_indexes_for(tables):
+        conn.execute(f"DROP INDEX IF EXISTS {name}")
 
 def swap_channel_numbers(current_number: int, new_number: int) -> bool:
     """
@@ -131,32 +559,56 @@ def swap_channel_numbers(current_number: int, new_number: int) -> bool:
     Otherwise, simply update the record.
     Returns True if a swap occurred.
     """
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
+    def swap_numbers(conn):
+        c = conn.cursor()
 
-    # Confirm channel with current_number exists.
-    c.execute("SELECT id FROM channels WHERE channel_number = ?", (current_number,))
-    if not c.fetchone():
-        conn.close()
-        raise HTTPException(status_code=404, detail="Channel with current number not found.")
-
-    # Check if new_number is already in use.
-    c.execute("SELECT id FROM channels WHERE channel_number = ?", (new_number,))
-    row_new = c.fetchone()
-    swap = (row_new is not None)
-
-    if swap:
-        # Use a temporary number to perform the swap.
-        temp_number = -1
-        c.execute("SELECT id FROM channels WHERE channel_number = ?", (temp_number,))
-        if c.fetchone():
-            temp_number = -abs(current_number + new_number)
-        c.execute("UPDATE channels SET channel_number = ? WHERE channel_number = ?", (temp_number, current_number))
-        c.execute("UPDATE channels SET channel_number = ? WHERE channel_number = ?", (current_number, new_number))
-        c.execute("UPDATE channels SET channel_number = ? WHERE channel_number = ?", (new_number, temp_number))
-    else:
-        c.execute("UPDATE channels SET channel_number = ? WHERE channel_number = ?", (new_number, current_number))
-
-    conn.commit()
-    conn.close()
-    return swap
+        # Confirm channel with current_number exists.
+        c.execute("SELECT id FROM channels WHERE channel_number = ?", (current_number,))
+        if not c.fetchone():
+            raise HTTPException(status_code=404, detail="Channel with current number not found.")
+
+        # Check if new_number is already in use.
+        c.execute("SELECT id FROM channels WHERE channel_number = ?", (new_number,))
+        row_new = c.fetchone()
+        swap = (row_new is not None)
+
+        if swap:
+            # Use a temporary number to perform the swap.
+            temp_number = -1
+            c.execute("SELECT id FROM channels WHERE channel_number = ?", (temp_number,))
+            if c.fetchone():
+                temp_number = -abs(current_number + new_number)
+            c.execute("UPDATE channels SET channel_number = ? WHERE channel_number = ?", (temp_number, current_number))
+            c.execute("UPDATE channels SET channel_number = ? WHERE channel_number = ?", (current_number, new_number))
+            c.execute("UPDATE channels SET channel_number = ? WHERE channel_number = ?", (new_number, temp_number))
+        else:
+            c.execute("UPDATE channels SET channel_number = ? WHERE channel_number = ?", (new_number, current_number))
+        return swap
+
+    return run_write(swap_numbers)
+
+@contextmanager
+def bulk_load_pragmas(conn):
+    """
+    Apply BULK_LOAD_PRAGMAS (and an in-memory rollback journal, unless the
+    database is in WAL mode) to `conn` for the duration of the block, then
+    restore the previous values. Must be entered outside of a transaction;
+    anything left uncommitted when the block exits is rolled back.
+    """
+    c = conn.cursor()
+    saved = {}
+    for name, value in BULK_LOAD_PRAGMAS.items():
+        saved[name] = c.execute(f"PRAGMA {name}").fetchone()[0]
+        c.execute(f"PRAGMA {name} = {value}").fetchall()
+    saved_journal_mode = c.execute("PRAGMA journal_mode").fetchone()[0]
+    if saved_journal_mode.lower() != "wal":
+        c.execute("PRAGMA journal_mode = MEMORY").fetchall()
+    try:
+        yield conn
+    finally:
+        if conn.in_transaction:
+            conn.rollback()
+        if saved_journal_mode.lower() != "wal":
+            c.execute(f"PRAGMA journal_mode = {saved_journal_mode}").fetchall()
+        for name, value in saved.items():
+            c.execute(f"PRAGMA {name} = {value}").fetchall()
@@ -1,13 +1,26 @@
 import os
 import gzip
+import functools
+import hashlib
 import html
-import sqlite3
+import multiprocessing
+import pickle
 import xml.etree.ElementTree as ET
 from datetime import datetime, timedelta
 import re
 import json
 import random
-from .config import EPG_DIR, MODIFIED_EPG_DIR, DB_FILE, EPG_COLORS_FILE, CONFIG_FILE_PATH, HOST_IP, PORT
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from .now_playing import invalidate_now_playing
+from .jobs import report_progress
+from .database import get_db, run_write, bulk_load_pragmas, create_epg_indexes, drop_epg_indexes
+from .config import (
+    EPG_DIR, MODIFIED_EPG_DIR, EPG_COLORS_FILE, CONFIG_FILE_PATH, HOST_IP, PORT,
+    EPG_REBUILD_DEBOUNCE_MS, EPG_PARSE_WORKERS,
+)
 
 
 def _load_config_from_disk():
@@ -32,7 +45,9 @@ def get_base_url():
 # ====================================================
 # 1) Helper to parse/normalize XMLTV date/time
 # ====================================================
-def parse_xmltv_datetime(dt_str):
+def _parse_xmltv_datetime_reference(dt_str):
+    # The original, general parser: the fallback for anything the fast path
+    # below does not handle, and the definition it has to match exactly.
     match = re.match(r'^(\d{14})(?:\s*([+-]\d{4}))?$', dt_str.replace('-', ' -').replace('+', ' +'))
     if not match:
         return "19700101000000 +0000"
@@ -46,15 +61,383 @@ def parse_xmltv_datetime(dt_str):
         hours = int(offset_str[1:3])
         minutes = int(offset_str[3:5])
         offset_delta = sign * (hours * 60 + minutes)
-        utc_dt = naive_dt - timedelta(minutes=offset_delta)
+        try:
+            utc_dt = naive_dt - timedelta(minutes=offset_delta)
+        except OverflowError:
+            # An offset that moves year 1 or 9999 out of range.
+            return "19700101000000 +0000"
     else:
         utc_dt = naive_dt
     return utc_dt.strftime("%Y%m%d%H%M%S") + " +0000"
 
+_EPOCH_ORDINAL = datetime(1970, 1, 1).toordinal()
+_FALLBACK_XMLTV_TIME = ("19700101000000 +0000", 0)
+
+def _xmltv_offset_seconds(rest):
+    """Seconds east of UTC for the text after the 14 digits, or None if unusual."""
+    if not rest:
+        return 0
+    rest = rest.lstrip(" ")
+    if len(rest) != 5 or rest[0] not in "+-" or not (rest[1:].isascii() and rest[1:].isdigit()):
+        return None
+    seconds = int(rest[1:3]) * 3600 + int(rest[3:5]) * 60
+    return seconds if rest[0] == "+" else -seconds
+
+def _normalize_xmltv_datetime_slow(dt_str):
+    text = _parse_xmltv_datetime_reference(dt_str)
+    try:
+        utc_dt = datetime.strptime(text[:-6], "%Y%m%d%H%M%S")
+    except ValueError:
+        return text, 0
+    return text, (utc_dt.toordinal() - _EPOCH_ORDINAL) * 86400 + utc_dt.hour * 3600 + utc_dt.minute * 60 + utc_dt.second
+
+@functools.lru_cache(maxsize=65536)
+def normalize_xmltv_datetime(dt_str):
+    """
+    Return (UTC text "YYYYmmddHHMMSS +0000", epoch seconds) for an XMLTV
+    timestamp; invalid input gives ("19700101000000 +0000", 0). The usual
+    "YYYYmmddHHMMSS[ +HHMM]" layout is parsed by slicing; anything else goes
+    through _parse_xmltv_datetime_reference. Memoized, as programme
+    boundaries repeat heavily across channels.
+    """
+    main = dt_str[:14]
+    offset = _xmltv_offset_seconds(dt_str[14:]) if len(main) == 14 and main.isascii() and main.isdigit() else None
+    # Years near the ends of the range are left to the reference parser,
+    # whose strftime output there is platform-dependent.
+    if offset is None or not "1001" <= main[:4] <= "9998":
+        return _normalize_xmltv_datetime_slow(dt_str)
+    try:
+        local_dt = datetime(int(main[0:4]), int(main[4:6]), int(main[6:8]),
+                            int(main[8:10]), int(main[10:12]), int(main[12:14]))
+    except ValueError:
+        return _FALLBACK_XMLTV_TIME
+    epoch = (local_dt.toordinal() - _EPOCH_ORDINAL) * 86400 + int(main[8:10]) * 3600 + int(main[10:12]) * 60 + int(main[12:14]) - offset
+    if not offset:
+        return main + " +0000", epoch
+    utc_dt = local_dt - timedelta(seconds=offset)
+    return (
+        f"{utc_dt.year:04d}{utc_dt.month:02d}{utc_dt.day:02d}"
+        f"{utc_dt.hour:02d}{utc_dt.minute:02d}{utc_dt.second:02d} +0000"
+    ), epoch
+
+def parse_xmltv_datetime(dt_str):
+    return normalize_xmltv_datetime(dt_str)[0]
+
 # ====================================================
 # 2) Parse raw EPG files into 'raw_epg_*' tables
 # ====================================================
-def parse_raw_epg_files():
+def _iter_epg_elements(epg_file):
+    """
+    Stream the top-level <channel> and <programme> elements of an XMLTV file
+    (plain or gzip-compressed) using iterparse. Each element is fully built
+    when yielded and is cleared from the tree as soon as the caller moves on,
+    so memory stays flat no matter how large the guide is.
+    """
+    with open(epg_file, "rb") as f:
+        magic = f.read(2)
+        f.seek(0)
+        source = gzip.open(f) if magic == b'\x1f\x8b' else f
+        try:
+            root = None
+            depth = 0
+            for event, el in ET.iterparse(source, events=("start", "end")):
+                if event == "start":
+                    if root is None:
+                        root = el
+                    depth += 1
+                    continue
+                depth -= 1
+                # Only direct children of <tv> are of interest; nested elements
+                # (title, desc, icon, ...) are read through their parent.
+                if depth == 1:
+                    if el.tag in ("channel", "programme"):
+                        yield el
+                    # Drop the finished element and release it from <tv>.
+                    el.clear()
+                    root.clear()
+        finally:
+            if source is not f:
+                source.close()
+
+# Number of parsed rows buffered before they are flushed with executemany.
+EPG_INSERT_BATCH_SIZE = 5000
+
+def _iter_epg_file_rows(epg_file):
+    """
+    Yield ("channel", row) and ("programme", row) tuples for one EPG file,
+    shaped for the raw_epg_channels / raw_epg_programs INSERT statements.
+    """
+    epg_basename = os.path.basename(epg_file)
+    for el in _iter_epg_elements(epg_file):
+        if el.tag == "channel":
+            raw_id = html.unescape(el.get("id", "").strip())
+            # Create a composite key: raw_id + "::" + (filename)
+            composite_raw_id = f"{raw_id}::{epg_basename}"
+            display_names = el.findall("display-name")
+            if len(display_names) >= 2:
+                abbreviation = html.unescape(display_names[0].text.strip()) if display_names[0].text else ""
+                full_name = html.unescape(display_names[1].text.strip()) if display_names[1].text else ""
+                disp_name = f"{full_name} ({abbreviation})" if full_name and abbreviation else full_name or abbreviation
+            elif len(display_names) == 1:
+                disp_name = html.unescape(display_names[0].text.strip())
+            else:
+                disp_name = ""
+            yield "channel", (composite_raw_id, disp_name, epg_basename)
+        else:
+            raw_prog_channel = html.unescape(el.get("channel", "").strip())
+            # Create the composite key for programmes too.
+            composite_prog_channel = f"{raw_prog_channel}::{epg_basename}"
+            raw_start_time = el.get("start", "").strip()
+            raw_stop_time = el.get("stop", "").strip()
+            start_time, start_ts = normalize_xmltv_datetime(raw_start_time)
+            stop_time, stop_ts = normalize_xmltv_datetime(raw_stop_time)
+            title_el = el.find("title")
+            title_text = title_el.text.strip() if (title_el is not None and title_el.text) else ""
+            desc_el = el.find("desc")
+            desc_text = desc_el.text.strip() if (desc_el is not None and desc_el.text) else ""
+            icon_el = el.find("icon")
+            icon_src = icon_el.get("src", "").strip() if icon_el is not None else ""
+            yield "programme", (composite_prog_channel, start_time, stop_time, start_ts, stop_ts,
+                                title_text, desc_text, icon_src, epg_basename)
+
+class _RawEpgBulkWriter:
+    """
+    Buffers raw_epg_* rows and writes them in fixed-size executemany batches,
+    instead of paying one execute() round-trip per row.
+    """
+    def __init__(self, cursor, batch_size=EPG_INSERT_BATCH_SIZE):
+        self.c = cursor
+        self.batch_size = batch_size
+        self.channel_rows = []
+        self.program_rows = []
+
+    def add(self, kind, row):
+        if kind == "channel":
+            self.channel_rows.append(row)
+            if len(self.channel_rows) >= self.batch_size:
+                self._flush_channels()
+        else:
+            self.program_rows.append(row)
+            if len(self.program_rows) >= self.batch_size:
+                self._flush_programs()
+
+    def flush(self):
+        self._flush_channels()
+        self._flush_programs()
+
+    def discard(self):
+        self.channel_rows.clear()
+        self.program_rows.clear()
+
+    def _flush_channels(self):
+        if self.channel_rows:
+            # Use INSERT OR IGNORE to avoid duplicate (composite_raw_id, file) entries.
+            self.c.executemany(
+                "INSERT OR IGNORE INTO raw_epg_channels (raw_id, display_name, raw_epg_file) VALUES (?, ?, ?)",
+                self.channel_rows
+            )
+            self.channel_rows.clear()
+
+    def _flush_programs(self):
+        if self.program_rows:
+            self.c.executemany("""
+                INSERT INTO raw_epg_programs
+                    (raw_channel_id, start, stop, start_ts, stop_ts, title, description, icon_url, raw_epg_file)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, self.program_rows)
+            self.program_rows.clear()
+
+# ----------------------------------------------------
+# Parallel parsing
+# ----------------------------------------------------
+# Each file is parsed into a spool, a temp file of pickled row batches, which a
+# write job then loads into the DB; the writer thread only ever sees finished
+# spools, so parsing never holds up other writes. With several files, they are
+# parsed in worker processes and each spool is loaded as soon as it is done.
+def _epg_parse_worker_count(file_count):
+    workers = EPG_PARSE_WORKERS if EPG_PARSE_WORKERS > 0 else (os.cpu_count() or 1)
+    return max(1, min(workers, file_count))
+
+def _spool_epg_file_rows(epg_file):
+    """Parse `epg_file` into a spool file; returns its path."""
+    fd, spool_path = tempfile.mkstemp(prefix=".epg-parse-", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            batch = []
+            for item in _iter_epg_file_rows(epg_file):
+                batch.append(item)
+                if len(batch) >= EPG_INSERT_BATCH_SIZE:
+                    pickle.dump(batch, f, protocol=pickle.HIGHEST_PROTOCOL)
+                    batch = []
+            if batch:
+                pickle.dump(batch, f, protocol=pickle.HIGHEST_PROTOCOL)
+    except BaseException:
+        os.unlink(spool_path)
+        raise
+    return spool_path
+
+def _iter_spooled_rows(spool_path):
+    try:
+        with open(spool_path, "rb") as f:
+            while True:
+                try:
+                    batch = pickle.load(f)
+                except EOFError:
+                    break
+                yield from batch
+    finally:
+        os.unlink(spool_path)
+
+def _iter_parsed_epg_files(to_parse):
+    """
+    Yield (entry, spool) for each (path, ...) entry of `to_parse`, where
+    spool() returns the path of the file's spool or raises its parse error.
+    Serial (spool() parses in the calling thread) for a single file or
+    EPG_PARSE_WORKERS=1; otherwise files are parsed in a process pool and
+    yielded in completion order.
+    """
+    workers = _epg_parse_worker_count(len(to_parse))
+    pool = None
+    if workers > 1:
+        try:
+            # Spawned, not forked: the server process has running threads
+            # (the DB writer, the pool's connections, asyncio) that a forked
+            # child would inherit in whatever state they were in.
+            pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        except (OSError, NotImplementedError) as e:
+            print(f"[WARN] Could not start EPG parse workers ({e}); parsing serially.")
+    if pool is None:
+        for entry in to_parse:
+            yield entry, functools.partial(_spool_epg_file_rows, entry[0])
+        return
+
+    print(f"[INFO] Parsing {len(to_parse)} EPG files with {workers} worker processes.")
+    futures = {}
+    consumed = set()
+    try:
+        futures = {pool.submit(_spool_epg_file_rows, entry[0]): entry for entry in to_parse}
+        for future in as_completed(futures):
+            consumed.add(future)
+            yield futures[future], future.result
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+        # Spools of files the caller never got to (e.g. it failed early).
+        for future in futures:
+            if future in consumed or future.cancelled() or future.exception() is not None:
+                continue
+            try:
+                os.unlink(future.result())
+            except OSError:
+                pass
+
+def _epg_file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _plan_raw_epg_parse(c, epg_files, force):
+    """
+    Compare EPG_DIR against raw_epg_manifest. Returns (to_parse, unchanged,
+    touched, removed, full): to_parse is a list of (path, size, mtime_ns,
+    sha256). Files whose size and mtime match the manifest are not even
+    hashed; a touched but identical file is listed in touched as (size,
+    mtime_ns, name), for its manifest stats to be refreshed. removed lists
+    the files that have raw rows but are no longer in EPG_DIR.
+    """
+    c.execute("SELECT raw_epg_file, size, mtime_ns, sha256 FROM raw_epg_manifest")
+    manifest = {row[0]: row[1:] for row in c.fetchall()}
+    # Without a manifest the raw tables may hold rows of unknown origin
+    # (e.g. from before the manifest existed), so every file is re-parsed and
+    # any file name found in the raw tables counts as known.
+    full = force or not manifest
+    to_parse, unchanged, touched = [], [], []
+    for path in epg_files:
+        name = os.path.basename(path)
+        st = os.stat(path)
+        known = None if full else manifest.get(name)
+        if known and known[0] == st.st_size and known[1] == st.st_mtime_ns:
+            unchanged.append(name)
+            continue
+        sha256 = _epg_file_sha256(path)
+        if known and known[2] == sha256:
+            touched.append((st.st_size, st.st_mtime_ns, name))
+            unchanged.append(name)
+            continue
+        to_parse.append((path, st.st_size, st.st_mtime_ns, sha256))
+    present = {os.path.basename(path) for path in epg_files}
+    loaded = set(manifest)
+    if full:
+        c.execute("SELECT DISTINCT raw_epg_file FROM raw_epg_channels WHERE raw_epg_file IS NOT NULL")
+        loaded.update(row[0] for row in c.fetchall())
+        c.execute("SELECT DISTINCT raw_epg_file FROM raw_epg_programs WHERE raw_epg_file IS NOT NULL")
+        loaded.update(row[0] for row in c.fetchall())
+    removed = sorted(loaded - present)
+    return to_parse, unchanged, touched, removed, full
+
+def _delete_raw_epg_file_rows(c, name):
+    c.execute("DELETE FROM raw_epg_channels WHERE raw_epg_file = ?", (name,))
+    c.execute("DELETE FROM raw_epg_programs WHERE raw_epg_file = ?", (name,))
+    c.execute("DELETE FROM raw_epg_manifest WHERE raw_epg_file = ?", (name,))
+
+def _load_raw_epg_file(conn, entry, spool_path):
+    """
+    Write job loading one file's spool, in its own transaction: its old rows
+    and manifest entry are replaced all-or-nothing, so readers see the old
+    rows until the new ones commit and never a half-loaded file.
+    """
+    epg_file, size, mtime_ns, sha256 = entry
+    name = os.path.basename(epg_file)
+    with bulk_load_pragmas(conn):
+        c = conn.cursor()
+        _delete_raw_epg_file_rows(c, name)
+        writer = _RawEpgBulkWriter(c)
+        counts = {"channel": 0, "programme": 0}
+        for kind, row in _iter_spooled_rows(spool_path):
+            writer.add(kind, row)
+            counts[kind] += 1
+        writer.flush()
+        c.execute("""
+            INSERT OR REPLACE INTO raw_epg_manifest
+                (raw_epg_file, size, mtime_ns, sha256, channels, programmes, parsed_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (name, size, mtime_ns, sha256, counts["channel"], counts["programme"],
+              datetime.utcnow().isoformat() + "Z"))
+        conn.commit()
+
+def _finish_raw_epg_load(conn, touched, removed, full):
+    """
+    Write job run after the files are loaded. Returns True if it deleted any
+    raw rows.
+    """
+    c = conn.cursor()
+    c.executemany("UPDATE raw_epg_manifest SET size = ?, mtime_ns = ? WHERE raw_epg_file = ?", touched)
+    before = conn.total_changes
+    for name in removed:
+        print(f"[INFO] Removing raw EPG data of deleted file: {name}")
+        _delete_raw_epg_file_rows(c, name)
+    if full:
+        # Rows from before raw_epg_file existed belong to no file.
+        c.execute("DELETE FROM raw_epg_channels WHERE raw_epg_file IS NULL")
+        c.execute("DELETE FROM raw_epg_programs WHERE raw_epg_file IS NULL")
+        # Recreate any raw index that has gone missing (e.g. dropped by hand);
+        # a no-op otherwise.
+        create_epg_indexes(conn, "raw_epg_channels", "raw_epg_programs")
+    return conn.total_changes > before
+
+def parse_raw_epg_files(force: bool = False) -> bool:
+    """
+    Bring raw_epg_* in line with the files in EPG_DIR. Only files that were
+    added or whose content changed since their last load (per
+    raw_epg_manifest) are parsed, and only their raw_epg_file rows are
+    replaced; rows of removed files are dropped. force=True reloads
+    everything. Returns True if any raw data changed (files that fail to
+    parse are left as they were and retried next time).
+
+    Files are parsed outside the writer and each is loaded by its own write
+    job, so other writes get their turn between files.
+    """
     print("[INFO] Parsing raw EPG files...")
     epg_files = [
         os.path.join(EPG_DIR, f)
@@ -63,479 +446,689 @@ def parse_raw_epg_files():
     ]
     if not epg_files:
         print("[INFO] No EPG files found in EPG_DIR.")
-        return
-
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-
-    # Clear previous raw EPG data.
-    c.execute("DELETE FROM raw_epg_channels")
-    c.execute("DELETE FROM raw_epg_programs")
 
-    # (Table creation is now handled in database.py.)
+    with get_db() as conn:
+        to_parse, unchanged, touched, removed, full = _plan_raw_epg_parse(conn.cursor(), epg_files, force)
+    print(
+        f"[INFO] EPG files: {len(to_parse)} to parse, {len(unchanged)} unchanged, "
+        f"{len(removed)} removed{' (full re-parse)' if full else ''}."
+    )
+    if not to_parse and not removed and not full:
+        if touched:
+            run_write(_finish_raw_epg_load, touched, removed, full)
+        print("[INFO] Raw EPG data is up to date.")
+        return False
 
-    for epg_file in epg_files:
-        print(f"[INFO] Reading raw EPG: {epg_file}")
-        try:
-            with open(epg_file, "rb") as f:
-                magic = f.read(2)
-                f.seek(0)
-                if magic == b'\x1f\x8b':
-                    tree = ET.parse(gzip.open(f))
-                else:
-                    tree = ET.parse(f)
-            root = tree.getroot()
-            # Process channel elements.
-            for channel_el in root.findall("channel"):
-                raw_id = html.unescape(channel_el.get("id", "").strip())
-                # Create a composite key: raw_id + "::" + (filename)
-                composite_raw_id = f"{raw_id}::{os.path.basename(epg_file)}"
-                display_names = channel_el.findall("display-name")
-                if len(display_names) >= 2:
-                    abbreviation = html.unescape(display_names[0].text.strip()) if display_names[0].text else ""
-                    full_name = html.unescape(display_names[1].text.strip()) if display_names[1].text else ""
-                    disp_name = f"{full_name} ({abbreviation})" if full_name and abbreviation else full_name or abbreviation
-                elif len(display_names) == 1:
-                    disp_name = html.unescape(display_names[0].text.strip())
-                else:
-                    disp_name = ""
-                # Use INSERT OR IGNORE to avoid duplicate (composite_raw_id, file) entries.
-                c.execute(
-                    "INSERT OR IGNORE INTO raw_epg_channels (raw_id, display_name, raw_epg_file) VALUES (?, ?, ?)",
-                    (composite_raw_id, disp_name, os.path.basename(epg_file))
-                )
-
-            # Process programme elements.
-            for prog_el in root.findall("programme"):
-                raw_prog_channel = html.unescape(prog_el.get("channel", "").strip())
-                # Create the composite key for programmes too.
-                composite_prog_channel = f"{raw_prog_channel}::{os.path.basename(epg_file)}"
-                raw_start_time = prog_el.get("start", "").strip()
-                raw_stop_time = prog_el.get("stop", "").strip()
-                start_time = parse_xmltv_datetime(raw_start_time)
-                stop_time = parse_xmltv_datetime(raw_stop_time)
-                title_el = prog_el.find("title")
-                title_text = title_el.text.strip() if (title_el is not None and title_el.text) else ""
-                desc_el = prog_el.find("desc")
-                desc_text = desc_el.text.strip() if (desc_el is not None and desc_el.text) else ""
-                icon_el = prog_el.find("icon")
-                icon_src = icon_el.get("src", "").strip() if icon_el is not None else ""
-                c.execute("""
-                    INSERT INTO raw_epg_programs (raw_channel_id, start, stop, title, description, icon_url, raw_epg_file)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                """, (composite_prog_channel, start_time, stop_time, title_text, desc_text, icon_src, os.path.basename(epg_file)))
-        except Exception as e:
-            print(f"[ERROR] Parsing {epg_file} failed: {e}")
-
-    conn.commit()
-    conn.close()
+    # Only rows actually replaced or deleted count: a full pass over an empty
+    # manifest (e.g. no guide files at all) changes nothing.
+    changed = False
+    try:
+        for done, (entry, spool) in enumerate(_iter_parsed_epg_files(to_parse)):
+            epg_file = entry[0]
+            print(f"[INFO] Reading raw EPG: {epg_file}")
+            report_progress(f"Parsing {os.path.basename(epg_file)}", done, len(to_parse))
+            spool_path = None
+            try:
+                spool_path = spool()
+                run_write(_load_raw_epg_file, entry, spool_path)
+                changed = True
+            except Exception as e:
+                # The file keeps its previous rows; it is retried on the next parse.
+                print(f"[ERROR] Parsing {epg_file} failed: {e}")
+            finally:
+                if spool_path and os.path.exists(spool_path):
+                    os.unlink(spool_path)
+    finally:
+        # Files that are gone are dropped only now, so the guide never loses
+        # them before the remaining files are in.
+        if run_write(_finish_raw_epg_load, touched, removed, full):
+            changed = True
     print("[INFO] Finished populating raw_epg_* tables.")
-    
+    return changed
+
 # ====================================================
 # 3) Build combined EPG from raw data (full rebuild)
 # ====================================================
-def build_combined_epg():
-    print("[INFO] Building combined EPG from raw DB...")
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    base_url = get_base_url()
-    # Remove old programme entries.
-    c.execute("DELETE FROM epg_programs")
-    combined_root = ET.Element("tv")
+# Copies the guide data of the selected channels into epg_programs in a single
+# statement, letting SQLite do the channel-to-raw-EPG mapping in one pass. A
+# channel matches the raw channels whose raw_id or display_name equals its
+# tvg_name; channels without a tvg_name, or whose tvg_name matches nothing,
+# fall back to raw channels whose display_name equals the channel name.
+# {channel_filter} is a WHERE condition on the channels table.
+_EPG_PROGRAMS_INSERT_SQL = """
+    WITH chan AS (
+        SELECT channel_number, COALESCE(tvg_name, '') AS tvg_name, COALESCE(name, '') AS name
+          FROM channels
+         WHERE {channel_filter}
+    ),
+    tvg_match AS (
+        SELECT chan.channel_number, r.raw_id
+          FROM chan JOIN raw_epg_channels r ON r.raw_id = chan.tvg_name
+         WHERE chan.tvg_name != ''
+        UNION
+        SELECT chan.channel_number, r.raw_id
+          FROM chan JOIN raw_epg_channels r ON r.display_name = chan.tvg_name
+         WHERE chan.tvg_name != ''
+    ),
+    name_match AS (
+        SELECT DISTINCT chan.channel_number, r.raw_id
+          FROM chan JOIN raw_epg_channels r ON r.display_name = chan.name
+         WHERE chan.channel_number NOT IN (SELECT channel_number FROM tvg_match)
+    ),
+    matched AS (
+        SELECT channel_number, raw_id FROM tvg_match
+        UNION ALL
+        SELECT channel_number, raw_id FROM name_match
+    )
+    INSERT INTO epg_programs (channel_tvg_name, start, stop, start_ts, stop_ts, title, description, icon_url)
+    SELECT CAST(m.channel_number AS TEXT), p.start, p.stop, p.start_ts, p.stop_ts, p.title, p.description, p.icon_url
+      FROM matched m
+      JOIN raw_epg_programs p ON p.raw_channel_id = m.raw_id
+     ORDER BY m.channel_number, m.raw_id, p.id
+"""
+
+def _insert_epg_programs(c, channel_filter: str, params=()):
+    """Fill epg_programs for the channels matching `channel_filter`; returns the row count."""
+    changes_before = c.connection.total_changes
+    c.execute(_EPG_PROGRAMS_INSERT_SQL.format(channel_filter=channel_filter), params)
+    return c.connection.total_changes - changes_before
+
+# ----------------------------------------------------
+# Streaming XMLTV serialization
+# ----------------------------------------------------
+# The combined EPG is written as text fragments straight from SQLite rows
+# (same markup ElementTree would produce), so the whole guide never has to
+# exist as Element objects at once.
+_XML_DECLARATION = "<?xml version='1.0' encoding='utf-8'?>\n"
+
+def _xml_text(value):
+    return value.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+def _xml_attr(value):
+    return (
+        _xml_text(value)
+        .replace('"', "&quot;")
+        .replace("\r", "&#13;")
+        .replace("\n", "&#10;")
+        .replace("\t", "&#09;")
+    )
+
+def _xml_element(tag, text):
+    return f"<{tag}>{_xml_text(text)}</{tag}>" if text else f"<{tag} />"
+
+def _channel_xml(channel_number, db_name, db_logo, base_url):
+    """Serialize one <channel> element, using channel_number as the ID."""
+    parts = [f'<channel id="{_xml_attr(str(channel_number))}">', _xml_element("display-name", db_name or "")]
+    if db_logo:
+        if db_logo.startswith("/"):
+            full_logo_url = f"{base_url}{db_logo}"
+        else:
+            full_logo_url = db_logo
+        parts.append(f'<icon src="{_xml_attr(full_logo_url)}" />')
+    parts.append("</channel>")
+    return "".join(parts)
+
+def _programme_xml(channel_number, start_t, stop_t, title_txt, desc_txt, icon_url, base_url):
+    """Serialize one <programme> element."""
+    parts = [
+        f'<programme channel="{_xml_attr(str(channel_number))}" start="{_xml_attr(start_t or "")}" stop="{_xml_attr(stop_t or "")}">',
+        _xml_element("title", title_txt or ""),
+        _xml_element("desc", desc_txt or ""),
+    ]
+    if icon_url:
+        filename = os.path.basename(icon_url)
+        new_icon_url = f"{base_url}/schedulesdirect_cache/{filename}"
+        parts.append(f'<icon src="{_xml_attr(new_icon_url)}" />')
+    parts.append("</programme>")
+    return "".join(parts)
+
+# ----------------------------------------------------
+# Publishing EPG.xml
+# ----------------------------------------------------
+# Every change to EPG.xml goes through publish_epg(): the new document is
+# written to a sibling temp file, fsynced and renamed over EPG.xml, so a
+# client fetching /epg.xml always gets either the old or the new complete
+# file. A gzip-compressed copy (EPG.xml.gz) is produced in the same pass and
+# published right after it, for clients that accept gzip. Writers are
+# serialized by _epg_write_lock (read-modify-write edits hold it for the
+# whole edit); readers never take it.
+_epg_write_lock = threading.RLock()
+_epg_generation = 0
+
+EPG_GZIP_LEVEL = 6
+
+def combined_epg_path():
+    return os.path.join(MODIFIED_EPG_DIR, "EPG.xml")
+
+def combined_epg_gzip_path():
+    return combined_epg_path() + ".gz"
+
+def get_epg_generation() -> int:
+    """Number of times EPG.xml has been published by this process."""
+    return _epg_generation
+
+class _TeeWriter:
+    """Minimal binary file object that forwards every write to several files."""
+    def __init__(self, *files):
+        self.files = files
+
+    def write(self, data):
+        for f in self.files:
+            f.write(data)
+        return len(data)
+
+def publish_epg(write_document):
+    """
+    Atomically replace EPG.xml (and EPG.xml.gz). `write_document(f)` must
+    write the complete document to the binary file object `f`. Returns the
+    new generation.
+    """
+    global _epg_generation
+    path = combined_epg_path()
+    gz_path = combined_epg_gzip_path()
+    directory = os.path.dirname(path) or "."
+    with _epg_write_lock:
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".EPG.xml.", suffix=".tmp")
+        gz_fd, gz_tmp_path = tempfile.mkstemp(dir=directory, prefix=".EPG.xml.gz.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb", buffering=1024 * 1024) as f, os.fdopen(gz_fd, "wb") as gz_f:
+                with gzip.GzipFile(fileobj=gz_f, mode="wb", compresslevel=EPG_GZIP_LEVEL, mtime=0) as gz:
+                    write_document(_TeeWriter(f, gz))
+                    # Finish EPG.xml before the gzip trailer, so a published
+                    # EPG.xml.gz is never older than the EPG.xml it matches.
+                    f.flush()
+                    os.fsync(f.fileno())
+                gz_f.flush()
+                os.fsync(gz_f.fileno())
+            os.chmod(tmp_path, 0o644)
+            os.chmod(gz_tmp_path, 0o644)
+            os.replace(tmp_path, path)
+            os.replace(gz_tmp_path, gz_path)
+        except BaseException:
+            for leftover in (tmp_path, gz_tmp_path):
+                try:
+                    os.unlink(leftover)
+                except OSError:
+                    pass
+            raise
+        _fsync_directory(directory)
+        _epg_generation += 1
+        return _epg_generation
+
+def _fsync_directory(directory):
+    # Persist the rename itself; not supported on every platform.
+    try:
+        dir_fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(dir_fd)
+    except OSError:
+        pass
+    finally:
+        os.close(dir_fd)
+
+def _publish_fragments(fragments):
+    """Publish an XMLTV document made of serialized <channel>/<programme> fragments."""
+    def write_document(f):
+        f.write(_XML_DECLARATION.encode("utf-8"))
+        f.write(b"<tv>")
+        for fragment in fragments:
+            f.write(fragment.encode("utf-8"))
+        f.write(b"</tv>")
+    return publish_epg(write_document)
+
+# ----------------------------------------------------
+# Resident EPG model
+# ----------------------------------------------------
+class EpgModel:
+    """
+    In-memory copy of the published guide as pre-serialized XML, sliced per
+    channel_number: the channel's <channel> element and its concatenated
+    <programme> elements. A channel edit replaces one slice and EPG.xml is
+    republished by concatenating the slices, instead of re-parsing and
+    rewriting the published file. Guarded by _epg_write_lock.
+    """
+    def __init__(self):
+        self.loaded = False
+        self._channels = {}
+        self._programmes = {}
+
+    def clear(self):
+        self._channels.clear()
+        self._programmes.clear()
+        self.loaded = False
 
-    # Query active channels using channel_number for ordering.
+    def __len__(self):
+        return len(self._channels)
+
+    def __contains__(self, channel_number):
+        return channel_number in self._channels
+
+    def has_programmes(self, channel_number):
+        return channel_number in self._programmes
+
+    def set_channel(self, channel_number, channel_xml):
+        self._channels[channel_number] = channel_xml
+
+    def set_programmes(self, channel_number, programmes_xml):
+        self._programmes[channel_number] = programmes_xml
+
+    def remove(self, channel_number):
+        self._channels.pop(channel_number, None)
+        self._programmes.pop(channel_number, None)
+
+    def fragments(self):
+        """Yield all <channel> slices, then all <programme> slices, by channel_number."""
+        numbers = sorted(self._channels)
+        for channel_number in numbers:
+            yield self._channels[channel_number]
+        for channel_number in numbers:
+            yield self._programmes.get(channel_number, "")
+
+_epg_model = EpgModel()
+
+def _load_epg_model(c, base_url):
+    """(Re)load the whole model from the active channels and epg_programs."""
+    _epg_model.clear()
     c.execute("""
-        SELECT channel_number, tvg_name, name, logo_url 
-          FROM channels 
-         WHERE active = 1 
+        SELECT channel_number, name, logo_url
+          FROM channels
+         WHERE active = 1
       ORDER BY channel_number
     """)
-    db_channels = c.fetchall()
-
-    for (channel_number, db_tvg_name, db_name, db_logo) in db_channels:
-        db_tvg_name = db_tvg_name or ""
-        db_name = db_name or ""
-        db_logo = db_logo or ""
-
-        # Build the <channel> element using channel_number as the ID.
-        channel_el = ET.Element("channel", id=str(channel_number))
-        disp_el = ET.Element("display-name")
-        disp_el.text = db_name
-        channel_el.append(disp_el)
-        if db_logo:
-            if db_logo.startswith("/"):
-                full_logo_url = f"{base_url}{db_logo}"
-            else:
-                full_logo_url = db_logo
-            icon_el = ET.Element("icon", src=full_logo_url)
-            channel_el.append(icon_el)
-        combined_root.append(channel_el)
-
-        # Insert epg_channels row if not present
-        c.execute("INSERT OR IGNORE INTO epg_channels (name) VALUES (?)", (db_name,))
-
-        # Find matching raw channel IDs.
-        raw_ids = []
-        if db_tvg_name:
-            c.execute("""
-                SELECT DISTINCT raw_id 
-                  FROM raw_epg_channels 
-                 WHERE raw_id = ? OR display_name = ?
-            """, (db_tvg_name, db_tvg_name))
-            raw_ids = [r[0] for r in c.fetchall()]
-            if not raw_ids:
-                c.execute("""
-                    SELECT DISTINCT raw_id
-                      FROM raw_epg_channels
-                     WHERE display_name = ?
-                """, (db_name,))
-                raw_ids = [r[0] for r in c.fetchall()]
-        else:
-            c.execute("""
-                SELECT DISTINCT raw_id
-                  FROM raw_epg_channels
-                 WHERE display_name = ?
-            """, (db_name,))
-            raw_ids = [r[0] for r in c.fetchall()]
-
-        # For each matching raw channel, pull programme data
-        for rid in raw_ids:
-            c.execute("""
-                SELECT start, stop, title, description, icon_url
-                  FROM raw_epg_programs 
-                 WHERE raw_channel_id = ?
-            """, (rid,))
-            raw_progs = c.fetchall()
-            for (start_t, stop_t, title_txt, desc_txt, icon_url) in raw_progs:
-                c.execute("""
-                    INSERT INTO epg_programs (channel_tvg_name, start, stop, title, description)
-                    VALUES (?, ?, ?, ?, ?)
-                """, (str(channel_number), start_t, stop_t, title_txt, desc_txt))
-                prog_el = ET.Element("programme", {
-                    "channel": str(channel_number),
-                    "start": start_t,
-                    "stop": stop_t
-                })
-                t_el = ET.SubElement(prog_el, "title")
-                t_el.text = title_txt
-                d_el = ET.SubElement(prog_el, "desc")
-                d_el.text = desc_txt
-                if icon_url:
-                    filename = os.path.basename(icon_url)
-                    new_icon_url = f"{base_url}/schedulesdirect_cache/{filename}"
-                    icon_el = ET.Element("icon", {"src": new_icon_url})
-                    prog_el.append(icon_el)
-                combined_root.append(prog_el)
-
-    conn.commit()
-    conn.close()
-    os.makedirs(MODIFIED_EPG_DIR, exist_ok=True)
-    combined_epg_file = os.path.join(MODIFIED_EPG_DIR, "EPG.xml")
-    tree = ET.ElementTree(combined_root)
-    tree.write(combined_epg_file, encoding="utf-8", xml_declaration=True)
-    print(f"[SUCCESS] Combined EPG saved as {combined_epg_file}")
+    for (channel_number, db_name, db_logo) in c.fetchall():
+        _epg_model.set_channel(channel_number, _channel_xml(channel_number, db_name, db_logo, base_url))
 
-# ====================================================
-# 4) Update program data for a single channel
-# ====================================================
-def update_program_data_for_channel(db_id: int):
+    programmes = {}
+    c.execute("""
+        SELECT channel_tvg_name, start, stop, title, description, icon_url
+          FROM epg_programs
+      ORDER BY id
+    """)
+    for row in c:
+        try:
+            channel_number = int(row[0])
+        except (TypeError, ValueError):
+            continue
+        if channel_number in _epg_model:
+            programmes.setdefault(channel_number, []).append(_programme_xml(*row, base_url))
+    for channel_number, parts in programmes.items():
+        _epg_model.set_programmes(channel_number, "".join(parts))
+    _epg_model.loaded = True
+
+_EPG_SLICE_SQL = """
+    SELECT channel_tvg_name, start, stop, title, description, icon_url
+      FROM epg_programs
+     WHERE channel_tvg_name = ?
+  ORDER BY id
+"""
+
+def _render_epg_slice(c, channel_number, base_url, programmes=True):
     """
-    CHANGED:
-      - We now fetch channel_number from the channel with the given DB ID.
-      - Then we remove old EPG data using that channel_number, 
-        and re-insert partial EPG for that channel_number.
+    Re-render one channel's slice from the DB. Only active channels are part
+    of the guide; anything else is dropped from the model. With
+    programmes=False an existing <programme> slice is kept as is.
     """
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute("SELECT channel_number, tvg_name, name, logo_url FROM channels WHERE id = ?", (db_id,))
+    c.execute("SELECT name, logo_url FROM channels WHERE channel_number = ? AND active = 1", (channel_number,))
     row = c.fetchone()
     if not row:
-        conn.close()
-        print(f"[ERROR] Channel ID {db_id} not found.")
+        _epg_model.remove(channel_number)
         return
-    channel_number, db_tvg_name, db_name, db_logo = row
-    conn.close()
+    db_name, db_logo = row
+    _epg_model.set_channel(channel_number, _channel_xml(channel_number, db_name, db_logo, base_url))
+    if programmes or not _epg_model.has_programmes(channel_number):
+        c.execute(_EPG_SLICE_SQL, (str(channel_number),))
+        _epg_model.set_programmes(channel_number, "".join(_programme_xml(*r, base_url) for r in c))
+
+def _republish_epg(dirty=None) -> bool:
+    """
+    Republish EPG.xml from the model. `dirty` maps channel_number to whether
+    its programmes changed too; those slices are re-rendered from the DB
+    first. With dirty=None the whole model is reloaded from the DB. Returns
+    False (and does nothing) if no guide has been built yet.
+    """
+    with _epg_write_lock:
+        if not _epg_model.loaded and not os.path.exists(combined_epg_path()):
+            print("[WARN] EPG.xml not found; build_combined_epg may be needed first.")
+            return False
+        with get_db(snapshot=True) as conn:
+            c = conn.cursor()
+            base_url = get_base_url()
+            if dirty is None or not _epg_model.loaded:
+                _load_epg_model(c, base_url)
+            if dirty:
+                for channel_number, programmes in sorted(dirty.items()):
+                    _render_epg_slice(c, channel_number, base_url, programmes=programmes)
+        _publish_fragments(_epg_model.fragments())
+    return True
 
-    # Remove old programs from DB and EPG.xml using channel_number, 
-    # because epg_programs.channel_tvg_name = str(channel_number).
-    _remove_programs_from_db(channel_number)
-    _remove_programs_from_xml(channel_number)
+# ----------------------------------------------------
+# Debounced EPG rebuild scheduler
+# ----------------------------------------------------
+# Channel edits commit their DB changes synchronously and then only mark the
+# affected channel_numbers dirty. A background thread republishes EPG.xml
+# once the marks have been quiet for EPG_REBUILD_DEBOUNCE_MS (but never later
+# than EPG_REBUILD_MAX_DELAY_MS after the first mark), so shifting or
+# activating hundreds of channels costs one rewrite instead of hundreds.
+EPG_REBUILD_MAX_DELAY_MS = 10000
+# Above this share of the guide's channels, reload the whole model instead of
+# re-rendering slice by slice.
+EPG_REBUILD_FULL_RATIO = 0.5
 
-    # Reload the partial EPG for that channel_number from raw_epg_* 
-    # (matching tvg_name or name).
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
+class EpgRebuildScheduler:
+    def __init__(self, debounce_ms=EPG_REBUILD_DEBOUNCE_MS, max_delay_ms=EPG_REBUILD_MAX_DELAY_MS):
+        self.debounce = max(0, debounce_ms) / 1000.0
+        self.max_delay = max(self.debounce, max_delay_ms / 1000.0)
+        self._cond = threading.Condition()
+        self._dirty = {}
+        self._first_mark = None
+        self._last_mark = None
+        self._flush_now = False
+        self._running = False
+        self._requested_seq = 0
+        self._done_seq = 0
+        self._thread = None
+        self._stats = {
+            "requests": 0,
+            "rebuilds": 0,
+            "full_rebuilds": 0,
+            "discarded": 0,
+            "last_rebuild_channels": 0,
+            "last_rebuild_ms": None,
+            "last_rebuild_at": None,
+            "last_error": None,
+        }
 
-    db_tvg_name = db_tvg_name or ""
-    db_name = db_name or ""
+    def mark(self, channel_numbers, programmes=True):
+        """Mark channels dirty; a pending programmes=True mark is never downgraded."""
+        with self._cond:
+            for channel_number in channel_numbers:
+                if channel_number is None:
+                    continue
+                self._dirty[channel_number] = self._dirty.get(channel_number, False) or programmes
+            self._touch()
 
-    # Find raw IDs in raw_epg_channels
-    raw_ids = []
-    if db_tvg_name:
-        c.execute("""
-            SELECT DISTINCT raw_id
-              FROM raw_epg_channels
-             WHERE raw_id = ? OR display_name = ?
-        """, (db_tvg_name, db_tvg_name))
-        raw_ids = [r[0] for r in c.fetchall()]
-        if not raw_ids:
-            c.execute("""
-                SELECT DISTINCT raw_id
-                  FROM raw_epg_channels
-                 WHERE display_name = ?
-            """, (db_name,))
-            raw_ids = [r[0] for r in c.fetchall()]
-    else:
-        c.execute("""
-            SELECT DISTINCT raw_id
-              FROM raw_epg_channels
-             WHERE display_name = ?
-        """, (db_name,))
-        raw_ids = [r[0] for r in c.fetchall()]
-
-    combined_epg_file = os.path.join(MODIFIED_EPG_DIR, "EPG.xml")
-    if not os.path.exists(combined_epg_file):
-        print("[WARN] EPG.xml not found; build_combined_epg may be needed first.")
-        conn.close()
-        return
+    def _touch(self):
+        now = time.monotonic()
+        if self._first_mark is None:
+            self._first_mark = now
+        self._last_mark = now
+        self._requested_seq += 1
+        self._stats["requests"] += 1
+        self._ensure_thread()
+        self._cond.notify_all()
 
-    try:
-        tree = ET.parse(combined_epg_file)
-        root = tree.getroot()
-        base_url = get_base_url()
-    except Exception as e:
-        print(f"[ERROR] Unable to load {combined_epg_file}: {e}")
-        conn.close()
-        return
+    def discard_pending(self):
+        """
+        Drop pending marks. Called by build_combined_epg, which reloads the
+        whole model from DB state that already includes every marked edit.
+        """
+        with self._cond:
+            if self._dirty:
+                self._stats["discarded"] += 1
+            self._reset_pending()
+            self._done_seq = self._requested_seq
+            self._cond.notify_all()
 
-    # Ensure <channel> node is present or create it
-    channel_el = None
-    for ch_el in root.findall("channel"):
-        if ch_el.get("id") == str(channel_number):
-            channel_el = ch_el
-            break
-    if channel_el is None:
-        channel_el = ET.Element("channel", {"id": str(channel_number)})
-        disp_el = ET.SubElement(channel_el, "display-name")
-        disp_el.text = db_name
-        if db_logo:
-            if db_logo.startswith("/"):
-                full_logo_url = f"{base_url}{db_logo}"
-            else:
-                full_logo_url = db_logo
-            ET.SubElement(channel_el, "icon", {"src": full_logo_url})
-        root.append(channel_el)
+    def _reset_pending(self):
+        self._dirty = {}
+        self._first_mark = None
+        self._last_mark = None
+        self._flush_now = False
 
-    # Insert new program data
-    for rid in raw_ids:
-        c.execute("""
-            SELECT start, stop, title, description, icon_url
-              FROM raw_epg_programs
-             WHERE raw_channel_id = ?
-        """, (rid,))
-        raw_progs = c.fetchall()
-        for (start_t, stop_t, title_txt, desc_txt, icon_url) in raw_progs:
-            # epg_programs DB
-            c.execute("""
-                INSERT INTO epg_programs (channel_tvg_name, start, stop, title, description)
-                VALUES (?, ?, ?, ?, ?)
-            """, (str(channel_number), start_t, stop_t, title_txt, desc_txt))
-
-            # EPG.xml node
-            prog_el = ET.Element("programme", {
-                "channel": str(channel_number),
-                "start": start_t,
-                "stop": stop_t
-            })
-            t_el = ET.SubElement(prog_el, "title")
-            t_el.text = title_txt
-            d_el = ET.SubElement(prog_el, "desc")
-            d_el.text = desc_txt
-            if icon_url:
-                filename = os.path.basename(icon_url)
-                new_icon_url = f"{base_url}/schedulesdirect_cache/{filename}"
-                icon_el = ET.Element("icon", {"src": new_icon_url})
-                prog_el.append(icon_el)
-            root.append(prog_el)
-
-    conn.commit()
-    conn.close()
-
-    tree.write(combined_epg_file, encoding="utf-8", xml_declaration=True)
-    print(f"[INFO] Updated partial EPG for channel_number {channel_number} in {combined_epg_file}")
-
-def _remove_programs_from_db(channel_number: int):
-    """
-    CHANGED: This now accepts channel_number, because epg_programs.channel_tvg_name 
-    is stored as the channel_number in string form.
-    """
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute("DELETE FROM epg_programs WHERE channel_tvg_name = ?", (str(channel_number),))
-    conn.commit()
-    conn.close()
+    def flush(self, timeout=None) -> bool:
+        """
+        Run any pending rebuild now and wait until every mark made before this
+        call has been published. Returns False on timeout.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            target = self._requested_seq
+            self._flush_now = True
+            self._cond.notify_all()
+            while self._done_seq < target:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            return True
+
+    def stats(self) -> dict:
+        with self._cond:
+            stats = dict(self._stats)
+            # Requests already published, minus the rebuilds it took.
+            stats["saved"] = max(0, self._done_seq - stats["rebuilds"])
+            stats["pending_channels"] = len(self._dirty)
+            stats["running"] = self._running
+            stats["debounce_ms"] = int(self.debounce * 1000)
+            stats["max_delay_ms"] = int(self.max_delay * 1000)
+            return stats
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="epg-rebuild", daemon=True)
+            self._thread.start()
+
+    def _next_batch(self):
+        with self._cond:
+            while True:
+                if self._dirty:
+                    if self._flush_now:
+                        break
+                    now = time.monotonic()
+                    due = min(self._last_mark + self.debounce, self._first_mark + self.max_delay)
+                    if now >= due:
+                        break
+                    self._cond.wait(due - now)
+                else:
+                    self._flush_now = False
+                    self._cond.wait()
+            dirty, seq = self._dirty, self._requested_seq
+            self._reset_pending()
+            self._running = True
+            return dirty, seq
+
+    def _run(self):
+        while True:
+            dirty, seq = self._next_batch()
+            started = time.monotonic()
+            error = None
+            full = len(dirty) > EPG_REBUILD_FULL_RATIO * max(1, len(_epg_model))
+            try:
+                _republish_epg(None if full else dirty)
+            except Exception as e:
+                error = str(e)
+                print(f"[ERROR] EPG rebuild failed: {e}")
+            elapsed_ms = int((time.monotonic() - started) * 1000)
+            with self._cond:
+                self._running = False
+                self._done_seq = max(self._done_seq, seq)
+                self._stats["rebuilds"] += 1
+                if full:
+                    self._stats["full_rebuilds"] += 1
+                self._stats["last_rebuild_channels"] = len(dirty)
+                self._stats["last_rebuild_ms"] = elapsed_ms
+                self._stats["last_rebuild_at"] = datetime.utcnow().isoformat() + "Z"
+                self._stats["last_error"] = error
+                self._cond.notify_all()
+            if error is None:
+                print(f"[INFO] EPG rebuild published {len(dirty)} changed channel(s){' (full reload)' if full else ''} in {elapsed_ms} ms.")
+
+_epg_scheduler = EpgRebuildScheduler()
+
+def schedule_epg_refresh(channel_numbers, programmes=True):
+    """Queue a republish of these channels' slices (programmes=False: channel element only)."""
+    _epg_scheduler.mark(channel_numbers, programmes=programmes)
+
+def flush_epg_rebuilds(timeout=None) -> bool:
+    """Publish all queued EPG changes now and wait for them; False on timeout."""
+    return _epg_scheduler.flush(timeout)
+
+def get_epg_rebuild_stats() -> dict:
+    # "generation" moves on with every publish, so a caller can tell whether
+    # EPG.xml changed since it last looked (e.g. after a flush).
+    return {**_epg_scheduler.stats(), "generation": get_epg_generation()}
+
+def _channel_number_for_id(channel_id: int):
+    with get_db() as conn:
+        c = conn.cursor()
+        c.execute("SELECT channel_number FROM channels WHERE id = ?", (channel_id,))
+        row = c.fetchone()
+    return row[0] if row else None
+
+def build_combined_epg():
+    print("[INFO] Building combined EPG from raw DB...")
+    base_url = get_base_url()
+
+    def fill_epg_programs(conn):
+        c = conn.cursor()
+        # Remove old programme entries. The epg_programs indexes are rebuilt once
+        # the table has been refilled (see below).
+        c.execute("DELETE FROM epg_programs")
+        drop_epg_indexes(conn, "epg_programs")
 
-def _remove_programs_from_xml(channel_number: int):
+        # Insert epg_channels rows if not present
+        c.execute("INSERT OR IGNORE INTO epg_channels (name) SELECT COALESCE(name, '') FROM channels WHERE active = 1")
+
+        # Map every active channel to its raw guide data in one statement.
+        inserted = _insert_epg_programs(c, "active = 1")
+        create_epg_indexes(conn, "epg_programs")
+        return inserted
+
+    report_progress("Matching guide data to channels")
+    inserted = run_write(fill_epg_programs)
+    invalidate_now_playing()
+    report_progress(f"Writing EPG.xml ({inserted} programmes)")
+
+    # Serialize channels and programmes straight from SQLite into the model,
+    # then publish EPG.xml from it.
+    combined_epg_file = combined_epg_path()
+    with _epg_write_lock:
+        # The reload below already reflects every queued channel edit.
+        _epg_scheduler.discard_pending()
+        with get_db(snapshot=True) as conn:
+            _load_epg_model(conn.cursor(), base_url)
+        _publish_fragments(_epg_model.fragments())
+    print(f"[SUCCESS] Combined EPG saved as {combined_epg_file} ({inserted} programmes)")
+
+# ====================================================
+# 4) Update program data for a single channel
+# ====================================================
+def update_program_data_for_channel(db_id: int):
+    """
+    CHANGED:
+      - We now fetch channel_number from the channel with the given DB ID.
+      - Then we remove old EPG data using that channel_number, 
+        and re-insert partial EPG for that channel_number.
+      - Only that channel's slice of EPG.xml is re-rendered, by the
+        rebuild scheduler.
     """
-    CHANGED: Also keyed by channel_number in <programme channel="...">
+    update_program_data_for_channels([db_id])
+
+def update_program_data_for_channels(db_ids):
+    """
+    Bulk form of update_program_data_for_channel: refreshes epg_programs for
+    all given channel DB IDs in one transaction and queues one EPG rebuild.
     """
-    combined_epg_file = os.path.join(MODIFIED_EPG_DIR, "EPG.xml")
-    if not os.path.exists(combined_epg_file):
+    db_ids = [int(db_id) for db_id in db_ids]
+    if not db_ids:
         return
-    try:
-        tree = ET.parse(combined_epg_file)
-        root = tree.getroot()
-        removed_count = 0
-        for prog_el in list(root.findall("programme")):
-            if prog_el.get("channel") == str(channel_number):
-                root.remove(prog_el)
-                removed_count += 1
-        if removed_count > 0:
-            tree.write(combined_epg_file, encoding="utf-8", xml_declaration=True)
-            print(f"[INFO] Removed {removed_count} old programmes for channel_number {channel_number}.")
-    except Exception as e:
-        print(f"[ERROR] Could not remove old programmes from EPG.xml: {e}")
+
+    def refresh_programs(conn):
+        c = conn.cursor()
+        channel_numbers = []
+        # Stay well below SQLite's host parameter limit.
+        for i in range(0, len(db_ids), 500):
+            chunk = db_ids[i:i + 500]
+            placeholders = ",".join("?" * len(chunk))
+            c.execute(f"SELECT id, channel_number FROM channels WHERE id IN ({placeholders})", chunk)
+            rows = c.fetchall()
+            found = {r[0] for r in rows}
+            for db_id in chunk:
+                if db_id not in found:
+                    print(f"[ERROR] Channel ID {db_id} not found.")
+            if not rows:
+                continue
+            numbers = [r[1] for r in rows]
+            channel_numbers.extend(numbers)
+            # Remove old programs using channel_number, because
+            # epg_programs.channel_tvg_name = str(channel_number), then reload them
+            # from raw_epg_* using the same mapping as the full rebuild.
+            c.executemany("DELETE FROM epg_programs WHERE channel_tvg_name = ?", [(str(n),) for n in numbers])
+            _insert_epg_programs(c, f"id IN ({placeholders})", chunk)
+        return channel_numbers
+
+    channel_numbers = run_write(refresh_programs)
+    invalidate_now_playing()
+    if channel_numbers:
+        schedule_epg_refresh(channel_numbers)
+        print(f"[INFO] Queued partial EPG update for {len(channel_numbers)} channel(s).")
 
 def update_channel_logo_in_epg(channel_id: int, new_logo: str):
     """
-    Unchanged logic, but keep in mind this uses channel_id or channel_number?
-    Actually, it calls <channel id="channel_number"> if you are consistent 
-    in your build_combined_epg. So if you want to update the EPG channel node's icon, 
-    we must do the same approach as above:
-    1) fetch channel_number from the channel with the given DB ID
-    2) update <channel id="channel_number">
+    Refresh the <channel id="channel_number"> node of the channel with the
+    given DB ID. The logo is taken from the channel row, which callers update
+    before calling this; the channel's programmes are left untouched.
     """
-    # CHANGED: fetch channel_number from DB
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute("SELECT channel_number FROM channels WHERE id = ?", (channel_id,))
-    row = c.fetchone()
-    conn.close()
-    if not row:
+    channel_number = _channel_number_for_id(channel_id)
+    if channel_number is None:
         print(f"[ERROR] update_channel_logo_in_epg: no channel found with id={channel_id}")
         return
-    channel_number = row[0]
-
-    combined_epg_file = os.path.join(MODIFIED_EPG_DIR, "EPG.xml")
-    if not os.path.exists(combined_epg_file):
-        return
-    try:
-        tree = ET.parse(combined_epg_file)
-        root = tree.getroot()
-        base_url = get_base_url()
-        updated = False
-        for channel_el in root.findall("channel"):
-            if channel_el.get("id") == str(channel_number):
-                if new_logo.startswith("/"):
-                    full_logo_url = f"{base_url}{new_logo}"
-                else:
-                    full_logo_url = new_logo
-                icon_el = channel_el.find("icon")
-                if icon_el is not None:
-                    icon_el.set("src", full_logo_url)
-                else:
-                    icon_el = ET.Element("icon", src=full_logo_url)
-                    channel_el.append(icon_el)
-                updated = True
-                break
-        if updated:
-            tree.write(combined_epg_file, encoding="utf-8", xml_declaration=True)
-            print(f"[INFO] Updated channel_number {channel_number} logo in EPG.xml.")
-    except Exception as e:
-        print(f"[ERROR] update_channel_logo_in_epg: {e}")
+    schedule_epg_refresh([channel_number], programmes=False)
+    print(f"[INFO] Queued channel_number {channel_number} logo update for EPG.xml.")
 
 def update_channel_metadata_in_epg(channel_id: int, new_name: str, new_logo: str):
     """
-    Similar approach: fetch channel_number from the DB, update <channel id=channel_number>.
+    Same approach as update_channel_logo_in_epg, for name and logo changes.
     """
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute("SELECT channel_number FROM channels WHERE id = ?", (channel_id,))
-    row = c.fetchone()
-    conn.close()
-    if not row:
+    channel_number = _channel_number_for_id(channel_id)
+    if channel_number is None:
         print(f"[ERROR] Could not update channel {channel_id} metadata in EPG.xml: channel not found.")
         return
-    channel_number = row[0]
-
-    combined_epg_file = os.path.join(MODIFIED_EPG_DIR, "EPG.xml")
-    if not os.path.exists(combined_epg_file):
-        return
-    try:
-        tree = ET.parse(combined_epg_file)
-        root = tree.getroot()
-        base_url = get_base_url()
-        for ch_el in root.findall("channel"):
-            if ch_el.get("id") == str(channel_number):
-                disp_el = ch_el.find("display-name")
-                if disp_el is not None:
-                    disp_el.text = new_name
-                else:
-                    disp_el = ET.Element("display-name")
-                    disp_el.text = new_name
-                    ch_el.append(disp_el)
-                if new_logo.startswith("/"):
-                    full_logo_url = f"{base_url}{new_logo}"
-                else:
-                    full_logo_url = new_logo
-                icon_el = ch_el.find("icon")
-                if icon_el is not None:
-                    icon_el.set("src", full_logo_url)
-                else:
-                    icon_el = ET.Element("icon", src=full_logo_url)
-                    ch_el.append(icon_el)
-    except Exception as e:
-        print(f"[ERROR] Could not update channel_number {channel_number} metadata in EPG.xml: {e}")
+    schedule_epg_refresh([channel_number], programmes=False)
+    print(f"[INFO] Queued channel_number {channel_number} metadata update for EPG.xml.")
 
 def update_modified_epg(old_id: int, new_id: int, swap: bool):
     """
     Here old_id and new_id refer to the channel_number, not DB IDs.
-    We'll also fix the DB epg_programs table references in the same call.
+    We'll also fix the DB epg_programs table references in the same call,
+    then queue a re-render of the slices of both numbers.
     """
     # CHANGED: also fix references in the DB
     update_programs_db_on_swap(old_id, new_id, swap)
+    schedule_epg_refresh([old_id, new_id])
+    print(f"[INFO] update_modified_epg: queued channel {old_id} -> {new_id} (swap={swap})")
 
-    combined_epg_file = os.path.join(MODIFIED_EPG_DIR, "EPG.xml")
-    if not os.path.exists(combined_epg_file):
+def update_modified_epg_bulk(moves):
+    """
+    Apply many non-swap renumberings, given as (old_number, new_number)
+    pairs in the order they were made in the channels table, with a single
+    transaction and a single queued EPG rebuild.
+    """
+    moves = [(int(old), int(new)) for old, new in moves]
+    if not moves:
         return
-    try:
-        tree = ET.parse(combined_epg_file)
-        root = tree.getroot()
-        if swap:
-            for ch in root.findall("channel"):
-                cid = ch.get("id")
-                if cid == str(old_id):
-                    ch.set("id", str(new_id))
-                elif cid == str(new_id):
-                    ch.set("id", str(old_id))
-            for prog in root.findall("programme"):
-                pcid = prog.get("channel")
-                if pcid == str(old_id):
-                    prog.set("channel", str(new_id))
-                elif pcid == str(new_id):
-                    prog.set("channel", str(old_id))
-        else:
-            for ch in root.findall("channel"):
-                if ch.get("id") == str(old_id):
-                    ch.set("id", str(new_id))
-            for prog in root.findall("programme"):
-                if prog.get("channel") == str(old_id):
-                    prog.set("channel", str(new_id))
 
-        tree.write(combined_epg_file, encoding="utf-8", xml_declaration=True)
-        print(f"[INFO] update_modified_epg: changed channel {old_id} -> {new_id} (swap={swap})")
-    except Exception as e:
-        print(f"[ERROR] update_modified_epg: {e}")
+    def move_programs(conn):
+        conn.executemany(
+            "UPDATE epg_programs SET channel_tvg_name = ? WHERE channel_tvg_name = ?",
+            [(str(new), str(old)) for old, new in moves]
+        )
 
+    run_write(move_programs)
+    invalidate_now_playing()
+    schedule_epg_refresh({n for move in moves for n in move})
+    print(f"[INFO] update_modified_epg_bulk: queued {len(moves)} channel move(s).")
 
-def update_programs_db_on_swap(old_num: int, new_num: int, do_swap: bool):
+
+def move_epg_programs(conn, old_num: int, new_num: int, do_swap: bool):
     """
-    Fix references in the epg_programs table, 
-    where channel_tvg_name is a string of the channel_number.
-    If do_swap == True, we do a 3-step swap using a temp value.
-    Otherwise, it's just a direct rename from old_num to new_num.
+    The DB part of update_programs_db_on_swap, for a caller already inside a
+    write job. Once that job has committed, the caller must
+    invalidate_now_playing() and schedule_epg_refresh([old_num, new_num]).
     """
-    conn = sqlite3.connect(DB_FILE)
     c = conn.cursor()
 
     if do_swap:
@@ -547,8 +1140,15 @@ def update_programs_db_on_swap(old_num: int, new_num: int, do_swap: bool):
     else:
         c.execute("UPDATE epg_programs SET channel_tvg_name = ? WHERE channel_tvg_name = ?", (str(new_num), str(old_num)))
 
-    conn.commit()
-    conn.close()
+def update_programs_db_on_swap(old_num: int, new_num: int, do_swap: bool):
+    """
+    Fix references in the epg_programs table, 
+    where channel_tvg_name is a string of the channel_number.
+    If do_swap == True, we do a 3-step swap using a temp value.
+    Otherwise, it's just a direct rename from old_num to new_num.
+    """
+    run_write(move_epg_programs, old_num, new_num, do_swap)
+    invalidate_now_playing()
     print(f"[INFO] epg_programs references updated from {old_num} to {new_num}, swap={do_swap}.")
     
     
@@ -0,0 +1,155 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+# ====================================================
+# Background jobs
+# ====================================================
+# Long operations (EPG re-parse, M3U load) run on a background thread instead
+# of in the request handler or on the event loop:
+#
+#     job = submit_job("epg_reparse", reparse_epg)
+#     return {"success": True, "job_id": job.id}
+#
+# and clients follow them through /api/jobs/{job_id}. Jobs run one at a time,
+# in submission order: they all rewrite the same tables and EPG.xml, so
+# running them side by side would only make them slower. Submitting a job
+# while another of the same kind is still queued returns the queued one, as it
+# will pick up whatever the new request changed (e.g. a second uploaded file).
+#
+# Code running inside a job reports how far it got with report_progress();
+# outside a job that is a no-op.
+JOB_HISTORY_SIZE = 50
+
+class Job:
+    def __init__(self, kind, description):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.description = description
+        self.status = "queued"
+        self.message = description
+        self.done = None
+        self.total = None
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.future = None
+
+    def to_dict(self) -> dict:
+        def iso(ts):
+            return datetime.utcfromtimestamp(ts).isoformat() + "Z" if ts else None
+        end = self.finished_at or time.time()
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "description": self.description,
+            "status": self.status,
+            "message": self.message,
+            "done": self.done,
+            "total": self.total,
+            "result": self.result,
+            "error": self.error,
+            "created_at": iso(self.created_at),
+            "started_at": iso(self.started_at),
+            "finished_at": iso(self.finished_at),
+            "run_ms": round((end - self.started_at) * 1000, 1) if self.started_at else None,
+        }
+
+class JobRunner:
+    def __init__(self, history_size=JOB_HISTORY_SIZE):
+        self.history_size = history_size
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="job")
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._local = threading.local()
+
+    def submit(self, kind, fn, *args, description=None, **kwargs) -> Job:
+        """Queue fn(*args, **kwargs) as a job of `kind`, or return the queued one."""
+        with self._lock:
+            for job in self._jobs.values():
+                if job.kind == kind and job.status == "queued":
+                    return job
+            job = Job(kind, description or kind)
+            self._jobs[job.id] = job
+            self._trim()
+            job.future = self._executor.submit(self._run, job, fn, args, kwargs)
+        job.future.add_done_callback(lambda future: self._on_done(job, future))
+        return job
+
+    def _on_done(self, job, future):
+        if future.cancelled():
+            with self._lock:
+                job.status = "cancelled"
+                job.finished_at = time.time()
+
+    def _run(self, job, fn, args, kwargs):
+        with self._lock:
+            job.status = "running"
+            job.started_at = time.time()
+        self._local.job = job
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            print(f"[ERROR] Job {job.kind} ({job.id}) failed: {e}")
+            with self._lock:
+                job.status = "failed"
+                job.message = "Failed"
+                job.error = str(e)
+                job.finished_at = time.time()
+            raise
+        finally:
+            self._local.job = None
+        with self._lock:
+            job.status = "succeeded"
+            job.message = "Done"
+            job.result = result
+            job.finished_at = time.time()
+        return result
+
+    def _trim(self):
+        finished = [j for j in self._jobs.values() if j.finished_at is not None]
+        for job in finished[:max(0, len(self._jobs) - self.history_size)]:
+            del self._jobs[job.id]
+
+    def report_progress(self, message, done=None, total=None):
+        job = getattr(self._local, "job", None)
+        if job is None:
+            return
+        with self._lock:
+            job.message = message
+            job.done = done
+            job.total = total
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return job.to_dict() if job else None
+
+    def list(self) -> list:
+        with self._lock:
+            return [job.to_dict() for job in reversed(list(self._jobs.values()))]
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+_runner = JobRunner()
+
+def submit_job(kind, fn, *args, description=None, **kwargs) -> Job:
+    return _runner.submit(kind, fn, *args, description=description, **kwargs)
+
+def report_progress(message, done=None, total=None):
+    """Update the running job's progress message (and done/total counts)."""
+    _runner.report_progress(message, done, total)
+
+def get_job(job_id):
+    return _runner.get(job_id)
+
+def list_jobs() -> list:
+    return _runner.list()
+
+def shutdown_jobs(wait=True):
+    _runner.shutdown(wait)
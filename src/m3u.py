@@ -1,11 +1,12 @@
 import os
-import sqlite3
 import html
 import hashlib
 import requests
 import re
-from .config import M3U_DIR, DB_FILE, LOGOS_DIR
+from .config import M3U_DIR, LOGOS_DIR
+from .database import run_write
 from .epg import parse_raw_epg_files, build_combined_epg
+from .jobs import report_progress
 
 def cache_logo(logo_url: str, channel_identifier: str = None) -> str:
     if not logo_url:
@@ -72,26 +73,13 @@ def load_m3u_files():
         print(f"[INFO] No M3U file found. Please upload an M3U file to the {M3U_DIR} directory and restart the app.")
         return
 
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-
-    # Ensure that the channels table has a 'removed_reason' column.
-    c.execute("PRAGMA table_info(channels)")
-    columns = [col_info[1] for col_info in c.fetchall()]
-    if "removed_reason" not in columns:
-        try:
-            c.execute("ALTER TABLE channels ADD COLUMN removed_reason TEXT")
-            print("[INFO] Added removed_reason column to channels.")
-        except Exception as e:
-            print("Warning: Could not add removed_reason column:", e)
-
     print(f"[INFO] Loading M3U: {m3u_file}")
     with open(m3u_file, "r", encoding="utf-8") as f:
         lines = f.readlines()
 
-    # Collect keys using the channel name (name_part) from the M3U file.
-    m3u_keys = set()
-
+    # Parse the playlist and cache the logos up front, so the write job below
+    # does not hold the database writer while downloading.
+    entries = []
     idx = 0
     while idx < len(lines):
         line = lines[idx].strip()
@@ -101,20 +89,41 @@ def load_m3u_files():
             tvg_logo = parse_m3u_attribute(line, "tvg-logo")
             group_title = parse_m3u_attribute(line, "group-title")
             url = lines[idx + 1].strip() if (idx + 1) < len(lines) else ""
+            # Use tvg_name if available; otherwise, fallback to name_part for lookup.
+            key = tvg_name if tvg_name else name_part
+            report_progress(f"Reading channel {key}", idx, len(lines))
+            cached_logo = cache_logo(tvg_logo, channel_identifier=key) if tvg_logo else ""
+            entries.append((name_part, tvg_name, group_title, url, key, cached_logo))
+            idx += 2
+        else:
+            idx += 1
 
-            remote_logo = tvg_logo if tvg_logo else ""
+    def update_channels(conn):
+        c = conn.cursor()
+
+        # Ensure that the channels table has a 'removed_reason' column.
+        c.execute("PRAGMA table_info(channels)")
+        columns = [col_info[1] for col_info in c.fetchall()]
+        if "removed_reason" not in columns:
+            try:
+                c.execute("ALTER TABLE channels ADD COLUMN removed_reason TEXT")
+                print("[INFO] Added removed_reason column to channels.")
+            except Exception as e:
+                print("Warning: Could not add removed_reason column:", e)
+
+        # Collect keys using the channel name (name_part) from the M3U file.
+        m3u_keys = set()
+
+        for name_part, tvg_name, group_title, url, key, cached_logo in entries:
             # For cleanup purposes, add the channel's name to the set.
             m3u_keys.add(name_part)
 
-            # Use tvg_name if available; otherwise, fallback to name_part for lookup.
-            key = tvg_name if tvg_name else name_part
             # Fetch removed_reason along with other fields.
             c.execute("SELECT id, url, logo_url, removed_reason FROM channels WHERE tvg_name = ? OR name = ?", (key, key))
             row = c.fetchone()
             if row:
                 channel_id, old_url, old_logo, removed_reason = row
-                default_logo = cache_logo(remote_logo, channel_identifier=key) if remote_logo else ""
-                tvg_logo_local = old_logo if old_logo and old_logo != default_logo else default_logo
+                tvg_logo_local = old_logo if old_logo and old_logo != cached_logo else cached_logo
                 if removed_reason:
                     # Channel was previously removed; update details but do not change active status.
                     c.execute("""
@@ -136,7 +145,7 @@ def load_m3u_files():
                         # No changes necessary; leave active status as is.
                         print(f"[INFO] Channel '{key}' already up-to-date; active status unchanged.")
             else:
-                tvg_logo_local = cache_logo(remote_logo, channel_identifier=key) if remote_logo else ""
+                tvg_logo_local = cached_logo
                 # Insert new channel as inactive (active = 0)
                 c.execute("""
                     INSERT INTO channels (name, url, tvg_name, logo_url, group_title, active)
@@ -154,21 +163,18 @@ def load_m3u_files():
                         break
                 c.execute("UPDATE channels SET channel_number = ? WHERE id = ?", (next_number, new_id))
                 print(f"[INFO] Inserted new channel '{key}' with logo. (Inactive by default, channel_number set to {next_number})")
-            idx += 2
-        else:
-            idx += 1
 
-    # Perform cleanup: mark any channels that are active in the database
-    # but whose 'name' is not present in the current M3U file as inactive.
-    c.execute("SELECT id, name, active FROM channels")
-    for channel in c.fetchall():
-        chan_id, chan_name, active = channel
-        if chan_name not in m3u_keys and active == 1:
-            c.execute("UPDATE channels SET active = 0, removed_reason = 'Removed from M3U' WHERE id = ?", (chan_id,))
-            print(f"[INFO] Marked channel '{chan_name}' as removed (not in current M3U).")
+        # Perform cleanup: mark any channels that are active in the database
+        # but whose 'name' is not present in the current M3U file as inactive.
+        c.execute("SELECT id, name, active FROM channels")
+        for channel in c.fetchall():
+            chan_id, chan_name, active = channel
+            if chan_name not in m3u_keys and active == 1:
+                c.execute("UPDATE channels SET active = 0, removed_reason = 'Removed from M3U' WHERE id = ?", (chan_id,))
+                print(f"[INFO] Marked channel '{chan_name}' as removed (not in current M3U).")
 
-    conn.commit()
-    conn.close()
+    report_progress(f"Updating {len(entries)} channels")
+    run_write(update_channels)
 
     print("[INFO] Channels updated. Updating modified EPG file...")
     parse_raw_epg_files()
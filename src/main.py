@@ -8,8 +8,10 @@ import subprocess
 from .routes import router as app_router
 from .status import router as status_router
 from .settings import router as settings_router
-from .database import init_db
+from .database import init_db, stop_db_writer
+from .jobs import shutdown_jobs
 from .m3u import load_m3u_files
+from .epg import flush_epg_rebuilds
 
 # Import 'config' and the new function for re-parse tasks
 from .config import config, LOGOS_DIR, CUSTOM_LOGOS_DIR, USE_PREGENERATED_DATA
@@ -128,3 +130,14 @@ async def startup_event():
     else:
         # Skipping M3U load and EPG re-parse as requested; using pre-generated data
         print("[Startup] USE_PREGENERATED_DATA is True: skipping M3U load and EPG re-parse task.")
+
+@app.on_event("shutdown")
+def shutdown_event():
+    # Drop queued background jobs and let the running one finish.
+    shutdown_jobs(wait=True)
+    # Publish channel edits still waiting in the EPG rebuild queue.
+    if not flush_epg_rebuilds(timeout=30):
+        print("[WARN] Shutdown: queued EPG rebuild did not finish in time.")
+    # Let queued database writes finish and close the write connection.
+    if not stop_db_writer(timeout=30):
+        print("[WARN] Shutdown: database writes did not finish in time.")
@@ -0,0 +1,136 @@
+import threading
+import time
+from .database import get_db
+
+# ====================================================
+# Now/next program cache
+# ====================================================
+# The current and next programme of every channel, computed with two queries
+# over channels and epg_programs and shared by the web UI,
+# /api/current_program and /api/stream_status. The snapshot stays valid until the earliest programme
+# boundary it contains (the first current programme to end or next programme
+# to start), or until epg.py invalidates it after changing epg_programs.
+
+# Upper bound on a snapshot's lifetime when no boundary is in sight.
+NOW_PLAYING_MAX_TTL = 3600
+
+_lock = threading.Lock()
+_snapshot = None
+_expires_at = 0
+_version = 0
+_stats = {"hits": 0, "misses": 0, "invalidations": 0, "last_refresh_ms": None}
+
+# The current and next programme per channel: one index seek per channel on
+# idx_epg_programs_channel_start_ts (channel_tvg_name, start_ts) for the last
+# programme to start by now (current if it has not ended yet) and the first
+# one to start after now.
+NOW_PROGRAMS_SQL = """
+    SELECT c.channel_number, p.title, p.start, p.stop, p.description, p.start_ts, p.stop_ts
+      FROM channels c
+      JOIN epg_programs p ON p.id = (
+               SELECT id
+                 FROM epg_programs
+                WHERE channel_tvg_name = CAST(c.channel_number AS TEXT) AND start_ts <= ?
+             ORDER BY start_ts DESC
+                LIMIT 1
+           )
+     WHERE p.stop_ts > ?
+"""
+NEXT_PROGRAMS_SQL = """
+    SELECT c.channel_number, p.title, p.start, p.stop, p.description, p.start_ts, p.stop_ts
+      FROM channels c
+      JOIN epg_programs p ON p.id = (
+               SELECT id
+                 FROM epg_programs
+                WHERE channel_tvg_name = CAST(c.channel_number AS TEXT) AND start_ts > ?
+             ORDER BY start_ts
+                LIMIT 1
+           )
+"""
+
+def invalidate_now_playing():
+    """Drop the cached snapshot; the next lookup recomputes it."""
+    global _snapshot, _version
+    with _lock:
+        _snapshot = None
+        _version += 1
+        _stats["invalidations"] += 1
+
+def _program(row):
+    title, start, stop, description, start_ts, stop_ts = row
+    return {
+        "title": title,
+        "start": start,
+        "stop": stop,
+        "description": description,
+        "start_ts": start_ts,
+        "stop_ts": stop_ts,
+    }
+
+def _load_snapshot(now):
+    """Return ({channel_number: {"now": program|None, "next": program|None}}, expires_at)."""
+    with get_db(snapshot=True) as conn:
+        c = conn.cursor()
+        snapshot = {}
+        c.execute(NOW_PROGRAMS_SQL, (now, now))
+        for row in c.fetchall():
+            try:
+                channel_number = int(row[0])
+            except (TypeError, ValueError):
+                continue
+            snapshot[channel_number] = {"now": _program(row[1:]), "next": None}
+        c.execute(NEXT_PROGRAMS_SQL, (now,))
+        for row in c.fetchall():
+            try:
+                channel_number = int(row[0])
+            except (TypeError, ValueError):
+                continue
+            snapshot.setdefault(channel_number, {"now": None, "next": None})["next"] = _program(row[1:])
+
+    expires_at = now + NOW_PLAYING_MAX_TTL
+    for entry in snapshot.values():
+        if entry["now"]:
+            expires_at = min(expires_at, entry["now"]["stop_ts"])
+        if entry["next"]:
+            expires_at = min(expires_at, entry["next"]["start_ts"])
+    return snapshot, expires_at
+
+def get_now_playing():
+    """
+    The current snapshot: {channel_number: {"now": ..., "next": ...}}, where
+    each program is a dict with title, start, stop, description, start_ts and
+    stop_ts (or None). Channels without guide data are absent. The returned
+    dicts are shared; callers must not modify them.
+    """
+    global _snapshot, _expires_at
+    now = int(time.time())
+    with _lock:
+        if _snapshot is not None and now < _expires_at:
+            _stats["hits"] += 1
+            return _snapshot
+        _stats["misses"] += 1
+        version = _version
+    started = time.monotonic()
+    snapshot, expires_at = _load_snapshot(now)
+    with _lock:
+        _stats["last_refresh_ms"] = int((time.monotonic() - started) * 1000)
+        # Don't publish a snapshot that an invalidation raced with.
+        if version == _version:
+            _snapshot, _expires_at = snapshot, expires_at
+    return snapshot
+
+def get_now_playing_state():
+    """(version, expires_at) of the cache: a change in either means lookups may differ."""
+    with _lock:
+        return _version, (_expires_at if _snapshot is not None else 0)
+
+def get_now_playing_stats() -> dict:
+    with _lock:
+        stats = dict(_stats)
+        stats["channels"] = len(_snapshot) if _snapshot is not None else None
+        return stats
+
+def get_current_program(channel_number):
+    """The program on air on `channel_number` right now, or None."""
+    entry = get_now_playing().get(int(channel_number))
+    return entry["now"] if entry else None
@@ -1,21 +1,28 @@
 import subprocess
 import json
-import sqlite3
-import datetime
+import email.utils
+import time
 from fastapi import APIRouter, Request, Form, HTTPException, UploadFile, File, Query
 from fastapi.responses import (
-    JSONResponse, FileResponse, PlainTextResponse, StreamingResponse,
-    HTMLResponse, RedirectResponse
+    JSONResponse, PlainTextResponse, StreamingResponse,
+    HTMLResponse, RedirectResponse, Response
 )
 import os
 import asyncio
-from .config import DB_FILE, MODIFIED_EPG_DIR, EPG_DIR, HOST_IP, PORT, CUSTOM_LOGOS_DIR, LOGOS_DIR, TUNER_COUNT, CONFIG_FILE_PATH
-from .database import init_db, swap_channel_numbers
+from .config import MODIFIED_EPG_DIR, EPG_DIR, HOST_IP, PORT, CUSTOM_LOGOS_DIR, LOGOS_DIR, TUNER_COUNT, CONFIG_FILE_PATH
+from .database import init_db, swap_channel_numbers, get_db, run_write
 from .epg import (
     update_modified_epg, update_channel_logo_in_epg, update_channel_metadata_in_epg,
-    update_program_data_for_channel, parse_raw_epg_files, build_combined_epg, load_epg_color_mapping
+    update_program_data_for_channel, update_program_data_for_channels, update_modified_epg_bulk,
+    flush_epg_rebuilds, get_epg_rebuild_stats, load_epg_color_mapping,
+    combined_epg_path, combined_epg_gzip_path, move_epg_programs, schedule_epg_refresh
 )
-from .streaming import get_shared_stream, clear_shared_stream
+from .now_playing import (
+    get_now_playing, get_now_playing_state, get_now_playing_stats, invalidate_now_playing,
+    get_current_program as now_playing_program
+)
+from .streaming import join_shared_stream, clear_shared_stream, TunersBusy
+from .tasks import submit_epg_rebuild
 from fastapi.templating import Jinja2Templates
 import logging
 logger = logging.getLogger(__name__)
@@ -51,41 +58,25 @@ def get_base_url():
 
 @router.get("/", response_class=HTMLResponse)
 def web_interface(request: Request):
-    import datetime
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute("SELECT id, channel_number, name, url, tvg_name, logo_url, group_title, active, removed_reason FROM channels ORDER BY channel_number")
-    channels = c.fetchall()
+    with get_db() as conn:
+        c = conn.cursor()
+        c.execute("SELECT id, channel_number, name, url, tvg_name, logo_url, group_title, active, removed_reason FROM channels ORDER BY channel_number")
+        channels = c.fetchall()
 
-    epg_map = {}
-    epg_entry_map = {}
-    stream_map = {}
-    base_url = get_base_url()
-    now = datetime.datetime.utcnow().strftime("%Y%m%d%H%M%S") + " +0000"
+        epg_map = {}
+        epg_entry_map = {}
+        stream_map = {}
+        base_url = get_base_url()
+        now_playing = get_now_playing()
 
-    for channel in channels:
-        # Unpack all 9 values
-        ch_id, ch_number, ch_name, ch_url, ch_tvg_name, ch_logo, ch_group, ch_active, removed_reason = channel
-        c.execute("""
-            SELECT title, start, stop, description 
-              FROM epg_programs 
-             WHERE channel_tvg_name = ? AND start <= ? AND stop > ?
-             ORDER BY start DESC LIMIT 1
-        """, (str(ch_number), now, now))
-        program = c.fetchone()
-        if program:
-            epg_map[str(ch_number)] = {
-                "title": program[0],
-                "start": program[1],
-                "stop": program[2],
-                "description": program[3]
-            }
-        else:
-            epg_map[str(ch_number)] = None
+        for channel in channels:
+            # Unpack all 9 values
+            ch_id, ch_number, ch_name, ch_url, ch_tvg_name, ch_logo, ch_group, ch_active, removed_reason = channel
+            entry = now_playing.get(ch_number)
+            epg_map[str(ch_number)] = entry["now"] if entry else None
 
-        epg_entry_map[str(ch_number)] = ch_tvg_name or ""
-        stream_map[str(ch_number)] = f"{base_url}/tuner/{ch_number}"
-    conn.close()
+            epg_entry_map[str(ch_number)] = ch_tvg_name or ""
+            stream_map[str(ch_number)] = f"{base_url}/tuner/{ch_number}"
 
     js_script = ""
     return templates.TemplateResponse("index.html", {
@@ -120,11 +111,10 @@ def discover(request: Request):
 @router.get("/lineup.json")
 def lineup(request: Request):
     base_url = get_base_url()
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute("SELECT channel_number, name, url, logo_url FROM channels WHERE active = 1 ORDER BY channel_number")
-    rows = c.fetchall()
-    conn.close()
+    with get_db() as conn:
+        c = conn.cursor()
+        c.execute("SELECT channel_number, name, url, logo_url FROM channels WHERE active = 1 ORDER BY channel_number")
+        rows = c.fetchall()
 
     lineup_data = []
     for ch in rows:
@@ -155,47 +145,179 @@ def lineup_status():
     })
 
 
-@router.get("/epg.xml")
-def serve_epg():
-    modified_epg_files = [
-        os.path.join(MODIFIED_EPG_DIR, f)
-        for f in os.listdir(MODIFIED_EPG_DIR)
-        if f.endswith(".xml") or f.endswith(".xmltv")
-    ]
-    if modified_epg_files:
-        return FileResponse(modified_epg_files[0], media_type="application/xml")
-    return PlainTextResponse("<tv></tv>", media_type="application/xml")
+def _open_epg_snapshot():
+    """
+    Open the published EPG.xml (or, failing that, any other XMLTV file in
+    MODIFIED_EPG_DIR). EPG.xml is only ever replaced by rename, so the open
+    file handle is a consistent snapshot even if a new guide is published
+    while it is being sent. Returns None if there is no guide yet.
+    """
+    candidates = [combined_epg_path()]
+    if os.path.isdir(MODIFIED_EPG_DIR):
+        candidates += [
+            os.path.join(MODIFIED_EPG_DIR, f)
+            for f in os.listdir(MODIFIED_EPG_DIR)
+            if f.endswith(".xml") or f.endswith(".xmltv")
+        ]
+    for path in candidates:
+        try:
+            return open(path, "rb")
+        except OSError:
+            continue
+    return None
+
+
+def _open_epg_gzip_snapshot(xml_stat):
+    """
+    Open the pre-compressed EPG.xml.gz if it belongs to the EPG.xml described
+    by `xml_stat`. It is published right after EPG.xml, so an older .gz means
+    EPG.xml was replaced without it (or the pair is mid-publish).
+    """
+    try:
+        gz = open(combined_epg_gzip_path(), "rb")
+    except OSError:
+        return None
+    if os.fstat(gz.fileno()).st_mtime_ns < xml_stat.st_mtime_ns:
+        gz.close()
+        return None
+    return gz
+
+
+def _accepts_gzip(accept_encoding: str) -> bool:
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        if coding.strip().lower() not in ("gzip", "*"):
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        return q > 0
+    return False
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    # Weak comparison, as required for If-None-Match.
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return any(tag.removeprefix("W/") == etag for tag in candidates)
 
 
+def _not_modified_since(if_modified_since: str, st) -> bool:
+    try:
+        since = email.utils.parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since is None:
+        return False
+    return int(st.st_mtime) <= since.timestamp()
+
+
+def _iter_file(f, chunk_size=256 * 1024):
+    try:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        f.close()
+
+
+@router.get("/epg.xml")
+def serve_epg(request: Request):
+    """
+    Serve the published guide. Clients that accept gzip get the pre-compressed
+    copy built at publish time; every response carries a strong ETag derived
+    from the published file (mtime_ns and size, so it survives restarts) and
+    Last-Modified, and conditional requests for an unchanged guide get 304
+    with the same Vary/Content-Encoding/ETag headers as the 200.
+    """
+    f = _open_epg_snapshot()
+    if f is None:
+        return PlainTextResponse("<tv></tv>", media_type="application/xml", headers={"Vary": "Accept-Encoding"})
+    st = os.fstat(f.fileno())
+    etag_suffix = ""
+    headers = {"Vary": "Accept-Encoding", "Cache-Control": "no-cache"}
+    if _accepts_gzip(request.headers.get("accept-encoding", "")):
+        gz = _open_epg_gzip_snapshot(st) if f.name == combined_epg_path() else None
+        if gz is not None:
+            f.close()
+            f = gz
+            st = os.fstat(f.fileno())
+            etag_suffix = "-gz"
+            headers["Content-Encoding"] = "gzip"
+
+    headers["ETag"] = f'"{st.st_mtime_ns:x}-{st.st_size:x}{etag_suffix}"'
+    headers["Last-Modified"] = email.utils.formatdate(st.st_mtime, usegmt=True)
+
+    if_none_match = request.headers.get("if-none-match")
+    if_modified_since = request.headers.get("if-modified-since")
+    if (if_none_match is not None and _etag_matches(if_none_match, headers["ETag"])) or (
+        if_none_match is None and if_modified_since and _not_modified_since(if_modified_since, st)
+    ):
+        f.close()
+        return Response(status_code=304, headers=headers)
+
+    headers["Content-Length"] = str(st.st_size)
+    return StreamingResponse(_iter_file(f), media_type="application/xml", headers=headers)
+
+
+@router.get("/api/epg_rebuild")
+def epg_rebuild_status():
+    """Queued/coalesced EPG.xml rebuild statistics."""
+    return JSONResponse(get_epg_rebuild_stats())
+
+@router.post("/api/epg_rebuild/flush")
+def epg_rebuild_flush(timeout: float = Query(30.0, ge=0)):
+    """Publish all queued channel edits to EPG.xml now and wait for it."""
+    flushed = flush_epg_rebuilds(timeout)
+    return JSONResponse({"success": flushed, **get_epg_rebuild_stats()}, status_code=200 if flushed else 504)
+
+
+def _tuner_stream_url(channel_number: int):
+    with get_db() as conn:
+        c = conn.cursor()
+        c.execute("SELECT url FROM channels WHERE channel_number=? AND active=1", (channel_number,))
+        return c.fetchone()
+
 @router.get("/tuner/{channel_number}")
-def tuner_stream(channel_number: int):
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute("SELECT url FROM channels WHERE channel_number=? AND active=1", (channel_number,))
-    row = c.fetchone()
-    conn.close()
+async def tuner_stream(channel_number: int):
+    row = await asyncio.to_thread(_tuner_stream_url, channel_number)
     if not row:
         raise HTTPException(status_code=404, detail="Channel not found or inactive.")
     stream_url = row[0]
     if not stream_url:
         raise HTTPException(status_code=404, detail="Invalid channel URL.")
 
-    shared = get_shared_stream(channel_number, stream_url)
-    subscriber_queue = shared.add_subscriber()
+    try:
+        shared, subscriber = await join_shared_stream(channel_number, stream_url)
+    except TunersBusy as e:
+        print(f"[Tuners] Refused channel {channel_number}: {e}")
+        # Answered the way an HDHomeRun does, so Plex reports "all tuners in use".
+        raise HTTPException(
+            status_code=503,
+            detail="All tuners are in use.",
+            headers={"X-HDHomeRun-Error": "805 All Tuners In Use"}
+        )
+    except Exception as e:
+        print(f"[Stream] Could not start channel {channel_number}: {e}")
+        raise HTTPException(status_code=503, detail="Could not start stream.")
     
-    def streamer():
+    async def streamer():
         try:
-            while True:
-                chunk = subscriber_queue.get()
-                if chunk is None:
-                    break
+            # Chunks are memoryviews into the channel's shared buffer.
+            async for chunk in subscriber:
                 yield chunk
         finally:
-            shared.remove_subscriber(subscriber_queue)
-            from .streaming import streams_lock, shared_streams
-            with streams_lock:
-                if not shared.subscribers:
-                    shared_streams.pop(channel_number, None)
+            # The last subscriber leaving stops the stream, which leaves the
+            # registry once ffmpeg has exited.
+            shared.remove_subscriber(subscriber)
     return StreamingResponse(streamer(), media_type="video/mp2t")
 
 
@@ -214,75 +336,57 @@ def update_channel_number(current_id: int = Form(...), new_id: int = Form(...)):
     
     return RedirectResponse(url="/", status_code=303)
 
+def _shift_channels_from(conn, insert_at):
+    """Write job: move every channel numbered >= insert_at up by one; returns the old numbers."""
+    c = conn.cursor()
+    # Gather affected channel numbers in descending order
+    c.execute(
+        """
+        SELECT channel_number
+          FROM channels
+         WHERE channel_number >= ?
+         ORDER BY channel_number DESC
+        """,
+        (insert_at,)
+    )
+    affected = [r[0] for r in c.fetchall()]
+    # Shift in descending order to avoid collisions
+    for ch_num in affected:
+        c.execute(
+            "UPDATE channels SET channel_number = ? WHERE channel_number = ?",
+            (ch_num + 1, ch_num)
+        )
+    return affected
+
 @router.post("/insert_channel_at")
 def insert_channel_at(insert_at: int = Form(...), swap: bool = Form(False)):
     """
     Shifts all channels with channel_number >= insert_at up by 1 in a single transaction.
     - Performs updates in descending order to avoid unique constraint collisions.
-    - Uses a short IMMEDIATE transaction to reduce lock time.
-    - After commit, updates EPG references for each shifted channel.
+    - Runs as one write job, so the shift is atomic.
+    - After commit, updates EPG references for all shifted channels at once.
     The `swap` parameter is accepted for symmetry with client code but ignored here.
     """
     try:
-        conn = sqlite3.connect(DB_FILE)
-        c = conn.cursor()
-        # Begin a write transaction immediately to avoid waiting during updates
-        c.execute("BEGIN IMMEDIATE")
-
-        # Gather affected channel numbers in descending order
-        c.execute(
-            """
-            SELECT channel_number
-              FROM channels
-             WHERE channel_number >= ?
-             ORDER BY channel_number DESC
-            """,
-            (insert_at,)
-        )
-        rows = c.fetchall()
-        affected = [r[0] for r in rows]
-
+        affected = run_write(_shift_channels_from, insert_at)
         if not affected:
-            c.execute("COMMIT")
-            conn.close()
             return JSONResponse({"success": True, "shifted": 0})
 
-        # Shift in descending order to avoid collisions
-        for ch_num in affected:
-            c.execute(
-                "UPDATE channels SET channel_number = ? WHERE channel_number = ?",
-                (ch_num + 1, ch_num)
-            )
-
-        conn.commit()
-        conn.close()
-
-        # Update EPG references after the DB commit (no DB lock held now)
+        # Update EPG references after the DB commit (no DB lock held now).
+        # swap=False semantics for a pure shift; EPG.xml is rewritten once by
+        # the rebuild scheduler.
         try:
-            for ch_num in affected:
-                # swap=False semantics for a pure shift
-                update_modified_epg(ch_num, ch_num + 1, False)
+            update_modified_epg_bulk([(ch_num, ch_num + 1) for ch_num in affected])
         except Exception as epg_err:
             # Log-only: EPG update failure shouldn't revert DB changes
             print(f"[WARNING] EPG update after insert failed: {epg_err}")
 
         return JSONResponse({"success": True, "shifted": len(affected)})
     except Exception as e:
-        try:
-            # Attempt rollback if transaction was open
-            conn.rollback()
-        except Exception:
-            pass
-        try:
-            conn.close()
-        except Exception:
-            pass
+        # A failed write job is rolled back by the writer
         raise HTTPException(status_code=500, detail=str(e))
 
 
-from fastapi import Response
-from typing import Iterator
-
 @router.get("/insert_channel_at_stream")
 async def insert_channel_at_stream(insert_at: int = Query(...)):
     """
@@ -292,93 +396,64 @@ async def insert_channel_at_stream(insert_at: int = Query(...)):
     It ends with a final event:
       event: done\n
     Notes:
-    - Uses a single IMMEDIATE transaction for the DB updates.
+    - The DB updates run as a single write job; progress for each channel is
+      reported once it has committed.
     - Updates are executed in descending order to avoid unique collisions.
-    - After commit, EPG references are updated and streamed as well.
+    - After commit, EPG references are updated in one pass and the stream
+      waits for the coalesced EPG rebuild before sending `done`.
     """
     async def event_stream():
-        conn = None
         try:
-            conn = sqlite3.connect(DB_FILE)
-            c = conn.cursor()
-            # Acquire write lock up front
-            c.execute("BEGIN IMMEDIATE")
-
-            # Determine affected channels (descending)
-            c.execute(
-                """
-                SELECT channel_number
-                  FROM channels
-                 WHERE channel_number >= ?
-                 ORDER BY channel_number DESC
-                """,
-                (insert_at,)
-            )
-            rows = c.fetchall()
-            affected = [r[0] for r in rows]
-
-            yield f"data: Preparing to shift {len(affected)} channel(s) at and above {insert_at}\n\n"
+            yield f"data: Preparing to shift channels at and above {insert_at}\n\n"
             await asyncio.sleep(0)
 
+            # Wait for the write job off the event loop.
+            affected = await asyncio.to_thread(run_write, _shift_channels_from, insert_at)
+
             if not affected:
-                # Nothing to do; commit and finish
-                conn.commit()
+                # Nothing to do; finish
                 yield "event: done\ndata: {\"shifted\": 0}\n\n"
                 await asyncio.sleep(0)
                 return
 
-            # Perform updates, reporting each step
+            # Report each step
             for idx, ch_num in enumerate(affected):
-                new_num = ch_num + 1
-                c.execute(
-                    "UPDATE channels SET channel_number = ? WHERE channel_number = ?",
-                    (new_num, ch_num)
-                )
-                yield f"data: Shifting channel {ch_num} -> {new_num}\n\n"
+                yield f"data: Shifting channel {ch_num} -> {ch_num + 1}\n\n"
                 await asyncio.sleep(0)
                 if (idx % 10) == 9:
                     # periodic keep-alive comment to defeat buffering
                     yield ": keep-alive\n\n"
                     await asyncio.sleep(0)
 
-            # Commit DB changes
-            conn.commit()
             yield "data: Database commit complete. Finalizing channel shifts…\n\n"
             await asyncio.sleep(0)
 
-            # Update EPG references after commit (no DB lock held)
+            # Update EPG references after commit (no DB lock held), then wait
+            # for the single coalesced EPG.xml rewrite.
             failures = 0
-            for idx, ch_num in enumerate(affected):
-                try:
-                    update_modified_epg(ch_num, ch_num + 1, False)
-                    yield f"data: Shift finalized for channel {ch_num} -> {ch_num + 1}\n\n"
-                    await asyncio.sleep(0)
-                except Exception as epg_err:
-                    failures += 1
-                    yield f"data: [WARN] Finalization step failed for channel {ch_num}: {str(epg_err)}\n\n"
-                    await asyncio.sleep(0)
-                if (idx % 10) == 9:
-                    yield ": keep-alive\n\n"
-                    await asyncio.sleep(0)
+            try:
+                update_modified_epg_bulk([(ch_num, ch_num + 1) for ch_num in affected])
+                yield f"data: Guide references moved for {len(affected)} channel(s). Rebuilding EPG…\n\n"
+                await asyncio.sleep(0)
+                flushed = False
+                while not flushed:
+                    flushed = await asyncio.to_thread(flush_epg_rebuilds, 5)
+                    if not flushed:
+                        yield ": keep-alive\n\n"
+                yield "data: EPG rebuild complete.\n\n"
+                await asyncio.sleep(0)
+            except Exception as epg_err:
+                failures += 1
+                yield f"data: [WARN] EPG finalization failed: {str(epg_err)}\n\n"
+                await asyncio.sleep(0)
 
             yield f"event: done\ndata: {{\"shifted\": {len(affected)}, \"epg_failures\": {failures}}}\n\n"
             await asyncio.sleep(0)
         except Exception as e:
-            # Attempt rollback if possible
-            try:
-                if conn:
-                    conn.rollback()
-            except Exception:
-                pass
+            # A failed write job is rolled back by the writer
             err_msg = str(e).replace("\n", " ")
             yield f"event: error\ndata: {err_msg}\n\n"
             await asyncio.sleep(0)
-        finally:
-            try:
-                if conn:
-                    conn.close()
-            except Exception:
-                pass
 
     return StreamingResponse(
         event_stream(),
@@ -392,21 +467,20 @@ async def insert_channel_at_stream(insert_at: int = Query(...)):
 
 @router.post("/update_channel_active")
 def update_channel_active(channel_id: int = Form(...), active: bool = Form(...)):
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    # Check if the channel has been marked as removed.
-    c.execute("SELECT removed_reason FROM channels WHERE id = ?", (channel_id,))
-    row = c.fetchone()
-    if row and row[0]:
-        conn.close()
-        raise HTTPException(
-            status_code=400,
-            detail=f"This channel was removed from the M3U file and cannot be reactivated."
-        )
+    def set_active(conn):
+        c = conn.cursor()
+        # Check if the channel has been marked as removed.
+        c.execute("SELECT removed_reason FROM channels WHERE id = ?", (channel_id,))
+        row = c.fetchone()
+        if row and row[0]:
+            raise HTTPException(
+                status_code=400,
+                detail=f"This channel was removed from the M3U file and cannot be reactivated."
+            )
     
-    c.execute("UPDATE channels SET active = ? WHERE id = ?", (1 if active else 0, channel_id))
-    conn.commit()
-    conn.close()
+        c.execute("UPDATE channels SET active = ? WHERE id = ?", (1 if active else 0, channel_id))
+
+    run_write(set_active)
 
     # If activating, update its EPG.
     if active:
@@ -417,28 +491,25 @@ def update_channel_active(channel_id: int = Form(...), active: bool = Form(...))
 @router.post("/update_channels_active_bulk")
 def update_channels_active_bulk(channel_ids: str = Form(...), active: bool = Form(...)):
     ids = [cid.strip() for cid in channel_ids.split(',') if cid.strip()]
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    data = [(1 if active else 0, cid) for cid in ids]
-    c.executemany("UPDATE channels SET active = ? WHERE id = ?", data)
-    conn.commit()
-    conn.close()
+    def set_active(conn):
+        data = [(1 if active else 0, cid) for cid in ids]
+        conn.executemany("UPDATE channels SET active = ? WHERE id = ?", data)
 
-    # Partial EPG update for each newly activated channel
+    run_write(set_active)
+
+    # Partial EPG update for all newly activated channels at once
     if active:
-        for channel_id in ids:
-            update_program_data_for_channel(int(channel_id))
+        update_program_data_for_channels(ids)
     
     return JSONResponse({"success": True})
 
 
 @router.post("/update_channel_logo")
 def update_channel_logo(channel_id: int = Form(...), new_logo: str = Form(...)):
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute("UPDATE channels SET logo_url = ? WHERE id = ?", (new_logo, channel_id))
-    conn.commit()
-    conn.close()
+    def set_logo(conn):
+        conn.execute("UPDATE channels SET logo_url = ? WHERE id = ?", (new_logo, channel_id))
+
+    run_write(set_logo)
 
     # Reflect this new logo in the EPG.xml
     update_channel_logo_in_epg(channel_id, new_logo)
@@ -453,18 +524,17 @@ def update_channel_name(channel_id: int = Form(...), new_name: str = Form(...)):
     We'll fetch the channel's current logo so it doesn't get lost.
     """
     try:
-        conn = sqlite3.connect(DB_FILE)
-        c = conn.cursor()
-        c.execute("SELECT logo_url FROM channels WHERE id = ?", (channel_id,))
-        row = c.fetchone()
-        if not row:
-            conn.close()
-            raise HTTPException(status_code=404, detail="Channel not found.")
-        existing_logo = row[0] or ""
+        def rename(conn):
+            c = conn.cursor()
+            c.execute("SELECT logo_url FROM channels WHERE id = ?", (channel_id,))
+            row = c.fetchone()
+            if not row:
+                raise HTTPException(status_code=404, detail="Channel not found.")
         
-        c.execute("UPDATE channels SET name = ? WHERE id = ?", (new_name, channel_id))
-        conn.commit()
-        conn.close()
+            c.execute("UPDATE channels SET name = ? WHERE id = ?", (new_name, channel_id))
+            return row[0] or ""
+
+        existing_logo = run_write(rename)
 
         # CHANGED: Update the EPG <channel> node to reflect the new name
         update_channel_metadata_in_epg(channel_id, new_name, existing_logo)
@@ -476,15 +546,14 @@ def update_channel_name(channel_id: int = Form(...), new_name: str = Form(...)):
 @router.post("/update_channel_category")
 def update_channel_category(channel_id: int = Form(...), new_category: str = Form(...)):
     try:
-        conn = sqlite3.connect(DB_FILE)
-        c = conn.cursor()
-        c.execute("SELECT id FROM channels WHERE id = ?", (channel_id,))
-        if not c.fetchone():
-            conn.close()
-            raise HTTPException(status_code=404, detail="Channel not found.")
-        c.execute("UPDATE channels SET group_title = ? WHERE id = ?", (new_category, channel_id))
-        conn.commit()
-        conn.close()
+        def set_category(conn):
+            c = conn.cursor()
+            c.execute("SELECT id FROM channels WHERE id = ?", (channel_id,))
+            if not c.fetchone():
+                raise HTTPException(status_code=404, detail="Channel not found.")
+            c.execute("UPDATE channels SET group_title = ? WHERE id = ?", (new_category, channel_id))
+
+        run_write(set_category)
         return JSONResponse({"success": True})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -503,37 +572,36 @@ def get_epg_entries(search: str = Query("", min_length=0), raw_file: str = Query
     If 'raw_file' is provided, we also filter by raw_epg_file.
     """
 
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
+    with get_db() as conn:
+        c = conn.cursor()
 
-    # Build a dynamic WHERE clause to handle search and raw_file.
-    where_clauses = []
-    params = []
+        # Build a dynamic WHERE clause to handle search and raw_file.
+        where_clauses = []
+        params = []
 
-    if search:
-        where_clauses.append("LOWER(rec.display_name) LIKE LOWER(?)")
-        params.append(f"%{search.lower()}%")
+        if search:
+            where_clauses.append("LOWER(rec.display_name) LIKE LOWER(?)")
+            params.append(f"%{search.lower()}%")
 
-    if raw_file:
-        where_clauses.append("rep.raw_epg_file = ?")
-        params.append(raw_file)
+        if raw_file:
+            where_clauses.append("rep.raw_epg_file = ?")
+            params.append(raw_file)
 
-    # Base query with join so we can retrieve raw_epg_file
-    query = """
-        SELECT DISTINCT rec.display_name, rep.raw_epg_file
-        FROM raw_epg_channels rec
-        JOIN raw_epg_programs rep ON rep.raw_channel_id = rec.raw_id
-    """
+        # Base query with join so we can retrieve raw_epg_file
+        query = """
+            SELECT DISTINCT rec.display_name, rep.raw_epg_file
+            FROM raw_epg_channels rec
+            JOIN raw_epg_programs rep ON rep.raw_channel_id = rec.raw_id
+        """
 
-    # If we have any filters, append WHERE
-    if where_clauses:
-        query += " WHERE " + " AND ".join(where_clauses)
+        # If we have any filters, append WHERE
+        if where_clauses:
+            query += " WHERE " + " AND ".join(where_clauses)
 
-    query += " ORDER BY rec.display_name"
+        query += " ORDER BY rec.display_name"
 
-    c.execute(query, params)
-    rows = c.fetchall()
-    conn.close()
+        c.execute(query, params)
+        rows = c.fetchall()
 
     # Load your EPG color mapping, e.g. { "EPG1.xml": "#ffcc00", ... }
     color_map = load_epg_color_mapping()
@@ -559,16 +627,16 @@ def update_epg_entry(channel_id: int = Form(...), new_epg_entry: str = Form(...)
     Allows changing the tvg_name for a single channel, then partial re-parse.
     """
     try:
-        conn = sqlite3.connect(DB_FILE)
-        c = conn.cursor()
-        c.execute("SELECT tvg_name FROM channels WHERE id = ?", (channel_id,))
-        row = c.fetchone()
-        if not row:
-            conn.close()
+        def set_epg_entry(conn):
+            c = conn.cursor()
+            c.execute("SELECT tvg_name FROM channels WHERE id = ?", (channel_id,))
+            if not c.fetchone():
+                return False
+            c.execute("UPDATE channels SET tvg_name = ? WHERE id = ?", (new_epg_entry, channel_id))
+            return True
+
+        if not run_write(set_epg_entry):
             return JSONResponse({"success": False, "error": "Channel not found."})
-        c.execute("UPDATE channels SET tvg_name = ? WHERE id = ?", (new_epg_entry, channel_id))
-        conn.commit()
-        conn.close()
 
         update_program_data_for_channel(channel_id)
         return JSONResponse({"success": True})
@@ -578,31 +646,104 @@ def update_epg_entry(channel_id: int = Form(...), new_epg_entry: str = Form(...)
 
 @router.get("/api/current_program")
 def get_current_program(channel_id: int):
-    now = datetime.datetime.utcnow().strftime("%Y%m%d%H%M%S") + " +0000"
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute("""
-        SELECT title, start, stop, description
-        FROM epg_programs
-        WHERE channel_tvg_name = ? AND start <= ? AND stop > ?
-        ORDER BY start DESC
-        LIMIT 1
-    """, (str(channel_id), now, now))
-    row = c.fetchone()
-    conn.close()
-    if row:
-        return JSONResponse({"title": row[0], "start": row[1], "stop": row[2], "description": row[3]})
+    program = now_playing_program(channel_id)
+    if program:
+        return JSONResponse({
+            "title": program["title"], "start": program["start"],
+            "stop": program["stop"], "description": program["description"]
+        })
     else:
         return JSONResponse({"title": "No Program", "start": "", "stop": "", "description": ""})
 
 
+# ----------------------------------------------------
+# Bulk now playing (+ server-sent updates)
+# ----------------------------------------------------
+# How often an open /api/now_playing/stream checks the cache state. This is an
+# in-memory comparison; the guide is only re-read when a programme boundary
+# passed or the EPG changed.
+NOW_PLAYING_STREAM_CHECK_SECONDS = 1
+NOW_PLAYING_STREAM_KEEPALIVE_SECONDS = 15
+
+def _public_program(program):
+    if not program:
+        return None
+    return {
+        "title": program["title"], "start": program["start"],
+        "stop": program["stop"], "description": program["description"]
+    }
+
+def _active_now_playing():
+    """{channel_number (str): {"now": ..., "next": ...}} for every active channel."""
+    snapshot = get_now_playing()
+    with get_db() as conn:
+        c = conn.cursor()
+        c.execute("SELECT channel_number FROM channels WHERE active = 1 ORDER BY channel_number")
+        numbers = [row[0] for row in c.fetchall()]
+    view = {}
+    for channel_number in numbers:
+        entry = snapshot.get(channel_number) or {}
+        view[str(channel_number)] = {
+            "now": _public_program(entry.get("now")),
+            "next": _public_program(entry.get("next")),
+        }
+    return view
+
+@router.get("/api/now_playing")
+def get_now_playing_all():
+    """Current and next program of all active channels in one response."""
+    channels = _active_now_playing()
+    _, expires_at = get_now_playing_state()
+    return JSONResponse({"channels": channels, "expires_at": expires_at, "cache": get_now_playing_stats()})
+
+@router.get("/api/now_playing/stream")
+async def now_playing_stream(request: Request):
+    """
+    Server-Sent Events: one `snapshot` event with the /api/now_playing
+    channels, then an `update` event carrying only the channels whose
+    now/next changed, whenever a programme boundary passes or the EPG is
+    rebuilt (channels no longer active are sent as null).
+    """
+    async def event_stream():
+        current = await asyncio.to_thread(_active_now_playing)
+        state = get_now_playing_state()
+        yield f"event: snapshot\ndata: {json.dumps(current)}\n\n"
+        idle = 0
+        while not await request.is_disconnected():
+            await asyncio.sleep(NOW_PLAYING_STREAM_CHECK_SECONDS)
+            version, expires_at = get_now_playing_state()
+            if version == state[0] and 0 < expires_at and time.time() < expires_at:
+                idle += NOW_PLAYING_STREAM_CHECK_SECONDS
+                if idle >= NOW_PLAYING_STREAM_KEEPALIVE_SECONDS:
+                    idle = 0
+                    yield ": keep-alive\n\n"
+                continue
+            latest = await asyncio.to_thread(_active_now_playing)
+            state = get_now_playing_state()
+            changed = {n: v for n, v in latest.items() if current.get(n) != v}
+            changed.update({n: None for n in current if n not in latest})
+            current = latest
+            if changed:
+                idle = 0
+                yield f"event: update\ndata: {json.dumps(changed)}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache, no-transform",
+            "Connection": "keep-alive",
+            "X-Accel-Buffering": "no"
+        }
+    )
+
+
 @router.get("/probe_stream")
 def probe_stream(channel_id: int = Query(..., description="The channel ID to probe")):
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute("SELECT url FROM channels WHERE id = ?", (channel_id,))
-    row = c.fetchone()
-    conn.close()
+    with get_db() as conn:
+        c = conn.cursor()
+        c.execute("SELECT url FROM channels WHERE id = ?", (channel_id,))
+        row = c.fetchone()
     if not row:
         raise HTTPException(status_code=404, detail="Channel not found.")
     stream_url = row[0]
@@ -662,42 +803,48 @@ def update_channel_properties(
       - update channel_name or channel_number in EPG.xml
     """
     try:
-        conn = sqlite3.connect(DB_FILE)
-        c = conn.cursor()
-        c.execute("SELECT tvg_name, active, channel_number, logo_url, name FROM channels WHERE id = ?", (channel_id,))
-        row = c.fetchone()
+        def edit_channel(conn):
+            c = conn.cursor()
+            c.execute("SELECT tvg_name, active, channel_number, logo_url, name FROM channels WHERE id = ?", (channel_id,))
+            row = c.fetchone()
+            if not row:
+                return None, None
+            old_channel_number = row[2]
+
+            # If the channel_number changed, do the swap (inline, in this job)
+            # and move its guide rows along; EPG.xml follows after the commit.
+            updated_channel_number = old_channel_number
+            swap = None
+            if old_channel_number != new_channel_number:
+                swap = swap_channel_numbers(old_channel_number, new_channel_number)
+                updated_channel_number = new_channel_number
+                move_epg_programs(conn, old_channel_number, new_channel_number, swap)
+
+            # Update the channel record
+            c.execute("""
+                UPDATE channels
+                   SET name = ?,
+                       group_title = ?,
+                       logo_url = ?,
+                       tvg_name = ?,
+                       active = ?,
+                       channel_number = ?
+                 WHERE id = ?
+            """, (new_name, new_category, new_logo, new_epg_entry, new_active, updated_channel_number, channel_id))
+            return row, swap
+
+        row, swap = run_write(edit_channel)
         if not row:
-            conn.close()
             return JSONResponse({"success": False, "error": "Channel not found."})
+        if swap is not None:
+            # CHANGED: reflect the renumbering in EPG.xml
+            invalidate_now_playing()
+            schedule_epg_refresh([row[2], new_channel_number])
         old_epg_entry = row[0] if row[0] else ""
         old_active = row[1]
-        old_channel_number = row[2]
         old_logo = row[3] if row[3] else ""
         old_name = row[4] if row[4] else ""
 
-        # If the channel_number changed, do the swap
-        updated_channel_number = old_channel_number
-        swap = False
-        if old_channel_number != new_channel_number:
-            swap = swap_channel_numbers(old_channel_number, new_channel_number)
-            updated_channel_number = new_channel_number
-            # CHANGED: reflect this in EPG.xml
-            update_modified_epg(old_channel_number, new_channel_number, swap)
-
-        # Update the channel record
-        c.execute("""
-            UPDATE channels
-               SET name = ?,
-                   group_title = ?,
-                   logo_url = ?,
-                   tvg_name = ?,
-                   active = ?,
-                   channel_number = ?
-             WHERE id = ?
-        """, (new_name, new_category, new_logo, new_epg_entry, new_active, updated_channel_number, channel_id))
-        conn.commit()
-        conn.close()
-
         # If the user changed the channel name or logo, reflect in EPG.xml
         if new_name != old_name or new_logo != old_logo:
             update_channel_metadata_in_epg(channel_id, new_name, new_logo)
@@ -711,56 +858,50 @@ def update_channel_properties(
         return JSONResponse({"success": False, "error": str(e)})
 
 
-import sqlite3
-from fastapi import Form
-from fastapi.responses import JSONResponse
-from .config import DB_FILE
-
 @router.post("/auto_number_channels")
 def auto_number_channels(
     start_number: int = Form(...),
     channel_ids: str = Form(...)
 ):
     try:
-        conn = sqlite3.connect(DB_FILE)
-        c = conn.cursor()
-
         # Parse the provided channel IDs into a list of integers.
         filtered_ids = [int(x.strip()) for x in channel_ids.split(",") if x.strip()]
         if not filtered_ids:
             return JSONResponse({"success": False, "message": "No channels provided."})
 
-        n = len(filtered_ids)
-        target_min = start_number
-        target_max = start_number + n - 1
-
-        # Step 1: Temporarily assign filtered channels a negative value
-        # to free up the target range.
-        for ch_id in filtered_ids:
-            temp_value = -abs(ch_id)
-            c.execute("UPDATE channels SET channel_number = ? WHERE id = ?", (temp_value, ch_id))
-
-        # Step 2: For each unfiltered channel, if its channel_number falls within
-        # the target range, reassign it the next highest channel number.
-        placeholders = ",".join("?" for _ in filtered_ids)
-        c.execute(f"SELECT id, channel_number FROM channels WHERE id NOT IN ({placeholders})", filtered_ids)
-        unfiltered_channels = c.fetchall()
-        for uc_id, uc_num in unfiltered_channels:
-            if target_min <= uc_num <= target_max:
-                c.execute("SELECT MAX(channel_number) FROM channels")
-                current_max = c.fetchone()[0]
-                if current_max is None:
-                    current_max = 0
-                new_num = current_max + 1
-                c.execute("UPDATE channels SET channel_number = ? WHERE id = ?", (new_num, uc_id))
-
-        # Step 3: Assign the final sequential numbers to the filtered channels.
-        for i, ch_id in enumerate(filtered_ids):
-            final_number = start_number + i
-            c.execute("UPDATE channels SET channel_number = ? WHERE id = ?", (final_number, ch_id))
-
-        conn.commit()
-        conn.close()
+        def renumber(conn):
+            c = conn.cursor()
+
+            n = len(filtered_ids)
+            target_min = start_number
+            target_max = start_number + n - 1
+
+            # Step 1: Temporarily assign filtered channels a negative value
+            # to free up the target range.
+            for ch_id in filtered_ids:
+                temp_value = -abs(ch_id)
+                c.execute("UPDATE channels SET channel_number = ? WHERE id = ?", (temp_value, ch_id))
+
+            # Step 2: For each unfiltered channel, if its channel_number falls within
+            # the target range, reassign it the next highest channel number.
+            placeholders = ",".join("?" for _ in filtered_ids)
+            c.execute(f"SELECT id, channel_number FROM channels WHERE id NOT IN ({placeholders})", filtered_ids)
+            unfiltered_channels = c.fetchall()
+            for uc_id, uc_num in unfiltered_channels:
+                if target_min <= uc_num <= target_max:
+                    c.execute("SELECT MAX(channel_number) FROM channels")
+                    current_max = c.fetchone()[0]
+                    if current_max is None:
+                        current_max = 0
+                    new_num = current_max + 1
+                    c.execute("UPDATE channels SET channel_number = ? WHERE id = ?", (new_num, uc_id))
+
+            # Step 3: Assign the final sequential numbers to the filtered channels.
+            for i, ch_id in enumerate(filtered_ids):
+                final_number = start_number + i
+                c.execute("UPDATE channels SET channel_number = ? WHERE id = ?", (final_number, ch_id))
+
+        run_write(renumber)
 
         return JSONResponse({"success": True, "message": "Filtered channels renumbered successfully."})
     except Exception as e:
@@ -768,16 +909,15 @@ def auto_number_channels(
 
 @router.get("/api/epg_filenames")
 def get_epg_filenames():
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute("""
-        SELECT DISTINCT raw_epg_file
-          FROM raw_epg_programs
-         WHERE raw_epg_file IS NOT NULL AND raw_epg_file != ''
-         ORDER BY raw_epg_file
-    """)
-    rows = c.fetchall()
-    conn.close()
+    with get_db() as conn:
+        c = conn.cursor()
+        c.execute("""
+            SELECT DISTINCT raw_epg_file
+              FROM raw_epg_programs
+             WHERE raw_epg_file IS NOT NULL AND raw_epg_file != ''
+             ORDER BY raw_epg_file
+        """)
+        rows = c.fetchall()
     filenames = [row[0] for row in rows]
     return JSONResponse(filenames)
 
@@ -790,13 +930,12 @@ def delete_channel(channel_id: int = Form(...)):
     - Rebuilds the combined EPG (thus removing it from the channel table and lineup.json).
     """
     try:
-        # Open connection and get channel details.
-        conn = sqlite3.connect(DB_FILE)
-        c = conn.cursor()
-        c.execute("SELECT id, name, channel_number FROM channels WHERE id = ?", (channel_id,))
-        row = c.fetchone()
+        # Get channel details.
+        with get_db() as conn:
+            c = conn.cursor()
+            c.execute("SELECT id, name, channel_number FROM channels WHERE id = ?", (channel_id,))
+            row = c.fetchone()
         if not row:
-            conn.close()
             raise HTTPException(status_code=404, detail="Channel not found.")
         ch_id, ch_name, ch_number = row
         
@@ -808,15 +947,15 @@ def delete_channel(channel_id: int = Form(...)):
             print(f"[WARNING] Could not clear stream for channel number {ch_number}: {e}")
         
         # Delete the channel from the database.
-        c.execute("DELETE FROM channels WHERE id = ?", (channel_id,))
-        conn.commit()
-        conn.close()
+        def delete(conn):
+            conn.execute("DELETE FROM channels WHERE id = ?", (channel_id,))
+
+        run_write(delete)
 
-        # Rebuild the EPG to remove the channel from the output.
-        parse_raw_epg_files()
-        build_combined_epg()
+        # Rebuild the EPG to remove the channel from the output, in the background.
+        job = submit_epg_rebuild()
 
-        return JSONResponse({"success": True, "message": f"Channel '{ch_name}' has been deleted."})
+        return JSONResponse({"success": True, "message": f"Channel '{ch_name}' has been deleted.", "job_id": job.id})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -7,8 +7,8 @@ from fastapi import APIRouter, Request, Form, HTTPException, UploadFile, File
 from fastapi.responses import RedirectResponse, HTMLResponse, JSONResponse
 from fastapi.templating import Jinja2Templates
 from .config import CONFIG_FILE_PATH, M3U_DIR, EPG_DIR, MODIFIED_EPG_DIR, DB_FILE, LOGOS_DIR, CUSTOM_LOGOS_DIR, TUNER_COUNT, config
-from .epg import parse_raw_epg_files, build_combined_epg, load_epg_color_mapping, save_epg_color_mapping, get_color_for_epg_file
-from .tasks import start_epg_reparse_task
+from .epg import load_epg_color_mapping, save_epg_color_mapping, get_color_for_epg_file
+from .tasks import start_epg_reparse_task, submit_epg_reparse, submit_m3u_load
 
 from .streaming import (
     list_ffmpeg_profiles,
@@ -135,6 +135,10 @@ async def update_config(
     
     return RedirectResponse(url="/settings?updated=true", status_code=303)
 
+def _save_upload(file: UploadFile, destination: str):
+    with open(destination, "wb") as buffer:
+        shutil.copyfileobj(file.file, buffer)
+
 @router.post("/upload_epg")
 async def upload_epg(file: UploadFile = File(...)):
     allowed_exts = [".xml", ".xmltv", ".gz"]
@@ -145,20 +149,17 @@ async def upload_epg(file: UploadFile = File(...)):
     
     destination = os.path.join(EPG_DIR, filename)
     try:
-        with open(destination, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        # Copy off the event loop; uploads can be large.
+        await asyncio.to_thread(_save_upload, file, destination)
     except Exception as e:
         raise HTTPException(status_code=500, detail="Could not save file: " + str(e))
     finally:
         file.file.close()
     
-    try:
-        parse_raw_epg_files()
-        build_combined_epg()  # Keep the global rebuild after uploading a new EPG
-    except Exception as e:
-        raise HTTPException(status_code=500, detail="Error re-parsing EPG files: " + str(e))
-    
-    return {"success": True, "message": "EPG file uploaded and parsed successfully."}
+    # Only the new/replaced file is parsed; the rebuild covers all channels.
+    # Follow the re-parse through /api/jobs/{job_id}.
+    job = submit_epg_reparse()
+    return {"success": True, "message": "EPG file uploaded; parsing in the background.", "job_id": job.id}
 
 @router.post("/upload_m3u")
 async def upload_m3u(file: UploadFile = File(...)):
@@ -178,26 +179,21 @@ async def upload_m3u(file: UploadFile = File(...)):
     
     destination = os.path.join(M3U_DIR, filename)
     try:
-        with open(destination, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        # Copy off the event loop; uploads can be large.
+        await asyncio.to_thread(_save_upload, file, destination)
     except Exception as e:
         raise HTTPException(status_code=500, detail="Could not save file: " + str(e))
     finally:
         file.file.close()
     
-    from .m3u import load_m3u_files
-    load_m3u_files()
-    
-    return {"success": True, "message": "M3U file uploaded successfully."}
+    job = submit_m3u_load()
+    return {"success": True, "message": "M3U file uploaded; loading channels in the background.", "job_id": job.id}
 
 @router.post("/parse_epg")
 def parse_epg():
-    try:
-        parse_raw_epg_files()
-        build_combined_epg()  # Full rebuild on explicit user request
-        return {"success": True, "message": "EPG parsed successfully."}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    # Full re-parse and rebuild on explicit user request
+    job = submit_epg_reparse(force=True)
+    return {"success": True, "message": "EPG parsing started.", "job_id": job.id}
 
 @router.post("/delete_epg")
 def delete_epg(filename: str = Form(...)):
@@ -208,12 +204,9 @@ def delete_epg(filename: str = Form(...)):
         os.remove(file_path)
     except Exception as e:
         return {"success": False, "message": "Error deleting file: " + str(e)}
-    try:
-        parse_raw_epg_files()
-        build_combined_epg()  # Rebuild after removing an EPG file
-    except Exception as e:
-        return {"success": False, "message": "Error re-parsing EPG files: " + str(e)}
-    return {"success": True, "message": "EPG file deleted and EPG re-parsed successfully."}
+    # Drops only the deleted file's raw rows, then rebuilds.
+    job = submit_epg_reparse()
+    return {"success": True, "message": "EPG file deleted; re-parsing in the background.", "job_id": job.id}
 
 @router.post("/update_epg_color")
 def update_epg_color(filename: str = Form(...), color: str = Form(...)):
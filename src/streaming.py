@@ -1,7 +1,11 @@
-import subprocess
+import asyncio
+import collections
+import os
 import threading
-import queue
-from .config import config  # access runtime ffmpeg/gpu decisions
+import time
+from .config import (  # access runtime ffmpeg/gpu decisions
+    config, STREAM_READ_KB, STREAM_BUFFER_KB, STREAM_SLOW_CLIENT_POLICY, STREAM_BURST_KB
+)
 import sqlite3
 import shlex
 
@@ -148,119 +152,970 @@ def build_ffmpeg_command(stream_url: str) -> list[str]:
 
     return cmd
 
+# ----------------------------------------------------
+# Shared streams
+# ----------------------------------------------------
+# One ffmpeg process feeds every viewer of a channel. Everything here runs on
+# the asyncio event loop: ffmpeg is started with asyncio.create_subprocess_exec,
+# its stdout is read when the loop reports it readable, and each viewer is a
+# coroutine iterating a StreamSubscriber, so a viewer costs no thread.
+#
+# ffmpeg's output goes into a StreamBuffer, a ring of the most recent chunks,
+# and each StreamSubscriber has its own read cursor into that ring. A chunk is
+# stored once, as an immutable bytes object, and handed to every subscriber as
+# a memoryview of it, so fan-out costs no per-subscriber copies or queues and a
+# channel's memory is bounded by STREAM_BUFFER_KB however many viewers it has.
+#
+# A subscriber whose cursor falls out of the ring (a stalled client) is
+# handled by STREAM_SLOW_CLIENT_POLICY: "skip" moves it ahead to the newest
+# chunk, "disconnect" ends its stream.
+#
+# A viewer joining a stream that is already running starts at the newest
+# keyframe still in the ring, preceded by the PAT and PMT in force there, so
+# its player can decode the first frame it gets instead of waiting for the
+# next keyframe (and sometimes timing out its initial probe). TsIndexer finds
+# those positions as chunks are written. Streams with no keyframe in the ring
+# yet (or none found) start STREAM_BURST_KB behind the live edge instead. A
+# lapped subscriber under the "skip" policy resumes at the newest keyframe too.
+TS_PACKET_SIZE = 188
+TS_SYNC_BYTE = 0x47
+# Chunks are whole MPEG-TS packets, so a subscriber never starts or skips
+# mid-packet.
+STREAM_CHUNK_SIZE = max(1, STREAM_READ_KB * 1024 // TS_PACKET_SIZE) * TS_PACKET_SIZE
+# Pipe capacity requested for ffmpeg's stdout (Linux), so it can run ahead of
+# a briefly busy reader.
+STREAM_PIPE_SIZE = 1024 * 1024
+STREAM_SLOW_CLIENT_POLICIES = ("skip", "disconnect")
+# ffmpeg stderr lines kept for the log line printed when a stream ends.
+STREAM_STDERR_TAIL = 10
+
+class StreamBuffer:
+    """Ring of a stream's most recent chunks. Event-loop only."""
+    def __init__(self, capacity_bytes=STREAM_BUFFER_KB * 1024, chunk_size=STREAM_CHUNK_SIZE):
+        self.slots = max(4, capacity_bytes // chunk_size)
+        self._ring = [None] * self.slots
+        self._seq = 0  # sequence number of the next chunk written
+        self._closed = False
+        self._waiter = None
+        self._stats = {"chunks": 0, "bytes": 0}
+        self.index = TsIndexer()
+
+    @property
+    def oldest(self) -> int:
+        """Sequence number of the oldest chunk still in the ring."""
+        return max(0, self._seq - self.slots)
+
+    @property
+    def live(self) -> int:
+        """Sequence number of the next chunk to be written."""
+        return self._seq
+
+    def write(self, chunk: bytes):
+        self.index.scan(chunk, self._seq)
+        self._ring[self._seq % self.slots] = chunk
+        self._seq += 1
+        self._stats["chunks"] += 1
+        self._stats["bytes"] += len(chunk)
+        self.wake()
+
+    def close(self):
+        self._closed = True
+        self.wake()
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def get(self, seq):
+        """Chunk `seq`; the caller checked oldest <= seq < live."""
+        return self._ring[seq % self.slots]
+
+    def burst_start(self, nbytes) -> int:
+        """Sequence number of the oldest chunk among the newest `nbytes` in the ring."""
+        seq, held = self._seq, 0
+        while seq > self.oldest and held < nbytes:
+            seq -= 1
+            held += len(self._ring[seq % self.slots])
+        return seq
+
+    def keyframe_start(self):
+        """
+        (views, seq) to start a subscriber at the newest keyframe still in the
+        ring: `views` (PAT, PMT and the keyframe's chunk from the keyframe on)
+        are sent first, then chunks from `seq`. None if there is no such
+        keyframe.
+        """
+        keyframe = self.index.keyframe
+        if keyframe is None:
+            return None
+        seq, offset, tables = keyframe
+        if seq < self.oldest or seq >= self._seq:
+            return None
+        views = [memoryview(tables)] if tables else []
+        views.append(memoryview(self.get(seq))[offset:])
+        return views, seq + 1
+
+    def wake(self):
+        """Wake every subscriber waiting in wait()."""
+        if self._waiter is not None:
+            if not self._waiter.done():
+                self._waiter.set_result(None)
+            self._waiter = None
+
+    async def wait(self):
+        """Wait for the next write, close or wake(). All waiters share one future."""
+        if self._waiter is None:
+            self._waiter = asyncio.get_running_loop().create_future()
+        # Shielded: a cancelled viewer must not cancel everyone's future.
+        await asyncio.shield(self._waiter)
+
+    def stats(self) -> dict:
+        held = sum(len(c) for c in self._ring if c is not None)
+        keyframe = self.index.keyframe
+        return {
+            **self._stats,
+            "slots": self.slots,
+            "held_bytes": held,
+            **self.index.stats(),
+            "keyframe_age_chunks": self._seq - keyframe[0] if keyframe else None,
+        }
+
+# PMT stream types of video elementary streams, and the NAL unit types /
+# start codes that begin a keyframe in each.
+_TS_VIDEO_STREAM_TYPES = {0x01: "mpeg2", 0x02: "mpeg2", 0x10: "mpeg4", 0x1B: "h264", 0x24: "hevc"}
+_H264_KEYFRAME_NALS = {5, 7}            # IDR slice, SPS
+_HEVC_KEYFRAME_NALS = set(range(16, 22)) | {32, 33}  # IRAP slices, VPS, SPS
+# Maps each packet's second header byte to 1 if payload_unit_start is set.
+_TS_PUSI = bytes(1 if b & 0x40 else 0 for b in range(256))
+
+class TsIndexer:
+    """
+    Lightweight MPEG-TS parsing of a stream's output: keeps the latest PAT
+    and PMT packets and the position of the newest keyframe, which is a
+    packet of the video PID that starts a PES and either has the
+    random_access_indicator set (ffmpeg sets it on keyframes) or whose
+    payload starts with a keyframe NAL unit / MPEG-2 sequence header.
+
+    Only packets with payload_unit_start set are looked at, found with
+    C-speed slicing, so the cost is a few dozen packets per second, not one
+    per packet. PAT and PMT are assumed to fit one packet each (as ffmpeg
+    writes them); CRCs are not checked.
+    """
+    def __init__(self):
+        self.pat = None
+        self.pmt = None
+        self.pmt_pid = None
+        self.video_pid = None
+        self.video_type = None
+        self.tables = b""
+        # (chunk seq, byte offset of the keyframe packet, PAT+PMT at that time)
+        self.keyframe = None
+        self.keyframes = 0
+        self.random_access_flags = 0
+
+    def scan(self, chunk, seq):
+        flags = chunk[1::TS_PACKET_SIZE].translate(_TS_PUSI)
+        i = flags.find(1)
+        while i >= 0:
+            offset = i * TS_PACKET_SIZE
+            pid = ((chunk[offset + 1] & 0x1F) << 8) | chunk[offset + 2]
+            if pid == 0:
+                self._on_pat(chunk[offset:offset + TS_PACKET_SIZE])
+            elif pid == self.pmt_pid:
+                self._on_pmt(chunk[offset:offset + TS_PACKET_SIZE])
+            elif pid == self.video_pid and self._is_keyframe(chunk, offset):
+                self.keyframe = (seq, offset, self.tables)
+                self.keyframes += 1
+            i = flags.find(1, i + 1)
+
+    @staticmethod
+    def _payload(packet):
+        """(payload start, adaptation field flags byte or 0) of a packet."""
+        control = (packet[3] >> 4) & 0x3
+        start, af_flags = 4, 0
+        if control & 0x2:
+            af_length = packet[4]
+            if af_length:
+                af_flags = packet[5]
+            start = 5 + af_length
+        if not control & 0x1:
+            start = TS_PACKET_SIZE
+        return min(start, TS_PACKET_SIZE), af_flags
+
+    def _section(self, packet, table_id):
+        start, _ = self._payload(packet)
+        if start >= TS_PACKET_SIZE:
+            return None
+        start += 1 + packet[start]  # pointer_field
+        if start + 3 > TS_PACKET_SIZE or packet[start] != table_id:
+            return None
+        length = ((packet[start + 1] & 0x0F) << 8) | packet[start + 2]
+        # Section body after the 8-byte header, without the CRC.
+        return packet[start + 8:min(start + 3 + length - 4, TS_PACKET_SIZE)]
+
+    def _on_pat(self, packet):
+        body = self._section(packet, 0x00)
+        if body is None:
+            return
+        for i in range(0, len(body) - 3, 4):
+            program = (body[i] << 8) | body[i + 1]
+            if program:
+                # First program only; ffmpeg writes one per output.
+                self.pat = bytes(packet)
+                self.pmt_pid = ((body[i + 2] & 0x1F) << 8) | body[i + 3]
+                break
+        self.tables = (self.pat or b"") + (self.pmt or b"")
+
+    def _on_pmt(self, packet):
+        body = self._section(packet, 0x02)
+        if body is None or len(body) < 4:
+            return
+        self.pmt = bytes(packet)
+        i = 4 + (((body[2] & 0x0F) << 8) | body[3])  # skip PCR PID, program info
+        while i + 5 <= len(body):
+            stream_type = body[i]
+            pid = ((body[i + 1] & 0x1F) << 8) | body[i + 2]
+            if stream_type in _TS_VIDEO_STREAM_TYPES:
+                self.video_pid, self.video_type = pid, _TS_VIDEO_STREAM_TYPES[stream_type]
+                break
+            i += 5 + (((body[i + 3] & 0x0F) << 8) | body[i + 4])
+        self.tables = (self.pat or b"") + self.pmt
+
+    def _is_keyframe(self, chunk, offset):
+        packet = chunk[offset:offset + TS_PACKET_SIZE]
+        start, af_flags = self._payload(packet)
+        if af_flags & 0x40:
+            self.random_access_flags += 1
+            return True
+        if start + 9 > TS_PACKET_SIZE or packet[start:start + 3] != b"\x00\x00\x01":
+            return False
+        # Skip the PES header to the elementary stream data.
+        es = packet[start + 9 + packet[start + 8]:]
+        if self.video_type in ("mpeg2", "mpeg4"):
+            return b"\x00\x00\x01\xb3" in es or b"\x00\x00\x01\xb0" in es
+        i = es.find(b"\x00\x00\x01")
+        while 0 <= i < len(es) - 3:
+            nal = es[i + 3]
+            if self.video_type == "hevc":
+                if (nal >> 1) & 0x3F in _HEVC_KEYFRAME_NALS:
+                    return True
+            elif nal & 0x1F in _H264_KEYFRAME_NALS:
+                return True
+            i = es.find(b"\x00\x00\x01", i + 3)
+        return False
+
+    def stats(self) -> dict:
+        return {
+            "video_pid": self.video_pid,
+            "video_type": self.video_type,
+            "keyframes": self.keyframes,
+        }
+
+class TsChunker:
+    """
+    Reads a pipe with readv() into one preallocated buffer and cuts what
+    arrived into chunks of whole TS packets. Each read takes whatever the pipe
+    holds, up to the buffer size, so chunks grow with the bitrate instead of
+    costing a syscall per KiB; the partial packet at the end of a read is kept
+    for the next one. Works on blocking and non-blocking descriptors.
+    """
+    def __init__(self, fd, size=STREAM_CHUNK_SIZE):
+        self.fd = fd
+        self.buf = bytearray(size)
+        self.view = memoryview(self.buf)
+        self.fill = 0
+        self.reads = 0
+        self.bytes = 0
+        self.resyncs = 0
+
+    def read_chunk(self):
+        """
+        One read. Returns a chunk (bytes, a multiple of 188 long), b"" if no
+        whole packet is available yet, or None at EOF.
+        """
+        try:
+            n = os.readv(self.fd, [self.view[self.fill:]])
+        except (BlockingIOError, InterruptedError):
+            return b""
+        self.reads += 1
+        if not n:
+            # EOF: a trailing partial packet is of no use to a player.
+            return None
+        self.bytes += n
+        self.fill += n
+        if self.buf[0] != TS_SYNC_BYTE:
+            self._resync()
+        whole = self.fill - self.fill % TS_PACKET_SIZE
+        if not whole:
+            return b""
+        chunk = bytes(self.view[:whole])
+        rest = self.fill - whole
+        if rest:
+            self.view[:rest] = self.view[whole:self.fill]
+        self.fill = rest
+        return chunk
+
+    def _resync(self):
+        # Lost packet alignment (ffmpeg output should never need this): drop
+        # bytes up to the next sync byte.
+        self.resyncs += 1
+        start = self.buf.find(TS_SYNC_BYTE, 1, self.fill)
+        if start < 0:
+            self.fill = 0
+            return
+        self.view[:self.fill - start] = self.view[start:self.fill]
+        self.fill -= start
+
+    def stats(self) -> dict:
+        return {
+            "reads": self.reads,
+            "bytes_in": self.bytes,
+            "avg_read_bytes": round(self.bytes / self.reads) if self.reads else 0,
+            "resyncs": self.resyncs,
+        }
+
+def _open_stream_pipe():
+    """(read_fd, write_fd) for ffmpeg's stdout; the read end is non-blocking."""
+    read_fd, write_fd = os.pipe()
+    os.set_blocking(read_fd, False)
+    try:
+        import fcntl
+        fcntl.fcntl(write_fd, getattr(fcntl, "F_SETPIPE_SZ", 1031), STREAM_PIPE_SIZE)
+    except Exception:
+        pass
+    return read_fd, write_fd
+
+class StreamSubscriber:
+    def __init__(self, buffer: StreamBuffer, policy=STREAM_SLOW_CLIENT_POLICY, start=None, tune=None):
+        self.buffer = buffer
+        self.policy = policy if policy in STREAM_SLOW_CLIENT_POLICIES else "skip"
+        # Subscribers start at the live edge unless given an earlier chunk.
+        self.cursor = buffer.live if start is None else start
+        self.closed = False
+        self.skips = 0
+        self.skipped_chunks = 0
+        self.dropped = False
+        self.sent_bytes = 0
+        # How the viewer tuned in ("cold", "shared" or "linger"), for
+        # the time-to-first-byte figures in get_stream_tune_stats().
+        self.tune = tune
+        self.created_at = time.monotonic()
+        self.ttfb = None
+        # Views sent before the chunk at `cursor` (a keyframe start).
+        self._pending = collections.deque()
+
+    def seek_keyframe(self) -> bool:
+        """Move to the buffer's newest keyframe; False if it has none."""
+        start = self.buffer.keyframe_start()
+        if start is None:
+            return False
+        views, self.cursor = start
+        self._pending = collections.deque(views)
+        return True
+
+    def _deliver(self, view):
+        self.sent_bytes += len(view)
+        if self.ttfb is None:
+            self.ttfb = time.monotonic() - self.created_at
+            if self.tune:
+                _tune_stats.record_ttfb(self.tune, self.ttfb)
+        return view
+
+    async def next_chunk(self):
+        """Wait for the next chunk; None once the stream ends."""
+        buffer = self.buffer
+        while True:
+            if self.closed:
+                return None
+            if self.cursor < buffer.oldest:
+                # Lapped by the writer: the chunks it missed are gone.
+                if self.policy == "disconnect":
+                    self.dropped = True
+                    self.closed = True
+                    return None
+                self.skips += 1
+                lapped_at = self.cursor
+                if not self.seek_keyframe():
+                    self._pending.clear()
+                    self.cursor = buffer.live - 1
+                self.skipped_chunks += self.cursor - lapped_at
+            if self._pending:
+                return self._deliver(self._pending.popleft())
+            if self.cursor < buffer.live:
+                chunk = buffer.get(self.cursor)
+                self.cursor += 1
+                return self._deliver(memoryview(chunk))
+            if buffer.closed:
+                return None
+            await buffer.wait()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        chunk = await self.next_chunk()
+        if chunk is None:
+            raise StopAsyncIteration
+        return chunk
+
+    def close(self):
+        self.closed = True
+        self.buffer.wake()
+
+    def lag(self) -> int:
+        """Chunks written but not yet read by this subscriber."""
+        return max(0, self.buffer.live - self.cursor)
+
+# ----------------------------------------------------
+# Tuners
+# ----------------------------------------------------
+# Each running channel holds one upstream connection, and providers cut every
+# stream off when an account opens more than it is allowed. A stream holds one
+# of TUNER_COUNT tuners (0 = no limit; read live, so a change on the settings
+# page applies to the next tune-in) from the moment its start is admitted
+# until its ffmpeg has exited. A channel that finds them all busy:
+#
+#   - takes one from another stream if TUNER_PREEMPT_POLICY allows:
+#     "lingering" stops a stream nobody is watching, "idlest" stops a
+#     lingering stream or else the one with the fewest viewers (the least
+#     recently joined among equals); "none" never preempts. The preempted
+#     stream's tuner passes to the waiting channel once its ffmpeg exits.
+#   - otherwise waits up to TUNER_QUEUE_SECONDS for a tuner, in arrival order,
+#   - and is refused with TunersBusy, which /tuner answers like an HDHomeRun
+#     does: 503 with "X-HDHomeRun-Error: 805 All Tuners In Use".
+#
+# TUNER_PREEMPT_POLICY and TUNER_QUEUE_SECONDS are read live as well.
+TUNER_PREEMPT_POLICIES = ("none", "lingering", "idlest")
+# Longest wait for a preempted stream to hand its tuner over.
+TUNER_PREEMPT_WAIT_SECONDS = 5
+# Queue-wait samples kept for the stats.
+TUNER_WAIT_SAMPLES = 500
+
+class TunersBusy(Exception):
+    pass
+
+def _config_seconds(key, default):
+    try:
+        return max(0.0, float(config.get(key, default)))
+    except (TypeError, ValueError):
+        return default
+
+class TunerPool:
+    """
+    Tuner slots held by streams. Event-loop only, apart from stats(). The
+    slots, policy and queue_seconds given here override the live config.
+    """
+    def __init__(self, slots=None, policy=None, queue_seconds=None):
+        self._slots = slots
+        self._policy = policy
+        self._queue_seconds = queue_seconds
+        self.holders = []
+        self._waiters = collections.deque()  # (stream, future), in arrival order
+        self._lock = threading.Lock()
+        self._stats = {"admitted": 0, "queued": 0, "rejected": 0, "preempted": 0, "cancelled": 0}
+        self._wait_ms = collections.deque(maxlen=TUNER_WAIT_SAMPLES)
+
+    @property
+    def slots(self) -> int:
+        if self._slots is not None:
+            return self._slots
+        try:
+            return max(0, int(config.get("TUNER_COUNT", 1)))
+        except (TypeError, ValueError):
+            return 1
+
+    @property
+    def policy(self) -> str:
+        policy = self._policy or config.get("TUNER_PREEMPT_POLICY", "lingering")
+        return policy if policy in TUNER_PREEMPT_POLICIES else "none"
+
+    @property
+    def queue_seconds(self) -> float:
+        if self._queue_seconds is not None:
+            return self._queue_seconds
+        return _config_seconds("TUNER_QUEUE_SECONDS", 0)
+
+    def _free(self) -> bool:
+        return not self.slots or len(self.holders) < self.slots
+
+    def _take(self, stream):
+        with self._lock:
+            self.holders.append(stream)
+            self._stats["admitted"] += 1
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    async def acquire(self, stream):
+        """Wait for a tuner for `stream`; raises TunersBusy if none frees up in time."""
+        if self._free() and not self._waiters:
+            self._take(stream)
+            return
+        queued_at = time.monotonic()
+        timeout = self.queue_seconds
+        if self._preempt(stream):
+            timeout = max(timeout, TUNER_PREEMPT_WAIT_SECONDS)
+        if timeout <= 0:
+            self._count("rejected")
+            raise TunersBusy(f"All {self.slots} tuners are in use")
+        waiter = stream.loop.create_future()
+        self._waiters.append((stream, waiter))
+        stream._tuner_waiter = waiter
+        self._count("queued")
+        print(f"[Tuners] Channel {stream.channel_id} waiting for a tuner ({len(self.holders)}/{self.slots} in use)", flush=True)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout)
+        except asyncio.TimeoutError:
+            # Unless a tuner was handed over just as the wait ran out.
+            if stream not in self.holders:
+                self._count("rejected")
+                raise TunersBusy(f"All {self.slots} tuners are in use")
+        finally:
+            stream._tuner_waiter = None
+            if (stream, waiter) in self._waiters:
+                self._waiters.remove((stream, waiter))
+        with self._lock:
+            self._wait_ms.append((time.monotonic() - queued_at) * 1000)
+
+    def _preempt(self, stream) -> bool:
+        """Stop a stream to free a tuner for `stream`, if the policy names one."""
+        # Tuners already on their way back (streams draining) are spoken for
+        # by the channels queued before this one.
+        draining = sum(1 for s in self.holders if s.state == "draining")
+        if draining > len(self._waiters):
+            return True
+        if self.policy == "none":
+            return False
+        candidates = [s for s in self.holders if s.state == "lingering"]
+        if not candidates and self.policy == "idlest":
+            candidates = [s for s in self.holders if s.state == "running"]
+        if not candidates:
+            return False
+        victim = min(candidates, key=lambda s: (s.state != "lingering", len(s.subscribers), s.last_join))
+        print(f"[Tuners] Stopping channel {victim.channel_id} to free a tuner for channel {stream.channel_id}", flush=True)
+        self._count("preempted")
+        victim.stop(f"preempted by channel {stream.channel_id}")
+        return True
+
+    def on_linger(self, stream):
+        """`stream` lost its last viewer: hand its tuner to a queued channel if the policy allows."""
+        if self._waiters and self.policy != "none" and stream in self.holders:
+            waiting = self._waiters[0][0]
+            print(f"[Tuners] Stopping channel {stream.channel_id} to free a tuner for channel {waiting.channel_id}", flush=True)
+            self._count("preempted")
+            stream.stop(f"preempted by channel {waiting.channel_id}")
+
+    def cancel(self, stream):
+        """Stop `stream` waiting for a tuner (it was stopped while queued)."""
+        waiter = stream._tuner_waiter
+        if waiter is not None and not waiter.done():
+            waiter.set_exception(RuntimeError(f"channel {stream.channel_id} stopped while waiting for a tuner"))
+            self._count("cancelled")
+
+    def release(self, stream):
+        if stream not in self.holders:
+            return
+        with self._lock:
+            self.holders.remove(stream)
+        self._hand_over()
+
+    def _hand_over(self):
+        # Tuners go to waiting channels in arrival order.
+        while self._waiters and self._free():
+            stream, waiter = self._waiters.popleft()
+            if waiter.done():
+                continue
+            self._take(stream)
+            waiter.set_result(None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            holders = list(self.holders)
+            counters = dict(self._stats)
+            waits = sorted(self._wait_ms)
+        return {
+            "slots": self.slots,
+            "in_use": len(holders),
+            "channels": [{"channel": s.channel_id, "state": s.state, "subscribers": len(s.subscribers)} for s in holders],
+            "waiting": len(self._waiters),
+            "policy": self.policy,
+            "queue_seconds": self.queue_seconds,
+            **counters,
+            "queue_wait_ms": {
+                "samples": len(waits),
+                "avg": round(sum(waits) / len(waits), 1),
+                "max": round(waits[-1], 1),
+            } if waits else None,
+        }
+
+_tuners = TunerPool()
+
+def get_tuner_stats() -> dict:
+    return _tuners.stats()
+
+# ----------------------------------------------------
+# Channel streams
+# ----------------------------------------------------
+# Registry of channel streams. Mutated on the event loop only; the lock lets
+# other threads (e.g. /api/stream_status) take a consistent copy.
+#
+# Each stream goes through these states:
+#
+#   starting  registered; ffmpeg is being spawned. Viewers tuning in now
+#             join this stream and wait for the one start (single-flight).
+#   running   ffmpeg is up and its output is being broadcast.
+#   lingering the last viewer left less than STREAM_LINGER_SECONDS ago.
+#             ffmpeg keeps running and filling the buffer, so a viewer
+#             tuning back in (Plex reopens a tuner right after closing it)
+#             rejoins at once with a burst of recent data.
+#   draining  stopping: the linger ran out, it was stopped, or ffmpeg
+#             exited. Nobody joins it any more; a new tune-in starts a
+#             fresh stream, which waits for this one's ffmpeg to be reaped.
+#   stopped   ffmpeg has exited and the stream has left the registry.
+#
+# A stream is refcounted by its subscribers: a viewer holds a subscriber from
+# the moment it joins (even while the stream is still starting) until it
+# leaves, and the last one leaving stops the stream (after lingering). So a
+# channel never has more than one ffmpeg process, and one never outlives its
+# viewers by more than the linger.
+STREAM_STATES = ("starting", "running", "lingering", "draining", "stopped")
+# Time-to-first-byte samples kept per kind of tune-in.
+STREAM_TTFB_SAMPLES = 500
+
 streams_lock = threading.Lock()
 shared_streams = {}
 
+class TuneStats:
+    """Tune-in counts and time to first byte, by how the viewer joined. Thread-safe."""
+    def __init__(self, samples=STREAM_TTFB_SAMPLES):
+        self._lock = threading.Lock()
+        self._counts = collections.Counter()
+        self._ttfb = {tune: collections.deque(maxlen=samples) for tune in ("cold", "shared", "linger")}
+
+    def count(self, name):
+        with self._lock:
+            self._counts[name] += 1
+
+    def record_ttfb(self, tune, seconds):
+        with self._lock:
+            self._ttfb[tune].append(seconds)
+
+    def stats(self) -> dict:
+        def summary(samples):
+            ms = sorted(s * 1000 for s in samples)
+            if not ms:
+                return None
+            return {
+                "samples": len(ms),
+                "avg": round(sum(ms) / len(ms), 1),
+                "p50": round(ms[len(ms) // 2], 1),
+                "p95": round(ms[max(0, int(len(ms) * 0.95) - 1)], 1),
+                "max": round(ms[-1], 1),
+            }
+        with self._lock:
+            counts = dict(self._counts)
+            ttfb = {tune: summary(samples) for tune, samples in self._ttfb.items()}
+        lingers_over = counts.get("linger", 0) + counts.get("linger_expired", 0)
+        return {
+            "linger_seconds": _linger_seconds(),
+            "tunes": {tune: counts.get(tune, 0) for tune in ("cold", "shared", "linger")},
+            "lingers": counts.get("lingers", 0),
+            "linger_hits": counts.get("linger", 0),
+            "linger_expired": counts.get("linger_expired", 0),
+            # Share of lingers that ended in a re-tune rather than expiring.
+            "linger_hit_rate": round(counts.get("linger", 0) / lingers_over, 3) if lingers_over else None,
+            "ttfb_ms": ttfb,
+        }
+
+_tune_stats = TuneStats()
+
+def _linger_seconds() -> float:
+    """STREAM_LINGER_SECONDS, read live like TUNER_COUNT."""
+    return _config_seconds("STREAM_LINGER_SECONDS", 10)
+
+def get_stream_tune_stats() -> dict:
+    return _tune_stats.stats()
+
 class SharedStream:
-    def __init__(self, channel_id, ffmpeg_cmd):
+    def __init__(self, channel_id, ffmpeg_cmd=None, previous=None):
         self.channel_id = channel_id
         self.ffmpeg_cmd = ffmpeg_cmd
-        print(f"[Stream] Starting channel {channel_id}", flush=True)
-        self.process = subprocess.Popen(
-            ffmpeg_cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            bufsize=10**8
-        )
+        self.state = "starting"
+        self.process = None
+        try:
+            self.loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.loop = None
+        self.buffer = StreamBuffer()
+        self.chunker = None
         self.subscribers = []
-        self.lock = threading.Lock()
-        self.is_running = True
         self.end_reason = None
-        self.broadcast_thread = threading.Thread(target=self._broadcast)
-        self.broadcast_thread.daemon = True
-        self.broadcast_thread.start()
+        self.dropped_subscribers = 0
+        self.started_at = None
+        self.last_join = time.monotonic()
+        self._linger_handle = None
+        self._tuner_waiter = None
+        self._previous = previous
+        self._stderr_tail = collections.deque(maxlen=STREAM_STDERR_TAIL)
+        self._eof = None
+        self._task = None
+        self._start_task = None
+        self._stopped = asyncio.Event()
+
+    @property
+    def is_running(self) -> bool:
+        return self.state in ("running", "lingering")
+
+    @property
+    def joinable(self) -> bool:
+        return self.state in ("starting", "running", "lingering")
+
+    async def start(self, stream_url=None):
+        """
+        Spawn ffmpeg and start broadcasting its output. Builds the command
+        from stream_url if none was given, and first waits for the channel's
+        previous ffmpeg (if it is still draining) to exit and for a tuner.
+        """
+        self.loop = asyncio.get_running_loop()
+        try:
+            if self._previous is not None:
+                await self._previous.wait_stopped()
+                self._previous = None
+            if self.state == "starting":
+                await _tuners.acquire(self)
+            if self.ffmpeg_cmd is None:
+                # Build the FFmpeg command from the selected profile (CPU, CUDA, or custom)
+                self.ffmpeg_cmd = build_ffmpeg_command(stream_url)
+            if self.state != "starting":
+                # Stopped (e.g. every viewer left) before ffmpeg was spawned.
+                raise RuntimeError(f"channel {self.channel_id} stopped while starting")
+            print(f"[Stream] Starting channel {self.channel_id}", flush=True)
+            read_fd, write_fd = _open_stream_pipe()
+            try:
+                self.process = await asyncio.create_subprocess_exec(
+                    *self.ffmpeg_cmd,
+                    stdout=write_fd,
+                    stderr=asyncio.subprocess.PIPE,
+                )
+            except BaseException:
+                os.close(read_fd)
+                raise
+            finally:
+                os.close(write_fd)
+        except BaseException:
+            self._set_stopped()
+            raise
+        self.started_at = time.monotonic()
+        self.chunker = TsChunker(read_fd)
+        self._eof = self.loop.create_future()
+        self.loop.add_reader(read_fd, self._on_readable)
+        self._task = asyncio.create_task(self._run())
+        if self.state == "starting":
+            self.state = "running"
+        else:
+            # stop() arrived while ffmpeg was being spawned.
+            self.kill()
+
+    async def wait_started(self):
+        """Wait for the start begun by join_shared_stream (shared by every joiner)."""
+        await asyncio.shield(self._start_task)
+
+    async def wait_stopped(self):
+        await self._stopped.wait()
 
-    def _broadcast(self):
-        end_cause = None
+    def _on_readable(self):
+        # Drain what the pipe holds now; the loop calls again on more data.
         while True:
-            chunk = self.process.stdout.read(1024)
+            chunk = self.chunker.read_chunk()
+            if chunk is None:
+                self._finish_reading()
+                return
             if not chunk:
-                end_cause = "eof"
-                break
-            with self.lock:
-                for q in self.subscribers:
-                    q.put(chunk)
-        self.is_running = False
-        with self.lock:
-            for q in self.subscribers:
-                q.put(None)
-        # Gather process exit code and stderr for diagnostics
+                return
+            self.buffer.write(chunk)
+
+    def _finish_reading(self):
+        self.loop.remove_reader(self.chunker.fd)
+        os.close(self.chunker.fd)
+        if not self._eof.done():
+            self._eof.set_result(None)
+
+    async def _run(self):
+        stderr_task = asyncio.create_task(self._read_stderr())
+        try:
+            await self._eof
+        finally:
+            self._cancel_linger()
+            if self.state != "stopped":
+                self.state = "draining"
+            self.buffer.close()
         rc = None
         try:
-            rc = self.process.wait(timeout=1)
-        except Exception:
-            rc = self.process.poll()
+            rc = await asyncio.wait_for(self.process.wait(), timeout=1)
+        except asyncio.TimeoutError:
+            self.kill()
+            rc = await self.process.wait()
+        try:
+            await asyncio.wait_for(stderr_task, timeout=1)
+        except asyncio.TimeoutError:
+            stderr_task.cancel()
+        self._set_stopped()
+
+        # Determine reason: explicit end_reason set elsewhere, or EOF
+        reason = self.end_reason or "eof"
+        print(f"[Stream] Channel {self.channel_id} ended (reason: {reason}, exit_code: {rc})", flush=True)
+        if self._stderr_tail:
+            tail = "\n".join(self._stderr_tail)
+            print(f"[FFmpeg stderr][channel {self.channel_id}] last {len(self._stderr_tail)} lines:\n{tail}", flush=True)
+
+    def _set_stopped(self):
+        self.state = "stopped"
+        self.buffer.close()
+        _tuners.release(self)
+        with streams_lock:
+            if shared_streams.get(self.channel_id) is self:
+                del shared_streams[self.channel_id]
+        self._stopped.set()
 
-        stderr_output = b""
+    async def _read_stderr(self):
+        # Drained continuously so ffmpeg never blocks on a full stderr pipe.
+        async for line in self.process.stderr:
+            text = line.decode("utf-8", errors="ignore").strip()
+            if text:
+                self._stderr_tail.append(text)
+
+    def kill(self):
         try:
-            stderr_output = self.process.stderr.read() or b""
-        except Exception:
+            self.process.kill()
+        except (ProcessLookupError, AttributeError):
             pass
 
-        # Determine reason: explicit end_reason set elsewhere, or EOF, otherwise unknown
-        reason = self.end_reason or ("eof" if end_cause == "eof" else "unknown")
-        print(f"[Stream] Channel {self.channel_id} ended (reason: {reason}, exit_code: {rc})", flush=True)
+    def stop(self, reason):
+        """Start draining: kill ffmpeg, after which the stream leaves the registry. Thread-safe."""
+        if self.loop is None:
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is not self.loop:
+            self.loop.call_soon_threadsafe(self.stop, reason)
+            return
+        if not self.joinable:
+            return
+        self._cancel_linger()
+        self.end_reason = reason
+        self.state = "draining"
+        self.buffer.close()
+        _tuners.cancel(self)
+        self.kill()
 
-        if stderr_output:
-            stderr_text = stderr_output.decode("utf-8", errors="ignore")
-            lines = [ln for ln in stderr_text.strip().splitlines() if ln.strip()]
-            tail_count = min(10, len(lines))
-            if tail_count > 0:
-                tail = "\n".join(lines[-tail_count:])
-                print(f"[FFmpeg stderr][channel {self.channel_id}] last {tail_count} lines:\n{tail}", flush=True)
-
-    def add_subscriber(self):
-        q = queue.Queue()
-        with self.lock:
-            self.subscribers.append(q)
-        return q
-
-    def remove_subscriber(self, q):
-        with self.lock:
-            if q in self.subscribers:
-                self.subscribers.remove(q)
-            if not self.subscribers:
-                self.end_reason = "no subscribers"
-                try:
-                    self.process.kill()
-                except Exception:
-                    pass
-                
-def get_shared_stream(channel_id: int, stream_url: str) -> SharedStream:
-    # Build the FFmpeg command from the selected profile (CPU, CUDA, or custom)
-    ffmpeg_cmd = build_ffmpeg_command(stream_url)
+    def _linger(self, linger_seconds):
+        self.state = "lingering"
+        self._linger_handle = self.loop.call_later(linger_seconds, self._linger_expired)
+        _tune_stats.count("lingers")
+        print(f"[Stream] Channel {self.channel_id} has no viewers, holding it for {linger_seconds} s", flush=True)
+        _tuners.on_linger(self)
 
+    def _linger_expired(self):
+        self._linger_handle = None
+        if self.state == "lingering":
+            _tune_stats.count("linger_expired")
+            self.stop("no subscribers")
+
+    def _cancel_linger(self):
+        if self._linger_handle is not None:
+            self._linger_handle.cancel()
+            self._linger_handle = None
+
+    def add_subscriber(self) -> StreamSubscriber:
+        self.last_join = time.monotonic()
+        if self.state == "lingering":
+            self._cancel_linger()
+            self.state = "running"
+            tune = "linger"
+        else:
+            tune = "shared" if self.subscribers or self.buffer.live else "cold"
+        subscriber = StreamSubscriber(self.buffer, tune=tune)
+        if subscriber.seek_keyframe():
+            _tune_stats.count("keyframe_joins")
+        else:
+            subscriber.cursor = self.buffer.burst_start(STREAM_BURST_KB * 1024)
+        self.subscribers.append(subscriber)
+        _tune_stats.count(tune)
+        return subscriber
+
+    def remove_subscriber(self, subscriber):
+        subscriber.close()
+        if subscriber in self.subscribers:
+            self.subscribers.remove(subscriber)
+            if subscriber.dropped:
+                self.dropped_subscribers += 1
+                print(f"[Stream] Channel {self.channel_id}: disconnected a slow client", flush=True)
+        if not self.subscribers:
+            linger_seconds = _linger_seconds()
+            if self.state == "running" and linger_seconds > 0:
+                self._linger(linger_seconds)
+            else:
+                self.stop("no subscribers")
+
+    def stats(self) -> dict:
+        subscribers = list(self.subscribers)
+        chunker = self.chunker.stats() if self.chunker else {}
+        uptime = max(time.monotonic() - self.started_at, 1e-3) if self.started_at else 0
+        return {
+            "state": self.state,
+            **self.buffer.stats(),
+            **chunker,
+            "reads_per_sec": round(chunker.get("reads", 0) / uptime, 1) if uptime else 0,
+            "bitrate_kbps": round(chunker.get("bytes_in", 0) * 8 / 1000 / uptime, 1) if uptime else 0,
+            "subscribers": len(subscribers),
+            "dropped_subscribers": self.dropped_subscribers,
+            "skips": sum(sub.skips for sub in subscribers),
+            "max_lag_chunks": max((sub.lag() for sub in subscribers), default=0),
+        }
+
+async def join_shared_stream(channel_id: int, stream_url: str = None, ffmpeg_cmd=None):
+    """
+    Subscribe to a channel's stream, starting it if it is not running.
+    Returns (stream, subscriber); the caller must pass the subscriber to
+    stream.remove_subscriber() when done. Viewers tuning in at the same time
+    share one start; if it fails, they all get its exception (TunersBusy if
+    no tuner was free).
+    """
     with streams_lock:
-        if channel_id in shared_streams and shared_streams[channel_id].is_running:
-            return shared_streams[channel_id]
-        shared_streams[channel_id] = SharedStream(channel_id, ffmpeg_cmd)
-        return shared_streams[channel_id]
+        stream = shared_streams.get(channel_id)
+        if stream is None or not stream.joinable:
+            stream = SharedStream(channel_id, ffmpeg_cmd, previous=stream)
+            shared_streams[channel_id] = stream
+            stream._start_task = asyncio.create_task(stream.start(stream_url))
+            # Retrieved here too, in case every joiner has already gone.
+            stream._start_task.add_done_callback(lambda task: task.cancelled() or task.exception())
+        # Subscribed before the start finishes, so the stream cannot be torn
+        # down under a viewer that is still waiting for it.
+        subscriber = stream.add_subscriber()
+    try:
+        await stream.wait_started()
+    except BaseException:
+        stream.remove_subscriber(subscriber)
+        raise
+    return stream, subscriber
 
 def clear_shared_stream(channel_id: int) -> bool:
     """
-    Kill and remove the shared stream for a given channel id (if one exists).
-    Returns True if a running stream was found and cleared, otherwise False.
+    Stop the shared stream for a given channel id (if one exists); it leaves
+    the registry once ffmpeg has exited. Returns True if a running stream was
+    found and cleared, otherwise False. Safe to call from any thread.
     """
     with streams_lock:
         stream = shared_streams.get(channel_id)
-        if not stream:
-            return False
-        print(f"[Stream] Clearing channel {channel_id}", flush=True)
-        try:
-            # Mark an explicit reason for diagnostics before kill
-            try:
-                stream.end_reason = "stopped by user"
-            except Exception:
-                pass
-            stream.process.kill()
-        except Exception:
-            pass
-        # Remove from registry regardless of kill outcome
-        try:
-            del shared_streams[channel_id]
-        except Exception:
-            pass
-        return True
+    if not stream or not stream.joinable:
+        return False
+    print(f"[Stream] Clearing channel {channel_id}", flush=True)
+    # Mark an explicit reason for diagnostics before kill
+    stream.stop("stopped by user")
+    return True
 
 
 def stop_stream_by_channel(channel) -> bool:
@@ -2,6 +2,29 @@ import asyncio
 
 from .config import config
 from .epg import parse_raw_epg_files, build_combined_epg
+from .jobs import submit_job
+
+def reparse_epg(force: bool = False) -> dict:
+    """Re-parse EPG_DIR and rebuild the combined EPG if anything changed (always with force)."""
+    changed = parse_raw_epg_files(force=force)
+    if changed or force:
+        build_combined_epg()
+    return {"changed": changed}
+
+def submit_epg_reparse(force: bool = False):
+    """Queue reparse_epg as a background job; returns the Job."""
+    if force:
+        return submit_job("epg_full_reparse", reparse_epg, True, description="Full EPG re-parse")
+    return submit_job("epg_reparse", reparse_epg, description="EPG re-parse")
+
+def submit_epg_rebuild():
+    """Queue a rebuild of the combined EPG from the current raw data."""
+    return submit_job("epg_rebuild", build_combined_epg, description="EPG rebuild")
+
+def submit_m3u_load():
+    """Queue load_m3u_files (which also re-parses the EPG) as a background job."""
+    from .m3u import load_m3u_files
+    return submit_job("m3u_load", load_m3u_files, description="M3U load")
 
 async def schedule_epg_reparse():
     """
@@ -20,8 +43,11 @@ async def schedule_epg_reparse():
         await asyncio.sleep(interval * 60)
 
         try:
-            parse_raw_epg_files()
-            build_combined_epg()
+            # Files that did not change since the last parse are skipped. The
+            # work runs as a background job, so the event loop stays free.
+            job = submit_epg_reparse()
+            # Shielded: cancelling this task must not cancel a shared job.
+            await asyncio.shield(asyncio.wrap_future(job.future))
             print("[INFO] Automatic EPG re-parse completed.")
         except Exception as e:
             print(f"[ERROR] Automatic EPG re-parse failed: {e}")
@@ -487,29 +487,59 @@ function updateActiveStatus(checkbox, channelId) {
     });
 }
 
+// ----------------------------------------------------
+// Now playing: one SSE connection for the whole table
+// ----------------------------------------------------
+// /api/now_playing/stream sends a full `snapshot` on connect and afterwards
+// `update` events with only the channels whose program changed.
+function applyNowPlaying(channels, complete) {
+  document.querySelectorAll("tr[data-channel-number]").forEach(row => {
+    if (row.getAttribute("data-active") !== "1") return;
+    const number = row.getAttribute("data-channel-number");
+    if (!complete && !(number in channels)) return;
+    const entry = channels[number];
+    const title = entry && entry.now && entry.now.title ? entry.now.title : "No Program";
+    row.setAttribute("data-epg", title);
+    row.cells[5].innerText = title;
+  });
+}
+
+let nowPlayingSource = null;
+let nowPlayingFallbackTimer = null;
+
+function fetchNowPlaying() {
+  return fetch("/api/now_playing", { cache: "no-cache" })
+    .then(response => response.json())
+    .then(data => applyNowPlaying(data.channels || {}, true))
+    .catch(error => console.error("Error loading now playing data", error));
+}
+
+function startNowPlayingUpdates() {
+  if (typeof EventSource === "undefined") {
+    // No SSE support: refresh the whole table once a minute instead.
+    if (!nowPlayingFallbackTimer) {
+      nowPlayingFallbackTimer = setInterval(fetchNowPlaying, 60000);
+    }
+    return;
+  }
+  if (nowPlayingSource) return;
+  nowPlayingSource = new EventSource("/api/now_playing/stream");
+  nowPlayingSource.addEventListener("snapshot", evt => {
+    applyNowPlaying(JSON.parse(evt.data), true);
+  });
+  nowPlayingSource.addEventListener("update", evt => {
+    applyNowPlaying(JSON.parse(evt.data), false);
+  });
+  // EventSource reconnects by itself and receives a fresh snapshot.
+}
+
+document.addEventListener("DOMContentLoaded", startNowPlayingUpdates);
+
 function refreshChannelEpg(channelId) {
-  const row = document.querySelector(`tr[data-channel="${channelId}"]`);
-  let attempts = 0;
-  const maxAttempts = 10;
-  const pollInterval = 500;
-  const poller = setInterval(() => {
-    attempts++;
-    fetch(`/api/current_program?channel_id=${channelId}`, { cache: "no-cache" })
-      .then(response => response.json())
-      .then(data => {
-        let newEpgText = data.title ? data.title : "No Program";
-        if (row) {
-          row.cells[5].innerText = newEpgText;
-        }
-        if (newEpgText !== "Loading..." || attempts >= maxAttempts) {
-          clearInterval(poller);
-        }
-      })
-      .catch(error => {
-        console.error("Error refreshing EPG data for channel", channelId, error);
-        clearInterval(poller);
-      });
-  }, pollInterval);
+  // The activation request has already rebuilt this channel's guide data by
+  // the time it returns; one bulk read settles the "Loading..." cell even if
+  // the channel has no program (which the update stream would not report).
+  fetchNowPlaying();
 }
 
 function bulkUpdateActive(active) {
@@ -216,6 +216,43 @@ function onStopStreamClick(event) {
   stopStream(btn);
 }
 
+// Poll a background job (see /api/jobs) until it finishes, showing its
+// progress in statusEl. Resolves to { success, message } like the endpoints.
+function waitForJob(jobId, statusEl, doneMessage) {
+  return new Promise((resolve, reject) => {
+    const poll = () => {
+      fetch(`/api/jobs/${jobId}`)
+        .then((response) => {
+          if (!response.ok) {
+            throw new Error("Could not read job status.");
+          }
+          return response.json();
+        })
+        .then((job) => {
+          if (job.status === "succeeded") {
+            resolve({ success: true, message: doneMessage });
+          } else if (job.status === "failed" || job.status === "cancelled") {
+            resolve({ success: false, message: job.error || `Job ${job.status}.` });
+          } else {
+            const counts = job.total ? ` (${job.done}/${job.total})` : "";
+            statusEl.innerText = `${job.message}${counts}... please wait.`;
+            setTimeout(poll, 1000);
+          }
+        })
+        .catch(reject);
+    };
+    poll();
+  });
+}
+
+function followJob(data, statusEl, doneMessage) {
+  if (data.success && data.job_id) {
+    statusEl.innerText = data.message;
+    return waitForJob(data.job_id, statusEl, doneMessage);
+  }
+  return data;
+}
+
 function parseEPG() {
   const parseButton = document.getElementById("parse-epg-button");
   parseButton.disabled = true;
@@ -232,6 +269,7 @@ function parseEPG() {
       }
       return response.json();
     })
+    .then((data) => followJob(data, statusEl, "EPG parsed successfully."))
     .then((data) => {
       if (data.success) {
         statusEl.innerText = data.message;
@@ -271,6 +309,7 @@ function uploadEPG(event) {
       }
       return response.json();
     })
+    .then((data) => followJob(data, statusEl, "EPG file uploaded and parsed successfully."))
     .then((data) => {
       if (data.success) {
         statusEl.innerText = data.message;
@@ -312,6 +351,7 @@ function uploadM3U(event) {
       }
       return response.json();
     })
+    .then((data) => followJob(data, statusEl, "M3U file uploaded and channels loaded."))
     .then((data) => {
       if (data.success) {
         statusEl.innerText = data.message;
@@ -353,6 +393,7 @@ function deleteEPG(event) {
       }
       return response.json();
     })
+    .then((data) => followJob(data, statusEl, "EPG file deleted and EPG re-parsed successfully."))
     .then((data) => {
       if (data.success) {
         statusEl.innerText = data.message;
@@ -0,0 +1,136 @@
+"""
+Checks that the hot EPG queries are index-backed. Run from the repository root:
+
+    python -m tools.check_query_plans [--channels 200] [--days 2]
+
+Builds a fresh database with init_db (schema and EPG_INDEXES), seeds it with
+a synthetic guide, prints EXPLAIN QUERY PLAN for each query and exits 1 if
+any of them scans one of the EPG tables (with or without an index; a SCAN
+USING INDEX still walks every entry) unless ALLOWED_SCANS lists it, or if a
+hot lookup does not SEARCH an EPG table.
+"""
+import argparse
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+
+from src import database
+from src.epg import _EPG_PROGRAMS_INSERT_SQL, _EPG_SLICE_SQL
+from src.now_playing import NOW_PROGRAMS_SQL, NEXT_PROGRAMS_SQL
+
+# Tables that grow with the guide; any SCAN of one of them is a failure.
+LARGE_TABLES = ("raw_epg_channels", "raw_epg_programs", "epg_programs")
+
+NOW = 1735700000
+
+# (name, sql, params, hot). A hot query must SEARCH an EPG table through an
+# index. The last three mirror routes.get_epg_filenames and
+# epg._delete_raw_epg_file_rows.
+QUERIES = [
+    ("epg_programs insert (full)", _EPG_PROGRAMS_INSERT_SQL.format(channel_filter="active = 1"), (), True),
+    ("epg_programs insert (some channels)", _EPG_PROGRAMS_INSERT_SQL.format(channel_filter="id IN (?, ?)"), (1, 2), True),
+    ("now programmes", NOW_PROGRAMS_SQL, (NOW, NOW), True),
+    ("next programmes", NEXT_PROGRAMS_SQL, (NOW,), True),
+    ("channel slice", _EPG_SLICE_SQL, ("1",), True),
+    ("raw filenames", """
+        SELECT DISTINCT raw_epg_file
+          FROM raw_epg_programs
+         WHERE raw_epg_file IS NOT NULL AND raw_epg_file != ''
+         ORDER BY raw_epg_file
+    """, (), False),
+    ("raw channels of a file", "DELETE FROM raw_epg_channels WHERE raw_epg_file = ?", ("bench.xml",), True),
+    ("raw programmes of a file", "DELETE FROM raw_epg_programs WHERE raw_epg_file = ?", ("bench.xml",), True),
+]
+
+# Queries allowed to SCAN an EPG table, by name, each with the reason. Keep
+# this empty unless a whole-table pass is really what the query is for.
+ALLOWED_SCANS = {
+}
+
+# ----------------------------------------------------
+# Seeding
+# ----------------------------------------------------
+def seed(conn, channels, days):
+    c = conn.cursor()
+    c.executemany(
+        "INSERT INTO channels (id, name, tvg_name, channel_number, active) VALUES (?, ?, ?, ?, 1)",
+        [(ch + 1, f"Channel {ch}", f"ch{ch}.bench", ch + 1) for ch in range(channels)]
+    )
+    c.executemany(
+        "INSERT INTO raw_epg_channels (raw_id, display_name, raw_epg_file) VALUES (?, ?, 'bench.xml')",
+        [(f"ch{ch}.bench", f"CH{ch}") for ch in range(channels)]
+    )
+    programmes = [
+        (f"ch{ch}.bench", NOW + slot * 1800, NOW + (slot + 1) * 1800)
+        for ch in range(channels) for slot in range(days * 48)
+    ]
+    c.executemany("""
+        INSERT INTO raw_epg_programs (raw_channel_id, start_ts, stop_ts, title, raw_epg_file)
+        VALUES (?, ?, ?, 'Show', 'bench.xml')
+    """, programmes)
+    c.execute(_EPG_PROGRAMS_INSERT_SQL.format(channel_filter="active = 1"))
+    conn.commit()
+
+# ----------------------------------------------------
+# Checking
+# ----------------------------------------------------
+_SQL_KEYWORDS = {"ON", "WHERE", "JOIN", "LEFT", "INNER", "CROSS", "GROUP", "ORDER", "LIMIT", "SET", "USING"}
+
+def large_table_names(sql):
+    """LARGE_TABLES plus the aliases `sql` gives them; plans name tables by alias."""
+    names = set(LARGE_TABLES)
+    for table, alias in re.findall(r"\b(?:FROM|JOIN)\s+(\w+)(?:\s+AS)?\s+(\w+)", sql, re.IGNORECASE):
+        if table in LARGE_TABLES and alias.upper() not in _SQL_KEYWORDS:
+            names.add(alias)
+    return names
+
+def _large_table_lines(plan, sql, op):
+    """The plan lines doing `op` (SCAN or SEARCH) on a LARGE_TABLES table."""
+    names = large_table_names(sql)
+    found = []
+    for line in plan:
+        words = line.split()
+        if len(words) >= 2 and words[0] == op and words[1] in names:
+            found.append(line)
+    return found
+
+def check(conn):
+    failures = 0
+    for name, sql, params, hot in QUERIES:
+        plan = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params)]
+        bad = [] if name in ALLOWED_SCANS else _large_table_lines(plan, sql, "SCAN")
+        searches = [line for line in _large_table_lines(plan, sql, "SEARCH") if "INDEX" in line.split()]
+        no_search = hot and not searches
+        failed = bool(bad) or no_search
+        failures += failed
+        note = f" (allowed scan: {ALLOWED_SCANS[name]})" if name in ALLOWED_SCANS else ""
+        note += " (hot lookup without an index SEARCH)" if no_search else ""
+        print(f"{'FAIL' if failed else 'ok':>4}  {name}{note}")
+        for line in plan:
+            print(f"        {'!' if line in bad else ' '} {line}")
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--channels", type=int, default=200)
+    parser.add_argument("--days", type=int, default=2)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DB_FILE = os.path.join(tmp, "plans.db")
+        database.init_db()
+        database.stop_db_writer()
+        conn = sqlite3.connect(database.DB_FILE)
+        try:
+            seed(conn, args.channels, args.days)
+            failures = check(conn)
+        finally:
+            conn.close()
+    if failures:
+        print(f"{failures} quer{'y' if failures == 1 else 'ies'} scan an EPG table or miss their index")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,402 @@
+"""
+Benchmarks for the EPG ingest. Run from the repository root:
+
+    python -m tools.epg_bench ingest [--channels 1000] [--days 14] [--gzip]
+    python -m tools.epg_bench reparse [--files 3] [--channels 200] [--days 14]
+    python -m tools.epg_bench timestamps [--count 200000] [--seed 1]
+
+ingest: writes a synthetic XMLTV guide (--channels channels with a programme
+every half hour for --days days; 300 x 14 is about 75 MB, 1000 x 14 about
+250 MB) and reads every channel and programme row out of it, once the old way
+(ET.parse of the whole file, then findall) and once with _iter_epg_file_rows
+(iterparse, clearing each element), each in a fresh process. Reports rows,
+time, rows/s and the process's peak RSS.
+
+reparse: writes --files synthetic guides into an EPG directory and times a
+first load and a forced re-parse of all of them end to end (parse, insert,
+index maintenance, commit), once with the original loader (ET.parse, one
+execute() per row, one transaction, on the original unindexed schema and
+default journal) and once with parse_raw_epg_files(force=True) on a database
+from init_db. Each runs in a fresh process; reports seconds, rows/s and the
+process's peak RSS.
+
+timestamps: checks normalize_xmltv_datetime against the reference parser on
+--count random inputs (valid timestamps across the whole year range with and
+without offsets, invalid dates and offsets, odd spacing, non-ASCII digits
+and garbage) and exits 1 on any mismatch; then times the reference parser,
+the uncached fast path and the memoized one on a guide-like input mix.
+"""
+import argparse
+import gzip
+import html
+import json
+import os
+import random
+import resource
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import xml.etree.ElementTree as ET
+
+from src import database, epg
+from src.epg import (
+    _iter_epg_file_rows, parse_xmltv_datetime,
+    normalize_xmltv_datetime, _normalize_xmltv_datetime_slow, _parse_xmltv_datetime_reference
+)
+
+# ----------------------------------------------------
+# Synthetic guide
+# ----------------------------------------------------
+def write_synthetic_xmltv(path, channels, days, compress=False, offset="+0000"):
+    """
+    Write an XMLTV guide to `path`: `channels` channels, each with a
+    programme every 30 minutes for `days` days, with the title/desc/icon
+    payload of a typical provider guide. Returns the programme count.
+    """
+    opener = gzip.open if compress else open
+    start = 1735689600  # 2025-01-01 00:00:00 UTC
+    slots = days * 48
+    desc = "An episode description of typical length, long enough to look like the real thing. " * 2
+    with opener(path, "wt", encoding="utf-8") as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n<tv generator-info-name="epg_bench">\n')
+        for ch in range(channels):
+            f.write(
+                f'  <channel id="ch{ch}.bench">\n'
+                f'    <display-name>CH{ch}</display-name>\n'
+                f'    <display-name>Channel {ch} &amp; Friends</display-name>\n'
+                f'  </channel>\n'
+            )
+        for ch in range(channels):
+            for slot in range(slots):
+                begin = time.strftime("%Y%m%d%H%M%S", time.gmtime(start + slot * 1800))
+                end = time.strftime("%Y%m%d%H%M%S", time.gmtime(start + (slot + 1) * 1800))
+                f.write(
+                    f'  <programme start="{begin} {offset}" stop="{end} {offset}" channel="ch{ch}.bench">\n'
+                    f'    <title lang="en">Show {slot % 97} on {ch}</title>\n'
+                    f'    <desc lang="en">{desc}</desc>\n'
+                    f'    <icon src="http://example.com/icons/{slot % 97}.png" />\n'
+                    f'  </programme>\n'
+                )
+        f.write("</tv>\n")
+    return channels * slots
+
+# ----------------------------------------------------
+# ingest
+# ----------------------------------------------------
+def _rows_etparse(epg_file):
+    """The pre-iterparse reader: the whole tree in memory, then findall."""
+    with open(epg_file, "rb") as f:
+        magic = f.read(2)
+        f.seek(0)
+        tree = ET.parse(gzip.open(f)) if magic == b"\x1f\x8b" else ET.parse(f)
+    root = tree.getroot()
+    rows = 0
+    for channel_el in root.findall("channel"):
+        channel_el.get("id", "")
+        channel_el.findall("display-name")
+        rows += 1
+    for prog_el in root.findall("programme"):
+        parse_xmltv_datetime(prog_el.get("start", "").strip())
+        parse_xmltv_datetime(prog_el.get("stop", "").strip())
+        prog_el.find("title")
+        prog_el.find("desc")
+        prog_el.find("icon")
+        rows += 1
+    return rows
+
+def _rows_iterparse(epg_file):
+    return sum(1 for _ in _iter_epg_file_rows(epg_file))
+
+_READERS = {"etparse": _rows_etparse, "iterparse": _rows_iterparse}
+
+def measure(args):
+    """Child process of `ingest`: one reader over one file, results as JSON."""
+    started = time.perf_counter()
+    rows = _READERS[args.reader](args.file)
+    elapsed = time.perf_counter() - started
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss  # KiB on Linux
+    print(json.dumps({"rows": rows, "seconds": elapsed, "peak_rss_mb": peak_kb / 1024}))
+
+def _run_reader(reader, epg_file):
+    out = subprocess.run(
+        [sys.executable, "-m", "tools.epg_bench", "measure", reader, epg_file],
+        check=True, stdout=subprocess.PIPE, text=True
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+def ingest(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.xml.gz" if args.gzip else "bench.xml")
+        programmes = write_synthetic_xmltv(path, args.channels, args.days, compress=args.gzip)
+        print(f"guide: {args.channels} channels, {programmes} programmes, {os.path.getsize(path) / 2**20:.0f} MB on disk")
+        for reader in ("etparse", "iterparse"):
+            r = _run_reader(reader, path)
+            print(
+                f"{reader:>9}: {r['rows']} rows in {r['seconds']:6.1f} s "
+                f"({r['rows'] / r['seconds']:8.0f} rows/s), peak RSS {r['peak_rss_mb']:7.0f} MB"
+            )
+
+# ----------------------------------------------------
+# reparse
+# ----------------------------------------------------
+# The raw tables as the original init_db created them: no secondary indexes,
+# no epoch columns.
+_BASELINE_SCHEMA = """
+    CREATE TABLE raw_epg_channels (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        raw_id TEXT,
+        display_name TEXT,
+        raw_epg_file TEXT,
+        UNIQUE(raw_id, raw_epg_file)
+    );
+    CREATE TABLE raw_epg_programs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        raw_channel_id TEXT,
+        start TEXT,
+        stop TEXT,
+        title TEXT,
+        description TEXT,
+        icon_url TEXT,
+        raw_epg_file TEXT
+    );
+"""
+
+def _baseline_parse_raw_epg_files(epg_dir, db_file):
+    """The original parse_raw_epg_files, with its paths passed in."""
+    epg_files = [
+        os.path.join(epg_dir, f)
+        for f in os.listdir(epg_dir)
+        if f.lower().endswith((".xml", ".xmltv", ".gz"))
+    ]
+    conn = sqlite3.connect(db_file)
+    c = conn.cursor()
+    c.execute("DELETE FROM raw_epg_channels")
+    c.execute("DELETE FROM raw_epg_programs")
+    for epg_file in epg_files:
+        with open(epg_file, "rb") as f:
+            magic = f.read(2)
+            f.seek(0)
+            tree = ET.parse(gzip.open(f)) if magic == b"\x1f\x8b" else ET.parse(f)
+        root = tree.getroot()
+        name = os.path.basename(epg_file)
+        for channel_el in root.findall("channel"):
+            composite_raw_id = f"{html.unescape(channel_el.get('id', '').strip())}::{name}"
+            display_names = channel_el.findall("display-name")
+            if len(display_names) >= 2:
+                abbreviation = html.unescape(display_names[0].text.strip()) if display_names[0].text else ""
+                full_name = html.unescape(display_names[1].text.strip()) if display_names[1].text else ""
+                disp_name = f"{full_name} ({abbreviation})" if full_name and abbreviation else full_name or abbreviation
+            elif len(display_names) == 1:
+                disp_name = html.unescape(display_names[0].text.strip())
+            else:
+                disp_name = ""
+            c.execute(
+                "INSERT OR IGNORE INTO raw_epg_channels (raw_id, display_name, raw_epg_file) VALUES (?, ?, ?)",
+                (composite_raw_id, disp_name, name)
+            )
+        for prog_el in root.findall("programme"):
+            composite_prog_channel = f"{html.unescape(prog_el.get('channel', '').strip())}::{name}"
+            start_time = _parse_xmltv_datetime_reference(prog_el.get("start", "").strip())
+            stop_time = _parse_xmltv_datetime_reference(prog_el.get("stop", "").strip())
+            title_el = prog_el.find("title")
+            title_text = title_el.text.strip() if (title_el is not None and title_el.text) else ""
+            desc_el = prog_el.find("desc")
+            desc_text = desc_el.text.strip() if (desc_el is not None and desc_el.text) else ""
+            icon_el = prog_el.find("icon")
+            icon_src = icon_el.get("src", "").strip() if icon_el is not None else ""
+            c.execute("""
+                INSERT INTO raw_epg_programs (raw_channel_id, start, stop, title, description, icon_url, raw_epg_file)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, (composite_prog_channel, start_time, stop_time, title_text, desc_text, icon_src, name))
+    conn.commit()
+    conn.close()
+
+def _setup_baseline(epg_dir, db_file):
+    conn = sqlite3.connect(db_file)
+    conn.executescript(_BASELINE_SCHEMA)
+    conn.close()
+    return lambda: _baseline_parse_raw_epg_files(epg_dir, db_file)
+
+def _setup_current(epg_dir, db_file):
+    database.DB_FILE = db_file
+    database.init_db()
+    epg.EPG_DIR = epg_dir
+    return lambda: epg.parse_raw_epg_files(force=True)
+
+_PIPELINES = {"baseline": _setup_baseline, "current": _setup_current}
+
+def _count_rows(db_file):
+    conn = sqlite3.connect(db_file)
+    try:
+        return sum(conn.execute(f"SELECT COUNT(*) FROM {t}").fetchone()[0] for t in ("raw_epg_channels", "raw_epg_programs"))
+    finally:
+        conn.close()
+
+def measure_reparse(args):
+    """Child process of `reparse`: first load, then forced reload; results as JSON."""
+    run = _PIPELINES[args.pipeline](args.epg_dir, args.db)
+    timings = []
+    for _ in range(2):
+        started = time.perf_counter()
+        with open(os.devnull, "w") as devnull:
+            stdout, sys.stdout = sys.stdout, devnull
+            try:
+                run()
+            finally:
+                sys.stdout = stdout
+        timings.append(time.perf_counter() - started)
+    if args.pipeline == "current":
+        database.stop_db_writer()
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({"rows": _count_rows(args.db), "load": timings[0], "reload": timings[1], "peak_rss_mb": peak_kb / 1024}))
+
+def reparse(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        epg_dir = os.path.join(tmp, "epg")
+        os.makedirs(epg_dir)
+        programmes = 0
+        for n in range(args.files):
+            programmes += write_synthetic_xmltv(os.path.join(epg_dir, f"guide{n}.xml"), args.channels, args.days)
+        size = sum(os.path.getsize(os.path.join(epg_dir, f)) for f in os.listdir(epg_dir))
+        print(f"guides: {args.files} x {args.channels} channels, {programmes} programmes, {size / 2**20:.0f} MB; "
+              f"{os.cpu_count()} CPU(s)")
+        for pipeline in ("baseline", "current"):
+            db = os.path.join(tmp, f"{pipeline}.db")
+            out = subprocess.run(
+                [sys.executable, "-m", "tools.epg_bench", "measure-reparse", pipeline, epg_dir, db],
+                check=True, stdout=subprocess.PIPE, text=True
+            ).stdout
+            r = json.loads(out.strip().splitlines()[-1])
+            print(
+                f"{pipeline:>8}: load {r['load']:6.1f} s ({r['rows'] / r['load']:7.0f} rows/s), "
+                f"forced reload {r['reload']:6.1f} s ({r['rows'] / r['reload']:7.0f} rows/s), "
+                f"peak RSS {r['peak_rss_mb']:5.0f} MB"
+            )
+
+# ----------------------------------------------------
+# timestamps
+# ----------------------------------------------------
+def _pick(rng, valid, invalid):
+    """Mostly an in-range value, sometimes a boundary or out-of-range one."""
+    return rng.choice(invalid) if rng.random() < 0.05 else valid
+
+def _random_digits(rng):
+    year = rng.choice([rng.randint(1, 9999), rng.randint(1990, 2040), rng.randint(1990, 2040),
+                       rng.choice([1, 999, 1000, 1001, 9998, 9999])])
+    month = _pick(rng, rng.randint(1, 12), [0, 13, 99])
+    day = _pick(rng, rng.randint(1, 31), [0, 32, 99])  # 29-31 are invalid in some months
+    hour = _pick(rng, rng.randint(0, 23), [24, 99])
+    minute = _pick(rng, rng.randint(0, 59), [60, 99])
+    second = _pick(rng, rng.randint(0, 59), [60, 61])
+    return f"{year:04d}{month:02d}{day:02d}{hour:02d}{minute:02d}{second:02d}"
+
+def _random_offset(rng):
+    sign = rng.choice("+-")
+    hours = _pick(rng, rng.randint(0, 14), [15, 24, 99])
+    minutes = _pick(rng, rng.choice([0, 0, 30, 45]), [rng.randint(0, 99)])
+    if rng.random() < 0.8:
+        return f"{sign}{hours:02d}{minutes:02d}"
+    return rng.choice([
+        f"{sign}{hours:02d}:{minutes:02d}",
+        f"{sign}{hours:d}{minutes:02d}",
+        f"{sign}{hours:02d}{minutes:02d}0",
+        "Z", "UTC", "+", "-",
+    ])
+
+_NON_ASCII_DIGITS = "\u0660\u0661\u0662\u06f5\u0969\uff10\uff11\uff19"
+
+def random_xmltv_timestamp(rng):
+    """A random, mostly well-formed XMLTV timestamp, or a near miss."""
+    digits = _random_digits(rng)
+    kind = rng.random()
+    if kind < 0.3:
+        return digits
+    if kind < 0.75:
+        return digits + rng.choice([" ", "", "  ", "\t"]) + _random_offset(rng)
+    if kind < 0.85:
+        # Non-ASCII digits, which str.isdigit() and int() accept.
+        pos = rng.randrange(len(digits))
+        return digits[:pos] + rng.choice(_NON_ASCII_DIGITS) + digits[pos + 1:] + " +0000"
+    return rng.choice([
+        "", " ", digits[:rng.randint(0, 13)], digits + "00", " " + digits, digits + " +0000 ",
+        digits[:8] + "T" + digits[8:], digits + " +0000 extra", digits.replace("0", "-", 1),
+        digits + " -0000", digits + "+0100", digits + " +01001",
+    ])
+
+def _outcome(fn, s):
+    try:
+        return fn(s)
+    except Exception as e:
+        return f"raised {type(e).__name__}: {e}"
+
+def timestamps(args):
+    rng = random.Random(args.seed)
+    fast = normalize_xmltv_datetime.__wrapped__
+    mismatches = 0
+    for _ in range(args.count):
+        s = random_xmltv_timestamp(rng)
+        got = _outcome(fast, s)
+        text = _outcome(_parse_xmltv_datetime_reference, s)
+        # Neither may raise; the text must match the reference and the epoch
+        # must match the text.
+        if not isinstance(got, tuple) or got[0] != text or got != _outcome(_normalize_xmltv_datetime_slow, s):
+            mismatches += 1
+            if mismatches <= 20:
+                print(f"MISMATCH {s!r}: fast {got!r}, reference {text!r}")
+    print(f"parity: {args.count} inputs, {mismatches} mismatches")
+
+    # A guide's worth of boundaries: every half hour for two weeks, in a few
+    # offsets, each seen many times over (once per channel and as start/stop).
+    base = 1735689600
+    distinct = [
+        time.strftime("%Y%m%d%H%M%S", time.gmtime(base + slot * 1800)) + offset
+        for slot in range(14 * 48) for offset in ("", " +0000", " +0100", " -0500")
+    ]
+    sample = [rng.choice(distinct) for _ in range(args.count)]
+    normalize_xmltv_datetime.cache_clear()
+    for name, fn in (
+        ("reference", _normalize_xmltv_datetime_slow),
+        ("fast", fast),
+        ("memoized", normalize_xmltv_datetime),
+    ):
+        started = time.perf_counter()
+        for s in sample:
+            fn(s)
+        elapsed = time.perf_counter() - started
+        print(f"{name:>9}: {len(sample) / elapsed:10.0f} calls/s ({len(distinct)} distinct inputs)")
+    if mismatches:
+        sys.exit(1)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    p = commands.add_parser("ingest", help="XMLTV read: peak memory and throughput")
+    p.add_argument("--channels", type=int, default=1000)
+    p.add_argument("--days", type=int, default=14)
+    p.add_argument("--gzip", action="store_true", help="write the guide gzip-compressed")
+    p.set_defaults(func=ingest)
+    p = commands.add_parser("reparse", help="raw EPG load end to end: original loader vs parse_raw_epg_files")
+    p.add_argument("--files", type=int, default=3)
+    p.add_argument("--channels", type=int, default=200)
+    p.add_argument("--days", type=int, default=14)
+    p.set_defaults(func=reparse)
+    p = commands.add_parser("timestamps", help="XMLTV timestamp parser: parity fuzz and speed")
+    p.add_argument("--count", type=int, default=200000)
+    p.add_argument("--seed", type=int, default=1)
+    p.set_defaults(func=timestamps)
+    p = commands.add_parser("measure")
+    p.add_argument("reader", choices=sorted(_READERS))
+    p.add_argument("file")
+    p.set_defaults(func=measure)
+    p = commands.add_parser("measure-reparse")
+    p.add_argument("pipeline", choices=sorted(_PIPELINES))
+    p.add_argument("epg_dir")
+    p.add_argument("db")
+    p.set_defaults(func=measure_reparse)
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,722 @@
+"""
+Benchmarks for the streaming engine. Run from the repository root:
+
+    python -m tools.stream_bench fanout [--mb 256] [--subscribers 1 10 50]
+
+fanout: pushes --mb of data through one channel's fan-out to N subscribers,
+once with the old scheme (1 KiB reads, one queue.Queue and one thread per
+subscriber) and once with StreamBuffer and StreamSubscriber coroutines, and
+reports the throughput delivered to all subscribers together and the peak
+memory allocated while doing so. The old scheme's queues are unbounded; the
+ring's writer waits for the slowest subscriber instead of lapping it, so both
+deliver every byte.
+
+    python -m tools.stream_bench read [--mb 512]
+
+read: reads --mb of TS packets from a child process's stdout, once with
+read(1024) on a buffered pipe (the old broadcast loop) and once with
+TsChunker, and reports read calls, CPU time and throughput of the reading
+side.
+
+    python -m tools.stream_bench load [--clients 250] [--seconds 10] [--kbps 4000]
+
+load: starts a uvicorn server (one worker) streaming one channel from a paced
+TS source through SharedStream, connects --clients HTTP viewers at once and
+reports time to first byte, per-viewer throughput and the server's thread
+count.
+
+    python -m tools.stream_bench stress [--channels 4] [--viewers 40] [--seconds 10]
+
+stress: tunes --viewers viewers per channel in and out of --channels channels
+at random (some giving up while the stream is still starting, plus random
+stops from another thread) and checks, by watching /proc, that no channel
+ever has more than one source process and that everything is torn down at
+the end. Linux only. With --tuners N it also checks that no more than N
+channels ever run at once.
+
+    python -m tools.stream_bench retune [--tunes 20] [--gap 0.2] [--startup-ms 1500]
+
+retune: tunes one channel in and out --tunes times, --gap seconds apart, with
+the source taking --startup-ms to produce its first packet (upstream connect
+and probe), once with lingering off and once with it on, and reports time to
+first byte and the linger hit rate.
+
+    python -m tools.stream_bench tuners
+
+tuners: with two tuners, runs through the busy cases (every tuner watched,
+one stream lingering, a queued tune-in that gets a tuner and one that does
+not) under each TUNER_PREEMPT_POLICY, and prints what happened to the third
+channel and the pool's counters.
+
+    python -m tools.stream_bench join [--joiners 200] [--gop 2] [--no-rai]
+
+join: plays a synthetic H.264 TS (PAT/PMT every 0.1 s, a keyframe every --gop
+seconds) through a StreamBuffer in real time while viewers join at random
+moments, once starting them at the live edge (as before), once STREAM_BURST_KB
+back and once at the newest keyframe, and reports how long each waited until
+it had PAT, PMT and a keyframe, i.e. something a player can decode. --no-rai
+leaves out the random_access_indicator, so keyframes are found from the NAL
+units.
+"""
+import argparse
+import asyncio
+import collections
+import contextlib
+import io
+import json
+import os
+import queue
+import random
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+
+from src import streaming
+from src.streaming import (
+    StreamBuffer, StreamSubscriber, TsChunker, TsIndexer, TunersBusy, join_shared_stream, clear_shared_stream,
+    STREAM_CHUNK_SIZE, TS_PACKET_SIZE, shared_streams, streams_lock
+)
+
+# ----------------------------------------------------
+# fanout
+# ----------------------------------------------------
+# Null packets (PID 0x1FFF): never parsed by TsIndexer, like most of a stream.
+_NULL_PACKETS = (b"\x47\x1f\xff\x10" + b"\xff" * 184) * (STREAM_CHUNK_SIZE // TS_PACKET_SIZE + 6)
+
+def _bench_queues(total_bytes, subscribers, chunk_size=1024):
+    queues = [queue.Queue() for _ in range(subscribers)]
+    received = [0] * subscribers
+
+    def consume(i):
+        q = queues[i]
+        while True:
+            chunk = q.get()
+            if chunk is None:
+                return
+            received[i] += len(chunk)
+
+    threads = [threading.Thread(target=consume, args=(i,)) for i in range(subscribers)]
+    for t in threads:
+        t.start()
+    lock = threading.Lock()
+    payload = _NULL_PACKETS[:chunk_size]
+    for _ in range(total_bytes // chunk_size):
+        chunk = bytes(memoryview(payload))  # a fresh read() result per chunk
+        with lock:
+            for q in queues:
+                q.put(chunk)
+    for q in queues:
+        q.put(None)
+    for t in threads:
+        t.join()
+    return sum(received), 0
+
+async def _bench_ring_async(total_bytes, subscribers, chunk_size):
+    buffer = StreamBuffer(chunk_size=chunk_size)
+    subs = [StreamSubscriber(buffer) for _ in range(subscribers)]
+    received = [0] * subscribers
+
+    async def consume(i):
+        async for chunk in subs[i]:
+            received[i] += len(chunk)
+
+    tasks = [asyncio.create_task(consume(i)) for i in range(subscribers)]
+    payload = _NULL_PACKETS[:chunk_size]
+    for _ in range(total_bytes // chunk_size):
+        # Like a paced ffmpeg, never lap the subscribers: let them run until
+        # the slowest is within half the ring.
+        while min(sub.cursor for sub in subs) < buffer.live - buffer.slots // 2:
+            await asyncio.sleep(0)
+        buffer.write(bytes(memoryview(payload)))
+    buffer.close()
+    await asyncio.gather(*tasks)
+    return sum(received), sum(sub.skips for sub in subs)
+
+def _bench_ring(total_bytes, subscribers, chunk_size=STREAM_CHUNK_SIZE):
+    return asyncio.run(_bench_ring_async(total_bytes, subscribers, chunk_size))
+
+def _run(name, fn, total_bytes, subscribers):
+    tracemalloc.start()
+    started = time.perf_counter()
+    delivered, skips = fn(total_bytes, subscribers)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(
+        f"{name:>6} {subscribers:>4} subs: {delivered / elapsed / 2**20:9.1f} MiB/s delivered, "
+        f"peak {peak / 2**20:8.1f} MiB, {elapsed:6.2f} s, skips {skips}"
+    )
+
+def fanout(args):
+    total_bytes = args.mb * 2**20
+    for subscribers in args.subscribers:
+        _run("queue", _bench_queues, total_bytes, subscribers)
+        _run("ring", _bench_ring, total_bytes, subscribers)
+
+# ----------------------------------------------------
+# read
+# ----------------------------------------------------
+# Writes `total` bytes (forever if 0) of TS packets to stdout the way
+# ffmpeg's pipe output does: in 32 KiB writes (its I/O buffer size), which do
+# not end on packet boundaries. Given a bitrate in kbit/s, paces the writes
+# like `ffmpeg -re`; given a startup delay in ms, waits that long first.
+_TS_SOURCE = """
+import sys, time
+total = int(sys.argv[1])
+kbps = int(sys.argv[2])
+time.sleep(int(sys.argv[3]) / 1000)
+stream = (b"\\x47" + b"\\x00" * 187) * 1024
+out, written = getattr(sys.stdout.buffer, "raw", sys.stdout.buffer), 0
+started = time.monotonic()
+while total <= 0 or written < total:
+    n = 32768 if total <= 0 else min(32768, total - written)
+    offset = written % 188
+    data = memoryview(stream)[offset:offset + n]
+    try:
+        while data:
+            data = data[out.write(data):]
+    except BrokenPipeError:
+        break
+    written += n
+    if kbps:
+        ahead = written * 8 / 1000 / kbps - (time.monotonic() - started)
+        if ahead > 0:
+            time.sleep(ahead)
+"""
+
+def _source_cmd(total_bytes, kbps=0, startup_ms=0):
+    return [sys.executable, "-c", _TS_SOURCE, str(total_bytes), str(kbps), str(startup_ms)]
+
+def _read_old(total_bytes):
+    proc = subprocess.Popen(_source_cmd(total_bytes), stdout=subprocess.PIPE, bufsize=10**8)
+    reads = got = 0
+    while True:
+        chunk = proc.stdout.read(1024)
+        reads += 1
+        if not chunk:
+            break
+        got += len(chunk)
+    proc.wait()
+    return reads, got
+
+def _read_chunker(total_bytes):
+    proc = subprocess.Popen(_source_cmd(total_bytes), stdout=subprocess.PIPE, bufsize=0)
+    chunker = TsChunker(proc.stdout.fileno())
+    got = 0
+    while True:
+        chunk = chunker.read_chunk()
+        if chunk is None:
+            break
+        assert len(chunk) % TS_PACKET_SIZE == 0 and (not chunk or chunk[0] == 0x47)
+        got += len(chunk)
+    proc.wait()
+    return chunker.reads, got
+
+def read(args):
+    total_bytes = args.mb * 2**20 // TS_PACKET_SIZE * TS_PACKET_SIZE
+    for name, fn in (("read1k", _read_old), ("chunker", _read_chunker)):
+        cpu, started = time.process_time(), time.perf_counter()
+        reads, got = fn(total_bytes)
+        cpu, elapsed = time.process_time() - cpu, time.perf_counter() - started
+        print(
+            f"{name:>8}: {reads:>8} reads ({got / reads:7.0f} B avg), "
+            f"reader CPU {cpu:5.2f} s, {got / elapsed / 2**20:7.1f} MiB/s"
+        )
+
+# ----------------------------------------------------
+# load
+# ----------------------------------------------------
+def serve(args):
+    """Child process of `load`: one paced channel behind a /tuner-like route."""
+    import uvicorn
+    from fastapi import FastAPI
+    from fastapi.responses import StreamingResponse
+
+    app = FastAPI()
+
+    @app.get("/tuner/1")
+    async def tuner():
+        shared, subscriber = await join_shared_stream(1, ffmpeg_cmd=_source_cmd(0, args.kbps))
+
+        async def streamer():
+            try:
+                async for chunk in subscriber:
+                    yield chunk
+            finally:
+                shared.remove_subscriber(subscriber)
+        return StreamingResponse(streamer(), media_type="video/mp2t")
+
+    @app.get("/stats")
+    async def stats():
+        with streams_lock:
+            stream = shared_streams.get(1)
+        return {"threads": threading.active_count(), **(stream.stats() if stream else {})}
+
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
+
+async def _viewer(port, seconds, results):
+    started = time.perf_counter()
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(b"GET /tuner/1 HTTP/1.1\r\nHost: bench\r\n\r\n")
+    await writer.drain()
+    first, got = None, 0
+    deadline = started + seconds
+    try:
+        while True:
+            try:
+                data = await asyncio.wait_for(reader.read(65536), deadline - time.perf_counter())
+            except (asyncio.TimeoutError, ValueError):
+                break
+            if not data:
+                break
+            if first is None:
+                first = time.perf_counter() - started
+            got += len(data)
+    finally:
+        writer.close()
+    results.append((first, got))
+
+async def _get_json(port, path):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: bench\r\nConnection: close\r\n\r\n".encode())
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    return json.loads(response.split(b"\r\n\r\n", 1)[1])
+
+async def _load(args):
+    server = subprocess.Popen([
+        sys.executable, "-m", "tools.stream_bench", "serve",
+        "--port", str(args.port), "--kbps", str(args.kbps)
+    ])
+    try:
+        for _ in range(100):
+            try:
+                idle = await _get_json(args.port, "/stats")
+                break
+            except OSError:
+                await asyncio.sleep(0.1)
+        else:
+            raise RuntimeError("bench server did not start")
+        results = []
+        viewers = [asyncio.create_task(_viewer(args.port, args.seconds, results)) for _ in range(args.clients)]
+        await asyncio.sleep(args.seconds / 2)
+        busy = await _get_json(args.port, "/stats")
+        await asyncio.gather(*viewers)
+    finally:
+        server.terminate()
+        server.wait()
+    ttfb = sorted(r[0] for r in results if r[0] is not None)
+    rates = [r[1] * 8 / 1000 / args.seconds for r in results]
+    print(f"viewers: {len(ttfb)}/{args.clients} received data, source {args.kbps} kbit/s for {args.seconds:g} s")
+    if ttfb:
+        print(
+            f"time to first byte: p50 {statistics.median(ttfb) * 1000:.0f} ms, "
+            f"p95 {ttfb[max(0, int(len(ttfb) * 0.95) - 1)] * 1000:.0f} ms, max {ttfb[-1] * 1000:.0f} ms"
+        )
+    print(f"per-viewer throughput: min {min(rates):.0f} / avg {statistics.mean(rates):.0f} kbit/s")
+    print(
+        f"server threads: {idle['threads']} idle, {busy['threads']} with {busy.get('subscribers', 0)} viewers; "
+        f"avg read {busy.get('avg_read_bytes', 0)} B, skips {busy.get('skips', 0)}"
+    )
+
+def load(args):
+    asyncio.run(_load(args))
+
+# ----------------------------------------------------
+# stress
+# ----------------------------------------------------
+def _source_pids(marker):
+    """{channel: [pid, ...]} of the live (not zombie) source processes tagged with marker."""
+    found = {}
+    for pid in os.listdir("/proc"):
+        if not pid.isdigit():
+            continue
+        try:
+            with open(f"/proc/{pid}/cmdline", "rb") as f:
+                argv = f.read().split(b"\0")
+            with open(f"/proc/{pid}/stat", "rb") as f:
+                state = f.read().rsplit(b")", 1)[1].split()[0]
+        except OSError:
+            continue
+        tag = next((a for a in argv if a.startswith(marker)), None)
+        if tag is not None and state != b"Z":
+            found.setdefault(int(tag[len(marker):]), []).append(int(pid))
+    return found
+
+class _ProcessWatcher(threading.Thread):
+    """
+    Samples /proc until stopped; records the most source processes a channel
+    (and all channels together) ever had.
+    """
+    def __init__(self, marker):
+        super().__init__(daemon=True)
+        self.marker = marker.encode()
+        self.max_per_channel = {}
+        self.max_total = 0
+        self.pids = set()
+        self.halt = threading.Event()
+
+    def run(self):
+        while not self.halt.is_set():
+            found = _source_pids(self.marker)
+            for channel, pids in found.items():
+                self.pids.update(pids)
+                self.max_per_channel[channel] = max(self.max_per_channel.get(channel, 0), len(pids))
+            self.max_total = max(self.max_total, sum(len(pids) for pids in found.values()))
+            time.sleep(0.002)
+
+async def _stress(args):
+    marker = f"tvn-stress-{os.getpid()}-ch"
+    channels = list(range(1, args.channels + 1))
+
+    def cmd(channel):
+        # The tag is an extra argument the source ignores; it lets /proc tell
+        # the channels' processes apart.
+        return _source_cmd(0, args.kbps) + [f"{marker}{channel}"]
+
+    streaming.config["STREAM_LINGER_SECONDS"] = args.linger
+    streaming._tuners = streaming.TunerPool(slots=args.tuners, policy=args.policy, queue_seconds=0.05)
+    watcher = _ProcessWatcher(marker)
+    watcher.start()
+    counts = collections.Counter()
+
+    # 1. Everyone tunes in to cold channels at the same moment.
+    results = await asyncio.gather(*(
+        join_shared_stream(channel, ffmpeg_cmd=cmd(channel))
+        for channel in channels for _ in range(args.viewers)
+    ), return_exceptions=True)
+    joined = [r for r in results if not isinstance(r, TunersBusy)]
+    counts["burst busy"] = len(results) - len(joined)
+    for channel in channels:
+        streams = {id(shared) for shared, _ in joined if shared.channel_id == channel}
+        assert len(streams) <= 1, f"channel {channel}: {len(streams)} streams for one burst"
+    for shared, subscriber in joined:
+        shared.remove_subscriber(subscriber)
+    counts["burst joins"] = len(joined)
+
+    # 2. Churn: viewers come and go, some give up while the stream starts,
+    # and another thread stops channels under them.
+    deadline = time.monotonic() + args.seconds
+
+    async def viewer(channel):
+        while time.monotonic() < deadline:
+            try:
+                shared, subscriber = await asyncio.wait_for(
+                    join_shared_stream(channel, ffmpeg_cmd=cmd(channel)),
+                    random.choice((0.005, 0.05, 5))
+                )
+            except asyncio.TimeoutError:
+                counts["gave up while starting"] += 1
+                continue
+            except TunersBusy:
+                counts["busy"] += 1
+                await asyncio.sleep(random.random() * 0.02)
+                continue
+            except RuntimeError:
+                counts["stopped while starting"] += 1
+                continue
+            counts["joins"] += 1
+            try:
+                for _ in range(random.randint(0, 3)):
+                    try:
+                        chunk = await asyncio.wait_for(subscriber.next_chunk(), 1)
+                    except asyncio.TimeoutError:
+                        break
+                    if chunk is None:
+                        break
+                    counts["chunks"] += 1
+            finally:
+                shared.remove_subscriber(subscriber)
+            await asyncio.sleep(random.random() * 0.02)
+
+    def stopper():
+        while time.monotonic() < deadline:
+            if clear_shared_stream(random.choice(channels)):
+                counts["cleared"] += 1
+            time.sleep(0.05)
+
+    stopper_thread = threading.Thread(target=stopper, daemon=True)
+    stopper_thread.start()
+    await asyncio.gather(*(viewer(channel) for channel in channels for _ in range(args.viewers)))
+    stopper_thread.join()
+
+    # 3. Everyone has left: every stream must drain and leave the registry.
+    with streams_lock:
+        remaining = list(shared_streams.values())
+    await asyncio.wait_for(asyncio.gather(*(stream.wait_stopped() for stream in remaining)), args.linger + 10)
+    await asyncio.sleep(0.1)
+    watcher.halt.set()
+    watcher.join()
+    with streams_lock:
+        leftover = dict(shared_streams)
+    alive = _source_pids(marker.encode())
+    return counts, watcher, leftover, alive
+
+def stress(args):
+    log = io.StringIO()
+    with contextlib.redirect_stdout(log):
+        counts, watcher, leftover, alive = asyncio.run(_stress(args))
+    starts = log.getvalue().count("[Stream] Starting channel")
+    print(", ".join(f"{name} {n}" for name, n in counts.items()))
+    print(f"ffmpeg starts: {starts} (distinct pids seen: {len(watcher.pids)})")
+    print(
+        f"most processes one channel had at once: {max(watcher.max_per_channel.values(), default=0)}, "
+        f"all channels: {watcher.max_total} (tuners: {args.tuners or 'no limit'})"
+    )
+    assert all(n <= 1 for n in watcher.max_per_channel.values()), watcher.max_per_channel
+    assert not args.tuners or watcher.max_total <= args.tuners, watcher.max_total
+    assert not leftover, f"streams left in the registry: {leftover}"
+    assert not alive, f"source processes still running: {alive}"
+    print("OK: at most one process per channel, nothing left running")
+
+# ----------------------------------------------------
+# retune
+# ----------------------------------------------------
+async def _retune(args, linger):
+    streaming.config["STREAM_LINGER_SECONDS"] = linger
+    streaming._tune_stats = streaming.TuneStats()
+    cmd = _source_cmd(0, args.kbps, args.startup_ms)
+    early = []
+    for _ in range(args.tunes):
+        shared, subscriber = await join_shared_stream(1, ffmpeg_cmd=cmd)
+        try:
+            chunk = await asyncio.wait_for(subscriber.next_chunk(), args.startup_ms / 1000 + 10)
+            first = time.monotonic()
+            got = 0
+            while chunk is not None and time.monotonic() < first + args.watch:
+                if time.monotonic() < first + 0.1:
+                    got += len(chunk)
+                try:
+                    chunk = await asyncio.wait_for(subscriber.next_chunk(), first + args.watch - time.monotonic())
+                except asyncio.TimeoutError:
+                    break
+            early.append(got)
+        finally:
+            shared.remove_subscriber(subscriber)
+        await asyncio.sleep(args.gap)
+    with streams_lock:
+        stream = shared_streams.get(1)
+    if stream is not None:
+        clear_shared_stream(1)
+        await stream.wait_stopped()
+    return streaming.get_stream_tune_stats(), early
+
+def retune(args):
+    for linger in (0, args.linger):
+        with contextlib.redirect_stdout(io.StringIO()):
+            stats, early = asyncio.run(_retune(args, linger))
+        ttfb = {tune: s for tune, s in stats["ttfb_ms"].items() if s}
+        print(
+            f"linger {linger:>4g} s: tunes {stats['tunes']}, hit rate {stats['linger_hit_rate']}, "
+            f"first 100 ms of data avg {statistics.mean(early) / 1024:.0f} KiB"
+        )
+        for tune, s in ttfb.items():
+            print(f"    {tune:>6} TTFB: p50 {s['p50']} ms, p95 {s['p95']} ms, max {s['max']} ms ({s['samples']} tunes)")
+
+# ----------------------------------------------------
+# tuners
+# ----------------------------------------------------
+async def _tuners_case(policy, queue_seconds, setup):
+    streaming.config["STREAM_LINGER_SECONDS"] = 5
+    streaming._tuners = streaming.TunerPool(slots=2, policy=policy, queue_seconds=queue_seconds)
+    cmd = _source_cmd(0, 4000)
+    held = []
+
+    async def tune(channel):
+        shared, subscriber = await join_shared_stream(channel, ffmpeg_cmd=cmd)
+        held.append((shared, subscriber))
+        return shared, subscriber
+
+    def leave(channel):
+        for shared, subscriber in list(held):
+            if shared.channel_id == channel:
+                held.remove((shared, subscriber))
+                shared.remove_subscriber(subscriber)
+
+    # Channel 1 has three viewers, channel 2 one.
+    for channel in (1, 1, 1, 2):
+        await tune(channel)
+    await setup(leave)
+    started = time.monotonic()
+    try:
+        await tune(3)
+        outcome = "admitted"
+    except TunersBusy:
+        outcome = "busy"
+    elapsed = (time.monotonic() - started) * 1000
+    with streams_lock:
+        running = sorted(c for c, stream in shared_streams.items() if stream.joinable)
+    stats = streaming.get_tuner_stats()
+    for shared, subscriber in list(held):
+        shared.remove_subscriber(subscriber)
+    for channel in (1, 2, 3):
+        clear_shared_stream(channel)
+    with streams_lock:
+        remaining = list(shared_streams.values())
+    await asyncio.gather(*(stream.wait_stopped() for stream in remaining))
+    return outcome, elapsed, running, stats
+
+def tuners(args):
+    async def watched(leave):
+        pass
+
+    async def one_lingering(leave):
+        leave(2)
+
+    async def frees_later(leave):
+        asyncio.get_running_loop().call_later(0.5, leave, 2)
+
+    cases = [
+        ("all watched", watched, 0),
+        ("ch2 lingering", one_lingering, 0),
+        ("queued, ch2 left after 0.5 s", frees_later, 2),
+        ("queued, nothing frees", watched, 1),
+    ]
+    for policy in streaming.TUNER_PREEMPT_POLICIES:
+        for name, setup, queue_seconds in cases:
+            with contextlib.redirect_stdout(io.StringIO()):
+                outcome, elapsed, running, stats = asyncio.run(_tuners_case(policy, queue_seconds, setup))
+            print(
+                f"{policy:>9} | {name:<29} | ch3 {outcome:<8} after {elapsed:6.0f} ms | running {running} | "
+                f"admitted {stats['admitted']} queued {stats['queued']} rejected {stats['rejected']} "
+                f"preempted {stats['preempted']}"
+            )
+
+# ----------------------------------------------------
+# join
+# ----------------------------------------------------
+def _ts_packet(pid, payload, pusi=False, flags=0):
+    """One packet; an adaptation field carries `flags` and pads it to 188 bytes."""
+    header = bytes([0x47, (0x40 if pusi else 0) | (pid >> 8), pid & 0xFF])
+    room = TS_PACKET_SIZE - 4 - len(payload)
+    if room == 0 and not flags:
+        return header + b"\x10" + payload
+    af = bytes([room - 1]) + (bytes([flags]) + b"\xff" * (room - 2) if room > 1 else b"")
+    return header + b"\x30" + af + payload
+
+def _synthetic_gop(kbps, gop_seconds, rai, fps=25):
+    """One GOP of a one-program TS: PAT/PMT every 0.1 s, H.264 video on PID 0x100."""
+    pat = _ts_packet(0, b"\x00\x00\xb0\x0d\x00\x01\xc1\x00\x00\x00\x01\xf0\x00" + b"\x00" * 4, pusi=True)
+    pmt = _ts_packet(0x1000, b"\x00\x02\xb0\x12\x00\x01\xc1\x00\x00\xe1\x00\xf0\x00"
+                     b"\x1b\xe1\x00\xf0\x00" + b"\x00" * 4, pusi=True)
+    packets_per_frame = max(2, kbps * 1000 // 8 // fps // TS_PACKET_SIZE)
+    frames = []
+    for n in range(int(gop_seconds * fps)):
+        key = n == 0
+        # AUD, then SPS + IDR slice on keyframes or a non-IDR slice.
+        nals = b"\x00\x00\x00\x01\x09\xf0" + (b"\x00\x00\x01\x67\x64\x00\x1f\x00\x00\x01\x65" if key else b"\x00\x00\x01\x41")
+        pes = b"\x00\x00\x01\xe0\x00\x00\x80\x80\x05\x21\x00\x01\x00\x01" + nals
+        frame = [pat, pmt] if n % max(1, fps // 10) == 0 else []
+        frame.append(_ts_packet(0x100, pes, pusi=True, flags=0x40 if key and rai else 0))
+        frame += [_ts_packet(0x100, b"\x00" * 184)] * (packets_per_frame - 1)
+        frames.append(b"".join(frame))
+    return b"".join(frames)
+
+async def _join(args, mode):
+    gop = _synthetic_gop(args.kbps, args.gop, not args.no_rai)
+    buffer = StreamBuffer()
+    packets_per_chunk = STREAM_CHUNK_SIZE // TS_PACKET_SIZE // 2
+    chunk_bytes = packets_per_chunk * TS_PACKET_SIZE
+    interval = chunk_bytes * 8 / 1000 / args.kbps
+    waits = []
+
+    async def viewer(delay):
+        await asyncio.sleep(delay)
+        subscriber = StreamSubscriber(buffer)
+        if mode == "burst":
+            subscriber.cursor = buffer.burst_start(streaming.STREAM_BURST_KB * 1024)
+        elif mode == "keyframe" and not subscriber.seek_keyframe():
+            subscriber.cursor = buffer.burst_start(streaming.STREAM_BURST_KB * 1024)
+        started = time.monotonic()
+        player = TsIndexer()
+        received = 0
+        async for chunk in subscriber:
+            player.scan(bytes(chunk), 0)
+            if player.keyframes:
+                # Bytes the player had to throw away before the keyframe.
+                waits.append((time.monotonic() - started, received + player.keyframe[1]))
+                return
+            received += len(chunk)
+
+    # Warm up for one GOP so there is a keyframe to join at, then let the
+    # viewers arrive over the next few GOPs.
+    span = args.gop * 4
+    viewers = [asyncio.create_task(viewer(args.gop + random.random() * span)) for _ in range(args.joiners)]
+    written, deadline = 0, time.monotonic() + args.gop + span + args.gop * 2
+    next_write = time.monotonic()
+    while time.monotonic() < deadline and not all(v.done() for v in viewers):
+        start = written % len(gop)
+        chunk = (gop[start:] + gop)[:chunk_bytes]
+        buffer.write(chunk)
+        written += len(chunk)
+        next_write += interval
+        await asyncio.sleep(max(0, next_write - time.monotonic()))
+    buffer.close()
+    await asyncio.gather(*viewers)
+    return waits
+
+def join(args):
+    random.seed(1)
+    for mode in ("live", "burst", "keyframe"):
+        waits = asyncio.run(_join(args, mode))
+        ms = sorted(w * 1000 for w, _ in waits)
+        print(
+            f"{mode:>8}: {len(ms)}/{args.joiners} decodable, wait for PAT+PMT+keyframe "
+            f"p50 {statistics.median(ms):6.0f} ms, p95 {ms[max(0, int(len(ms) * 0.95) - 1)]:6.0f} ms, "
+            f"max {ms[-1]:6.0f} ms; {statistics.mean(j for _, j in waits) / 1024:5.0f} KiB before it"
+        )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    p = commands.add_parser("fanout", help="fan-out throughput and memory")
+    p.add_argument("--mb", type=int, default=256, help="data pushed through the channel (MiB)")
+    p.add_argument("--subscribers", type=int, nargs="+", default=[1, 10, 50])
+    p.set_defaults(func=fanout)
+    p = commands.add_parser("read", help="pipe read cost")
+    p.add_argument("--mb", type=int, default=512, help="data read from the child process (MiB)")
+    p.set_defaults(func=read)
+    p = commands.add_parser("load", help="concurrent viewers on one worker")
+    p.add_argument("--clients", type=int, default=250)
+    p.add_argument("--seconds", type=float, default=10)
+    p.add_argument("--kbps", type=int, default=4000, help="source bitrate (kbit/s)")
+    p.add_argument("--port", type=int, default=18100)
+    p.set_defaults(func=load)
+    p = commands.add_parser("stress", help="concurrent tune/untune on the same channels")
+    p.add_argument("--channels", type=int, default=4)
+    p.add_argument("--viewers", type=int, default=40, help="viewers per channel")
+    p.add_argument("--seconds", type=float, default=10)
+    p.add_argument("--kbps", type=int, default=4000, help="source bitrate (kbit/s)")
+    p.add_argument("--linger", type=float, default=0.05, help="STREAM_LINGER_SECONDS for the run")
+    p.add_argument("--tuners", type=int, default=0, help="TUNER_COUNT for the run (0 = no limit)")
+    p.add_argument("--policy", default="idlest", help="TUNER_PREEMPT_POLICY for the run")
+    p.set_defaults(func=stress)
+    p = commands.add_parser("retune", help="re-tune latency with and without lingering")
+    p.add_argument("--tunes", type=int, default=20)
+    p.add_argument("--gap", type=float, default=0.2, help="seconds between leaving and tuning back in")
+    p.add_argument("--watch", type=float, default=0.5, help="seconds watched per tune")
+    p.add_argument("--startup-ms", type=int, default=1500, help="source startup delay")
+    p.add_argument("--kbps", type=int, default=4000, help="source bitrate (kbit/s)")
+    p.add_argument("--linger", type=float, default=5)
+    p.set_defaults(func=retune)
+    p = commands.add_parser("tuners", help="admission control and preemption")
+    p.set_defaults(func=tuners)
+    p = commands.add_parser("join", help="wait for a decodable start when joining a channel")
+    p.add_argument("--joiners", type=int, default=200)
+    p.add_argument("--gop", type=float, default=2, help="seconds between keyframes")
+    p.add_argument("--kbps", type=int, default=4000, help="stream bitrate (kbit/s)")
+    p.add_argument("--no-rai", action="store_true", help="no random_access_indicator on keyframes")
+    p.set_defaults(func=join)
+    p = commands.add_parser("serve")
+    p.add_argument("--port", type=int, required=True)
+    p.add_argument("--kbps", type=int, required=True)
+    p.set_defaults(func=serve)
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()